@@ -0,0 +1,77 @@
+"""
+Замеры скорости извлечения на синтетических чертежах (fake_autocad, без AutoCAD).
+✅ get_all_entities_detailed и full_cache_update для нескольких размеров чертежа
+✅ Задержка и доля отказов на вызов свойства — имитация COM round trip
+✅ Результат в объектах в секунду
+
+Пример:
+    python benchmarks/bench_extraction.py --sizes 1000 5000 --latency 0.00002 --workers 1 4
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.cad.autocad_client import AutoCADClient
+from src.cad.drawing_cache import DrawingCache
+from src.cad.fake_autocad import build_synthetic_drawing
+
+
+def bench_detailed(count: int, latency: float, failure_rate: float, workers: int) -> float:
+    """Секунды на get_all_entities_detailed."""
+    cad = AutoCADClient()
+    cad.attach(build_synthetic_drawing(count, latency=latency, failure_rate=failure_rate))
+    start = time.perf_counter()
+    cad.get_all_entities_detailed(workers=workers)
+    return time.perf_counter() - start
+
+
+def bench_full_cache(count: int, latency: float, failure_rate: float, workers: int) -> float:
+    """Секунды на full_cache_update (запись кэша во временный каталог)."""
+    cad = AutoCADClient()
+    cad.attach(build_synthetic_drawing(count, latency=latency, failure_rate=failure_rate))
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            cache = DrawingCache(cad, extraction_workers=workers, profile=False)
+            start = time.perf_counter()
+            cache.full_cache_update(resume=False)
+            return time.perf_counter() - start
+        finally:
+            os.chdir(cwd)
+
+
+BENCHMARKS = {
+    "get_all_entities_detailed": bench_detailed,
+    "full_cache_update": bench_full_cache,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Entity extraction benchmarks on the fake AutoCAD model")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000, 20000])
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds per COM call")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Share of failing COM calls")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1])
+    parser.add_argument("--only", choices=sorted(BENCHMARKS), help="Run a single benchmark")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    print(f"latency={args.latency}s failure_rate={args.failure_rate}")
+    print(f"{'benchmark':<28} {'entities':>9} {'workers':>8} {'seconds':>9} {'entities/s':>12}")
+    for name, bench in BENCHMARKS.items():
+        if args.only and name != args.only:
+            continue
+        for count in args.sizes:
+            for workers in args.workers:
+                seconds = bench(count, args.latency, args.failure_rate, workers)
+                print(f"{name:<28} {count:>9} {workers:>8} {seconds:>9.3f} {count / seconds:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
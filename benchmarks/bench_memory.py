@@ -0,0 +1,68 @@
+"""
+Замер памяти резидентного EntityCache (fake_autocad, без AutoCAD).
+✅ Записи синтетического чертежа размножаются до нужного числа объектов с уникальными handle
+✅ Каждая запись декодируется отдельно, как при чтении JSON-кэша через индекс, и превращается в EntityProperties
+✅ Результат — байты на сущность по tracemalloc (только то, что остаётся в EntityCache)
+
+Пример:
+    python benchmarks/bench_memory.py --sizes 20000 100000
+"""
+import argparse
+import gc
+import json
+import logging
+import os
+import sys
+import tracemalloc
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.cad.autocad_client import AutoCADClient
+from src.cad.dataclasses import EntityCache, EntityProperties
+from src.cad.fake_autocad import build_synthetic_drawing
+
+# Объектов в исходном синтетическом чертеже (дальше записи повторяются)
+TEMPLATE_SIZE = 2000
+
+
+def cache_lines(count: int) -> List[bytes]:
+    """Строки JSON-кэша для count сущностей."""
+    cad = AutoCADClient()
+    cad.attach(build_synthetic_drawing(TEMPLATE_SIZE, seed=1))
+    template = [entity.to_dict() for entity in cad.get_all_entities_detailed()]
+    lines = []
+    for i in range(count):
+        record = dict(template[i % len(template)], handle=format(i + 0x100, "X"))
+        lines.append(json.dumps(record, ensure_ascii=False, default=str).encode('utf-8'))
+    return lines
+
+
+def resident_bytes(lines: List[bytes]) -> int:
+    """Прирост памяти после загрузки строк в EntityCache."""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    cache = EntityCache()
+    cache.add_entities(EntityProperties.from_dict(json.loads(line)) for line in lines)
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del cache
+    return used
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resident EntityCache memory per entity")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[20000, 100000])
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    print(f"{'entities':>9} {'MB':>9} {'bytes/entity':>13}")
+    for count in args.sizes:
+        used = resident_bytes(cache_lines(count))
+        print(f"{count:>9} {used / 2 ** 20:>9.1f} {used / count:>13.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Замеры пространственных запросов EntityCache: сетка и массивы bounding box против полного перебора.
+✅ Чертёж постоянной плотности: с ростом числа объектов растёт площадь, а не заполнение окна
+✅ find_entities_in_bbox, find_nearby_entities и find_intersecting_entities — по сетке
+✅ Окно на 20% чертежа, общий габарит и статистика — по массивам (векторно, если установлен NumPy)
+✅ Результат — миллисекунды на запрос; время построения индексов выводится отдельно
+
+Пример:
+    python benchmarks/bench_spatial.py --sizes 10000 100000 1000000 --queries 200
+"""
+import argparse
+import logging
+import os
+import random
+import sys
+import time
+from typing import Callable, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.cad.bbox_store import vectorized
+from src.cad.dataclasses import BoundingBox, EntityCache, EntityProperties
+from src.cad.geometry_analysis import GeometryAnalyzer
+
+# Среднее расстояние между соседними объектами
+SPACING = 10.0
+
+
+def build_entities(count: int, seed: int = 0) -> List[EntityProperties]:
+    """Отрезки и круги размером до ~SPACING, равномерно по квадрату площадью count·SPACING²."""
+    rng = random.Random(seed)
+    side = (count ** 0.5) * SPACING
+    entities = []
+    for i in range(count):
+        x, y = rng.uniform(0, side), rng.uniform(0, side)
+        w, h = rng.uniform(0, SPACING), rng.uniform(0, SPACING)
+        entities.append(EntityProperties(
+            handle=format(i + 0x100, "X"), object_name="AcDbLine" if i % 2 else "AcDbCircle",
+            layer="0", color=256, linetype="ByLayer", length=w + h,
+            bounding_box=BoundingBox(x, y, 0.0, x + w, y + h, 0.0)
+        ))
+    return entities
+
+
+def _per_query(run: Callable[[int], object], queries: int) -> float:
+    """Миллисекунды на запрос."""
+    start = time.perf_counter()
+    for i in range(queries):
+        run(i)
+    return (time.perf_counter() - start) * 1000 / queries
+
+
+def bench(count: int, queries: int, linear_limit: int):
+    entities = build_entities(count)
+    cache = EntityCache()
+    cache.add_entities(entities)
+    side = (count ** 0.5) * SPACING
+    rng = random.Random(1)
+    points = [(rng.uniform(0, side), rng.uniform(0, side), 0.0) for _ in range(queries)]
+    windows = [BoundingBox(x, y, 0.0, x + 5 * SPACING, y + 5 * SPACING, 0.0) for x, y, _ in points]
+    targets = [entities[rng.randrange(count)] for _ in range(queries)]
+    wide = [BoundingBox(x * 0.55, y * 0.55, 0.0, x * 0.55 + side * 0.45, y * 0.55 + side * 0.45, 0.0)
+            for x, y, _ in points]
+
+    start = time.perf_counter()
+    cache.find_entities_in_bbox(windows[0])
+    cache.combined_bbox()
+    build_ms = (time.perf_counter() - start) * 1000
+
+    rows = [
+        ("in_bbox", lambda i: cache.find_entities_in_bbox(windows[i]),
+         lambda i: [e for e in entities if GeometryAnalyzer._bbox_intersects(e.bounding_box, windows[i])]),
+        ("nearby", lambda i: GeometryAnalyzer.find_nearby_entities(cache, points[i], SPACING),
+         lambda i: GeometryAnalyzer.find_nearby_entities(entities, points[i], SPACING)),
+        ("intersecting", lambda i: GeometryAnalyzer.find_intersecting_entities(cache, targets[i]),
+         lambda i: GeometryAnalyzer.find_intersecting_entities(entities, targets[i])),
+        ("wide_bbox", lambda i: cache.find_entities_in_bbox(wide[i]),
+         lambda i: [e for e in entities if GeometryAnalyzer._bbox_intersects(e.bounding_box, wide[i])]),
+        ("extent", lambda i: GeometryAnalyzer.calculate_combined_bbox(cache),
+         lambda i: GeometryAnalyzer.calculate_combined_bbox(entities)),
+        ("statistics", lambda i: GeometryAnalyzer.calculate_statistics(cache),
+         lambda i: GeometryAnalyzer.calculate_statistics(entities)),
+    ]
+    for name, indexed, linear in rows:
+        # Массовые запросы проходят все строки — их число ограничено тем же бюджетом
+        bulk = name in ("wide_bbox", "extent", "statistics")
+        indexed_ms = _per_query(indexed, min(queries, max(1, linear_limit // count)) if bulk else queries)
+        linear_ms = _per_query(linear, min(queries, max(1, linear_limit // count))) if linear_limit else float("nan")
+        print(f"{name:<14} {count:>9} {build_ms:>10.1f} {indexed_ms:>11.4f} {linear_ms:>11.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Spatial query benchmarks on EntityCache")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--queries", type=int, default=200, help="Queries per measurement")
+    parser.add_argument("--linear-limit", type=int, default=2000000,
+                        help="Entity visits budget for full-scan baseline per size (0 — skip baseline)")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    print(f"numpy={'yes' if vectorized() else 'no'}")
+    print(f"{'query':<14} {'entities':>9} {'build ms':>10} {'indexed ms':>11} {'linear ms':>11}")
+    for count in args.sizes:
+        bench(count, args.queries, args.linear_limit)
+
+
+if __name__ == "__main__":
+    main()
@@ -15,6 +15,7 @@ from typing import Optional
 # Импорт модулей
 from src.cad.autocad_client import AutoCADClient
 from src.cad.drawing_cache import DrawingCache
+from src.cad.cache_refresh import BackgroundCacheRefresher, background_refresh_enabled
 from src.llm.llm_manager import LLMManager
 from src.cad.dataclasses import EntityCache, BoundingBox
 
@@ -54,6 +55,7 @@ def main():
     # Проверка COM библиотек
     cad: Optional[AutoCADClient] = None
     drawing_cache: Optional[DrawingCache] = None
+    refresher: Optional[BackgroundCacheRefresher] = None
 
     try:
         import win32com.client
@@ -79,28 +81,35 @@ def main():
     # Инициализация кэша и LLM
     if cad:
         drawing_cache = DrawingCache(cad)
+        # Детали скелетных записей догружаются из AutoCAD при первом запросе
+        LLMManager.detail_loader = drawing_cache.ensure_details
+        # Кэш активного чертежа в репозитории (CACHE_DIR)
+        drawing_cache.select_drawing()
+        # Пересборка кэша в отдельном потоке, запросы в это время идут к текущему снимку
+        if background_refresh_enabled():
+            refresher = BackgroundCacheRefresher(cad, drawing_cache.extraction_workers)
 
     llm = LLMManager()
 
-    # Загрузка кэша
+    # Загрузка кэша; устаревший относительно DWG обновляется, отсутствующий создаётся
+    if cad and drawing_cache:
+        ensure_com_initialized()
+        if refresher and DrawingCache.load_cache() is not None:
+            refresher.check()
+        else:
+            drawing_cache.ensure_fresh()
+    if refresher:
+        refresher.start()
     cache_data = DrawingCache.load_cache()
 
     if cache_data is None:
-        logger.info("🆕 Cache not found or outdated")
-        if cad and drawing_cache:
-            logger.info("Creating full drawing cache...")
-            ensure_com_initialized()
-            drawing_cache.full_cache_update()
-            cache_data = DrawingCache.load_cache()
-        else:
-            logger.error("❌ No AutoCAD connection and no cache. Exiting.")
-            return
-    else:
-        meta = cache_data.get('metadata', {})
-        logger.info(
-            f"📁 Cache loaded: {meta.get('drawing_name', 'Unknown')}, "
-            f"updated {meta.get('last_updated', 'Unknown')}"
-        )
+        logger.error("❌ No AutoCAD connection and no cache. Exiting.")
+        return
+    meta = cache_data.get('metadata', {})
+    logger.info(
+        f"📁 Cache loaded: {meta.get('drawing_name', 'Unknown')}, "
+        f"updated {meta.get('last_updated', 'Unknown')}, status: {DrawingCache.last_status}"
+    )
 
     # Информация о конфигурации
     logger.info("\n" + "=" * 50)
@@ -109,7 +118,8 @@ def main():
     logger.info(f"  API URL: {llm.api_url or 'Ollama Default'}")
     logger.info("  Mode: Cache-based (AutoCAD not required for queries)")
     logger.info("=" * 50)
-    logger.info("Commands: 'full_cache' - update cache, 'exit' - quit")
+    logger.info("Commands: 'full_cache' - update cache, 'skeleton_cache' - quick cache, "
+                "'delta_cache' - update changes, 'layer_cache <layer>' - update layer, 'exit' - quit")
     logger.info("=" * 50)
 
     # Главный цикл
@@ -123,7 +133,10 @@ def main():
 
             # Обновление кэша
             if user_input.lower() in ['full_cache', 'обнови всё', 'update cache']:
-                if cad and drawing_cache:
+                if refresher:
+                    refresher.request()
+                    print("🔁 Полное обновление кэша запущено в фоне, запросы идут к текущему снимку")
+                elif cad and drawing_cache:
                     logger.info("🔄 Starting full cache update...")
                     ensure_com_initialized()
                     drawing_cache.full_cache_update()
@@ -133,6 +146,49 @@ def main():
                     logger.warning("❌ No AutoCAD connection for cache update")
                 continue
 
+            # Быстрый скелетный кэш (детали — по запросу)
+            if user_input.lower() in ['skeleton_cache', 'быстрый кэш', 'quick cache']:
+                if cad and drawing_cache:
+                    logger.info("🔄 Starting skeleton cache update...")
+                    ensure_com_initialized()
+                    drawing_cache.full_cache_update(skeleton=True)
+                    cache_data = DrawingCache.load_cache()
+                    logger.info("✅ Skeleton cache ready, details will be loaded on demand")
+                else:
+                    logger.warning("❌ No AutoCAD connection for cache update")
+                continue
+
+            # Инкрементальное обновление кэша
+            if user_input.lower() in ['delta_cache', 'обнови изменения', 'update delta']:
+                if cad and drawing_cache:
+                    logger.info("🔄 Starting delta cache update...")
+                    ensure_com_initialized()
+                    stats = drawing_cache.delta_cache_update()
+                    cache_data = DrawingCache.load_cache()
+                    if stats and stats.get("full_rescan"):
+                        print(f"✅ Кэша не было — выполнено полное сканирование (всего {stats['total']})")
+                    elif stats:
+                        print(f"✅ Изменения: +{stats['added']} ~{stats['modified']} -{stats['erased']} "
+                              f"(всего {stats['total']})")
+                else:
+                    logger.warning("❌ No AutoCAD connection for cache update")
+                continue
+
+            # Частичное обновление кэша по слою (отбор на стороне AutoCAD)
+            command, _, argument = user_input.partition(" ")
+            if command.lower() in ['layer_cache', 'обнови_слой'] and argument.strip():
+                if cad and drawing_cache:
+                    logger.info(f"🔄 Starting partial cache update for layer '{argument.strip()}'...")
+                    ensure_com_initialized()
+                    stats = drawing_cache.partial_cache_update(layer=argument.strip())
+                    cache_data = DrawingCache.load_cache()
+                    if stats:
+                        print(f"✅ Слой обновлён: ~{stats['refreshed']} +{stats['added']} -{stats['erased']} "
+                              f"(всего {stats['total']})")
+                else:
+                    logger.warning("❌ No AutoCAD connection for cache update")
+                continue
+
             # Обработка запроса
             if not user_input:
                 continue
@@ -140,6 +196,15 @@ def main():
             logger.info(f"Processing query: {user_input[:100]}...")
             print("Обработка запроса (по данным кэша)...")
 
+            # Пользователь мог переключить чертёж в AutoCAD — запрос идёт к кэшу активного;
+            # если DWG изменился после извлечения, кэш обновляется (в фоне — при CACHE_BACKGROUND_REFRESH=1)
+            if cad and drawing_cache:
+                drawing_cache.select_drawing()
+                if refresher:
+                    refresher.check()
+                else:
+                    drawing_cache.ensure_fresh()
+
             tool_calls, ai_content = llm.process_prompt(user_input)
 
             if not tool_calls:
@@ -160,7 +225,9 @@ def main():
                 try:
                     # ===== ЗАПРОСЫ К КЭШУ =====
                     if func_name == 'get_drawing_info':
-                        result = LLMManager.get_drawing_info(**args)
+                        # Фоновое обновление не подменяет снимок, пока запрос его читает
+                        with DrawingCache.reading():
+                            result = LLMManager.get_drawing_info(**args)
                         print("\n📊 Результат запроса к кэшу:")
                         # Красивый вывод JSON
                         try:
@@ -303,6 +370,8 @@ def main():
             logger.error(f"Error in main loop: {e}", exc_info=True)
             print(f"Ошибка: {e}")
 
+    if refresher:
+        refresher.stop(timeout=5)
     logger.info("AutoCAD AI Assistant stopped")
     print("\n👋 До свидания!")
 
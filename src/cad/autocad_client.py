@@ -1,14 +1,24 @@
-import win32com.client
-import pythoncom
 import time
 import logging
+import threading
 from array import array
-from typing import Optional, Dict, List, Any, Tuple
+from typing import Optional, Dict, List, Any, Tuple, Iterator, Callable
 from .dataclasses import (
     EntityProperties, BoundingBox, Coordinates,
     LayerInfo, BlockReference, TextEntity,
-    DimensionEntity, DrawingMetadata
+    DimensionEntity, DrawingMetadata, BlockDefinition, compact_properties
 )
+from .extraction_plan import ExtractionPlan, ExtractionPlanRegistry, EntityReader, to_point
+from .geometry_analysis import GeometryAnalyzer
+from .com_profiler import ComCallProfiler
+
+try:
+    import win32com.client
+    import pythoncom
+except ImportError:
+    # Без pywin32 клиент работает только с in-process объектной моделью (fake_autocad)
+    win32com = None
+    pythoncom = None
 
 # Настройка логирования
 logging.basicConfig(
@@ -21,6 +31,50 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# ObjectName полилиний: при отсутствии Length длина считается по вершинам
+POLYLINE_OBJECT_NAMES = frozenset({"AcDbPolyline", "AcDb2dPolyline", "AcDb3dPolyline"})
+
+# Режимы SelectionSet.Select (AcSelect)
+AC_SELECTION_SET_WINDOW = 0
+AC_SELECTION_SET_CROSSING = 1
+AC_SELECTION_SET_ALL = 5
+
+# ObjectName -> имя типа DXF (группа 0 фильтра выбора)
+DXF_ENTITY_NAMES = {
+    "AcDbLine": "LINE",
+    "AcDbCircle": "CIRCLE",
+    "AcDbArc": "ARC",
+    "AcDbEllipse": "ELLIPSE",
+    "AcDbPolyline": "LWPOLYLINE",
+    "AcDb2dPolyline": "POLYLINE",
+    "AcDb3dPolyline": "POLYLINE",
+    "AcDbSpline": "SPLINE",
+    "AcDbPoint": "POINT",
+    "AcDbText": "TEXT",
+    "AcDbMText": "MTEXT",
+    "AcDbBlockReference": "INSERT",
+    "AcDbHatch": "HATCH",
+    "AcDbMLeader": "MULTILEADER",
+    "AcDbLeader": "LEADER",
+    "AcDbSolid": "SOLID",
+    "AcDb3dSolid": "3DSOLID",
+    "AcDbRegion": "REGION",
+}
+
+
+# Приложения XData, если таблицу RegisteredApplications прочитать не удалось
+DEFAULT_XDATA_APPS = ("ACAD", "AUTODESK", "ROBOT", "REVIT")
+
+
+def dxf_entity_name(object_name: str) -> str:
+    """Имя типа DXF для ObjectName (все виды размеров — DIMENSION)."""
+    if object_name in DXF_ENTITY_NAMES:
+        return DXF_ENTITY_NAMES[object_name]
+    if "Dimension" in object_name:
+        return "DIMENSION"
+    # Уже имя DXF (LINE, CIRCLE...) или неизвестный тип
+    return object_name.upper()
+
 
 class AutoCADClient:
     """
@@ -35,9 +89,18 @@ class AutoCADClient:
         self.model_space = None
         self.paper_space = None
         self._connected = False
+        self._plans = ExtractionPlanRegistry()
+        # Зарегистрированные приложения XData текущего чертежа (None — ещё не сканировались)
+        self._xdata_apps: Optional[Tuple[str, ...]] = None
+        # Профайлер COM-вызовов извлечения (None — выключен, объекты не оборачиваются)
+        self.profiler: Optional[ComCallProfiler] = None
 
     def connect(self) -> bool:
         """Подключение к запущенному экземпляру AutoCAD."""
+        if win32com is None:
+            logger.error("AutoCAD COM libraries (pywin32) are not available.")
+            return False
+
         prog_ids = [
             "AutoCAD.Application", "AutoCAD.Application.25", "AutoCAD.Application.24.1",
             "AutoCAD.Application.24", "AutoCAD.Application.23.1", "AutoCAD.Application.23",
@@ -49,11 +112,7 @@ class AutoCADClient:
         for prog_id in prog_ids:
             try:
                 logger.info(f"Trying to connect via '{prog_id}'...")
-                self.app = win32com.client.GetActiveObject(prog_id)
-                self.doc = self.app.ActiveDocument
-                self.model_space = self.doc.ModelSpace
-                self.paper_space = self.doc.PaperSpace
-                self._connected = True
+                self.attach(win32com.client.GetActiveObject(prog_id))
                 logger.info(f"Successfully connected via '{prog_id}'.")
                 return True
             except Exception as e:
@@ -65,13 +124,45 @@ class AutoCADClient:
         logger.error("Tip: Make sure AutoCAD is open and a drawing is active.")
         return False
 
+    def attach(self, app):
+        """
+        Привязка клиента к объекту Application.
+        Используется connect() и для in-process объектных моделей (fake_autocad).
+        """
+        self.app = app
+        self.doc = app.ActiveDocument
+        self.model_space = self.doc.ModelSpace
+        self.paper_space = self.doc.PaperSpace
+        self._plans.clear()
+        self._xdata_apps = None
+        self._connected = True
+
+    def refresh_active_document(self) -> bool:
+        """
+        Переключение на активный документ AutoCAD, если пользователь сменил чертёж.
+        Возвращает True, если документ сменился.
+        """
+        if not self.app or not self.doc:
+            return False
+        try:
+            if str(self.app.ActiveDocument.FullName) == str(self.doc.FullName):
+                return False
+            self.attach(self.app)
+            logger.info(f"Active document changed: {self.doc.Name}")
+            return True
+        except Exception as e:
+            logger.warning(f"Could not check the active document: {e}")
+            return False
+
     @property
     def is_connected(self) -> bool:
         return self._connected and self.doc is not None
 
-    def _to_variant(self, point: Tuple[float, ...]) -> win32com.client.VARIANT:
+    def _to_variant(self, point: Tuple[float, ...]) -> "win32com.client.VARIANT":
         """Конвертация точки в COM-совместимый массив double."""
         coords = list(point) if len(point) == 3 else list(point) + [0.0]
+        if win32com is None:
+            return tuple(map(float, coords))
         return win32com.client.VARIANT(
             pythoncom.VT_ARRAY | pythoncom.VT_R8,
             tuple(map(float, coords))
@@ -261,33 +352,43 @@ class AutoCADClient:
 
     # ========== ИЗВЛЕЧЕНИЕ ДАННЫХ (МАКСИМАЛЬНОЕ) ==========
 
+    def refresh_xdata_apps(self) -> Tuple[str, ...]:
+        """
+        Однократный скан doc.RegisteredApplications перед извлечением.
+        XData запрашивается только для найденных приложений; пустой список — XData не читается вовсе.
+        """
+        try:
+            self._xdata_apps = tuple(str(app.Name) for app in self.doc.RegisteredApplications)
+            logger.info(f"XData applications registered: {len(self._xdata_apps)}")
+        except Exception as e:
+            logger.warning(f"Cannot read RegisteredApplications, using default XData apps: {e}")
+            self._xdata_apps = DEFAULT_XDATA_APPS
+        return self._xdata_apps
+
     def get_all_entities_detailed(self, include_xdata: bool = True,
-                                  include_dict: bool = True) -> List[EntityProperties]:
+                                  include_dict: bool = True,
+                                  workers: int = 1) -> List[EntityProperties]:
         """
         Возвращает ПОЛНУЮ информацию обо всех объектах ModelSpace.
         ✅ Включает: общие свойства, геометрию, XData, Extension Dictionary
         ✅ Каждая сущность с полным bounding box
+        ✅ workers > 1 — параллельное извлечение по диапазонам индексов
         """
-        entities = []
-        skipped = 0
-
         if not self.model_space:
             logger.error("ModelSpace not available")
-            return entities
-
-        logger.info("Starting full entity extraction...")
+            return []
 
-        for ent in self.model_space:
-            try:
-                entity_data = self._extract_entity_full(ent, include_xdata, include_dict)
-                if entity_data:
-                    entities.append(entity_data)
-                else:
-                    skipped += 1
-            except Exception as e:
-                logger.warning(f"Error extracting entity: {e}")
-                skipped += 1
-                continue
+        if workers > 1:
+            total = int(self.model_space.Count)
+            logger.info(f"Starting parallel entity extraction: {total} entities, {workers} workers...")
+            entities, skipped = self._extract_parallel(
+                self._full_extractor(include_xdata, include_dict), workers, 0, total
+            )
+        else:
+            logger.info("Starting full entity extraction...")
+            entities, skipped = self._extract_sequence(
+                self.model_space, self._full_extractor(include_xdata, include_dict)
+            )
 
         if skipped > 0:
             logger.warning(f"Skipped {skipped} entities during extraction.")
@@ -295,92 +396,342 @@ class AutoCADClient:
         logger.info(f"Extracted {len(entities)} entities successfully.")
         return entities
 
-    def _extract_entity_full(self, ent, include_xdata: bool,
-                             include_dict: bool) -> Optional[EntityProperties]:
-        """Полное извлечение данных одного объекта с типизацией."""
-        try:
-            # Базовые данные
-            data = EntityProperties(
-                handle=str(ent.Handle) if hasattr(ent, 'Handle') else "UNKNOWN",
-                object_name=str(ent.ObjectName) if hasattr(ent, 'ObjectName') else "Unknown",
-                layer=str(ent.Layer) if hasattr(ent, 'Layer') else "0",
-                color=int(ent.Color) if hasattr(ent, 'Color') else 7,
-                linetype=str(ent.Linetype) if hasattr(ent, 'Linetype') else "ByLayer"
-            )
+    def build_selection_filter(self, layer: Optional[str] = None,
+                               entity_type: Optional[str] = None) -> Tuple[List[int], List[Any]]:
+        """
+        Фильтр выбора по DXF-группам: 0 — тип объекта, 8 — слой, 67 — пространство (0 = Model).
+        Слой и тип допускают шаблоны AutoCAD и списки через запятую ("A,B*").
+        Тип задаётся как ObjectName (AcDbLine) или имя DXF (LINE).
+        """
+        codes: List[int] = [67]
+        values: List[Any] = [0]
+        if entity_type:
+            codes.append(0)
+            values.append(",".join(dxf_entity_name(t.strip()) for t in entity_type.split(",")))
+        if layer:
+            codes.append(8)
+            values.append(layer)
+        return codes, values
+
+    def select_entities(self, layer: Optional[str] = None, entity_type: Optional[str] = None,
+                        window: Optional[Tuple[Tuple[float, ...], Tuple[float, ...]]] = None,
+                        crossing: bool = False,
+                        include_xdata: bool = True,
+                        include_dict: bool = True) -> Optional[List[EntityProperties]]:
+        """
+        Извлечение объектов ModelSpace, отобранных на стороне AutoCAD через SelectionSets.
+        ✅ Фильтрация по слою/типу выполняет AutoCAD, через COM передаются только совпавшие объекты
+        ✅ window=(p1, p2) — выбор рамкой (crossing=True — секущей рамкой)
+        Выбор рамкой учитывает только объекты, видимые в текущем виде чертежа.
+        Возвращает None при ошибке выбора.
+        """
+        if not self.doc:
+            logger.error("Document not available")
+            return None
 
-            # Дополнительные общие свойства
-            try:
-                if hasattr(ent, 'Lineweight'):
-                    data.lineweight = int(ent.Lineweight)
-            except Exception:
-                pass
+        codes, values = self.build_selection_filter(layer, entity_type)
+        if window is not None:
+            mode = AC_SELECTION_SET_CROSSING if crossing else AC_SELECTION_SET_WINDOW
+            point1, point2 = (self._to_variant(tuple(p)) for p in window)
+        else:
+            mode = AC_SELECTION_SET_ALL
+            point1 = point2 = pythoncom.Empty if pythoncom is not None else None
 
+        name = f"MCP_SELECT_{threading.get_ident()}"
+        selection = None
+        try:
             try:
-                if hasattr(ent, 'EntityTransparency'):
-                    data.transparency = int(ent.EntityTransparency)
+                # Набор с таким именем мог остаться от прерванного вызова
+                self.doc.SelectionSets.Item(name).Delete()
             except Exception:
                 pass
+            selection = self.doc.SelectionSets.Add(name)
+            selection.Select(mode, point1, point2, *self._filter_variants(codes, values))
+            logger.info(f"Selection filter {dict(zip(codes, values))}: {selection.Count} entities matched.")
 
-            try:
-                if hasattr(ent, 'Visible'):
-                    data.visible = bool(ent.Visible)
-            except Exception:
-                pass
+            entities, skipped = self._extract_sequence(
+                selection, self._full_extractor(include_xdata, include_dict)
+            )
+            if skipped > 0:
+                logger.warning(f"Skipped {skipped} selected entities during extraction.")
+            return entities
+        except Exception as e:
+            logger.error(f"Error selecting entities: {e}", exc_info=True)
+            return None
+        finally:
+            if selection is not None:
+                try:
+                    selection.Delete()
+                except Exception as e:
+                    logger.debug(f"Selection set cleanup failed: {e}")
+
+    @staticmethod
+    def _filter_variants(codes: List[int], values: List[Any]):
+        """Массивы FilterType (VT_I2) и FilterData (VT_VARIANT) для SelectionSet.Select."""
+        if win32com is None:
+            return tuple(codes), tuple(values)
+        return (
+            win32com.client.VARIANT(pythoncom.VT_ARRAY | pythoncom.VT_I2, codes),
+            win32com.client.VARIANT(pythoncom.VT_ARRAY | pythoncom.VT_VARIANT, values)
+        )
 
-            # ✅ Bounding box (ОБЯЗАТЕЛЬНО ДЛЯ ВСЕХ)
+    def get_block_definitions(self, known: Optional[Dict[str, BlockDefinition]] = None,
+                              include_xdata: bool = False,
+                              include_dict: bool = False) -> Dict[str, BlockDefinition]:
+        """
+        Извлечение определений блоков из doc.Blocks — по одному разу на определение.
+        ✅ Определения из known с тем же числом объектов (Block.Count) переиспользуются без извлечения
+        ✅ Листы (*Model_Space, *Paper_Space) и служебные анонимные блоки (*D, *T, *X...) пропускаются
+        ✅ Внешние ссылки (XRef) записываются без геометрии
+        Анонимные *U-блоки сохраняются: на них ссылаются вставки динамических блоков.
+        """
+        definitions: Dict[str, BlockDefinition] = {}
+        if not self.doc:
+            logger.error("Document not available")
+            return definitions
+
+        known = known or {}
+        extractor = self._full_extractor(include_xdata, include_dict)
+        extracted = 0
+
+        for block in self.doc.Blocks:
             try:
-                data.bounding_box = self._get_bounding_box(ent)
+                name = str(block.Name)
+                if bool(block.IsLayout) or (name.startswith("*") and not name.upper().startswith("*U")):
+                    continue
+                count = int(block.Count)
+                cached = known.get(name)
+                if cached is not None and cached.count == count:
+                    definitions[name] = cached
+                    continue
+
+                definition = BlockDefinition(name=name, origin=to_point(block.Origin), count=count)
+                if bool(block.IsXRef):
+                    definition.is_xref = True
+                else:
+                    definition.entities, skipped = self._extract_sequence(block, extractor)
+                    if skipped > 0:
+                        logger.warning(f"Skipped {skipped} entities in block definition '{name}'.")
+                    definition.bounding_box = GeometryAnalyzer.calculate_combined_bbox(definition.entities)
+                definitions[name] = definition
+                extracted += 1
             except Exception as e:
-                logger.debug(f"Could not get bounding box: {e}")
+                logger.warning(f"Error extracting block definition: {e}")
+                continue
 
-            # Числовые свойства
-            try:
-                if hasattr(ent, 'Area'):
-                    data.area = float(ent.Area)
-            except Exception:
-                pass
+        logger.info(
+            f"Block definitions: {len(definitions)} total, {extracted} extracted, "
+            f"{len(definitions) - extracted} reused."
+        )
+        return definitions
 
-            try:
-                if hasattr(ent, 'Length'):
-                    data.length = float(ent.Length)
-            except Exception:
-                pass
+    def get_entity_count(self) -> int:
+        """Количество объектов в ModelSpace."""
+        if not self.model_space:
+            return 0
+        return int(self.model_space.Count)
+
+    def iter_entity_chunks(self, chunk_size: int, start: int = 0,
+                           include_xdata: bool = True, include_dict: bool = True,
+                           workers: int = 1,
+                           skeleton: bool = False) -> Iterator[Tuple[int, List[EntityProperties]]]:
+        """
+        Потоковое извлечение ModelSpace порциями по chunk_size объектов, начиная с индекса start.
+        Возвращает пары (индекс следующего необработанного объекта, сущности порции),
+        так что в памяти одновременно находится не больше одной порции.
+        skeleton=True — только скелетные записи (см. _extract_entity_skeleton).
+        """
+        if not self.model_space:
+            logger.error("ModelSpace not available")
+            return
+
+        extract = self._extract_entity_skeleton if skeleton else self._full_extractor(include_xdata, include_dict)
+        total = int(self.model_space.Count)
+        for chunk_start in range(start, total, chunk_size):
+            chunk_stop = min(chunk_start + chunk_size, total)
+            if workers > 1:
+                entities, skipped = self._extract_parallel(extract, workers, chunk_start, chunk_stop)
+            else:
+                entities, skipped = self._extract_sequence(
+                    self._iter_range(self.model_space, chunk_start, chunk_stop), extract
+                )
+            if skipped > 0:
+                logger.warning(f"Skipped {skipped} entities in [{chunk_start}, {chunk_stop}).")
+            yield chunk_stop, entities
+
+    def _full_extractor(self, include_xdata: bool,
+                        include_dict: bool) -> Callable[[Any], Optional[EntityProperties]]:
+        """Функция полного извлечения для одного прохода (с однократным сканом приложений XData)."""
+        if include_xdata:
+            self.refresh_xdata_apps()
+        return lambda ent: self._extract_entity_full(ent, include_xdata, include_dict)
+
+    @staticmethod
+    def _extract_sequence(items, extract: Callable[[Any], Optional[EntityProperties]]
+                          ) -> Tuple[List[EntityProperties], int]:
+        """Извлечение последовательности COM-объектов. Возвращает (сущности, пропущено)."""
+        entities = []
+        skipped = 0
 
+        for ent in items:
             try:
-                if hasattr(ent, 'Volume'):
-                    data.volume = float(ent.Volume)
-            except Exception:
-                pass
+                entity_data = extract(ent)
+                if entity_data:
+                    entities.append(entity_data)
+                else:
+                    skipped += 1
+            except Exception as e:
+                logger.warning(f"Error extracting entity: {e}")
+                skipped += 1
+                continue
+
+        return entities, skipped
 
-            # Координаты
+    @staticmethod
+    def _iter_range(model_space, start: int, stop: int):
+        """Объекты ModelSpace с индексами [start, stop)."""
+        for index in range(start, stop):
             try:
-                data.coordinates = self._extract_coordinates(ent)
+                yield model_space.Item(index)
             except Exception as e:
-                logger.debug(f"Could not extract coordinates: {e}")
+                logger.warning(f"Error reading ModelSpace item {index}: {e}")
+
+    def _marshal_model_space(self):
+        """
+        Подготовка ModelSpace для передачи в другой поток.
+        COM-прокси маршалится через CoMarshalInterThreadInterfaceInStream,
+        in-process объекты передаются как есть.
+        """
+        oleobj = getattr(self.model_space, '_oleobj_', None)
+        if pythoncom is None or oleobj is None:
+            return self.model_space
+        return pythoncom.CoMarshalInterThreadInterfaceInStream(pythoncom.IID_IDispatch, oleobj)
+
+    def _unmarshal_model_space(self, marshalled):
+        """Получение ModelSpace в потоке-воркере (после CoInitialize)."""
+        if pythoncom is None or marshalled is self.model_space:
+            return marshalled
+        return win32com.client.Dispatch(
+            pythoncom.CoGetInterfaceAndReleaseStream(marshalled, pythoncom.IID_IDispatch)
+        )
+
+    def marshal_application(self):
+        """Подготовка Application для клиента в другом потоке (см. thread_client())."""
+        oleobj = getattr(self.app, '_oleobj_', None)
+        if pythoncom is None or oleobj is None:
+            return self.app
+        return pythoncom.CoMarshalInterThreadInterfaceInStream(pythoncom.IID_IDispatch, oleobj)
+
+    def thread_client(self, marshalled) -> "AutoCADClient":
+        """
+        Отдельный клиент для долгоживущего потока (после CoInitialize) на маршалированном Application.
+        Поток работает со своим прокси и своими планами извлечения.
+        """
+        app = marshalled
+        if pythoncom is not None and marshalled is not self.app:
+            app = win32com.client.Dispatch(
+                pythoncom.CoGetInterfaceAndReleaseStream(marshalled, pythoncom.IID_IDispatch)
+            )
+        client = AutoCADClient()
+        client.attach(app)
+        return client
+
+    def _extract_parallel(self, extract: Callable[[Any], Optional[EntityProperties]], workers: int,
+                          start: int, stop: int) -> Tuple[List[EntityProperties], int]:
+        """
+        Параллельное извлечение: диапазон ModelSpace [start, stop) делится между воркерами,
+        каждый воркер работает в своём COM-апартаменте с маршалированным прокси.
+        Результаты объединяются в исходном порядке ModelSpace. Возвращает (сущности, пропущено).
 
-            # Тип-специфичные свойства
+        AutoCAD — однопоточный out-of-process сервер, поэтому выигрыш ограничен
+        перекрытием задержек COM-вызовов и конвертации на стороне Python.
+        """
+        total = stop - start
+        workers = max(1, min(workers, total))
+        chunk = (total + workers - 1) // workers if total else 0
+        ranges = [(start + i * chunk, start + min((i + 1) * chunk, total)) for i in range(workers)]
+
+        results: List[Optional[Tuple[List[EntityProperties], int]]] = [None] * workers
+        streams = [self._marshal_model_space() for _ in ranges]
+
+        def run(slot: int, range_start: int, range_stop: int, marshalled):
+            if pythoncom is not None:
+                pythoncom.CoInitialize()
             try:
-                data.type_properties = self._extract_type_properties(ent)
+                model_space = self._unmarshal_model_space(marshalled)
+                results[slot] = self._extract_sequence(
+                    self._iter_range(model_space, range_start, range_stop), extract
+                )
             except Exception as e:
-                logger.debug(f"Could not extract type properties: {e}")
+                logger.error(f"Extraction worker {slot} failed on [{range_start}, {range_stop}): {e}",
+                             exc_info=True)
+            finally:
+                if pythoncom is not None:
+                    pythoncom.CoUninitialize()
+
+        threads = [
+            threading.Thread(target=run, args=(slot, range_start, range_stop, stream),
+                             name=f"acad-extract-{slot}", daemon=True)
+            for slot, ((range_start, range_stop), stream) in enumerate(zip(ranges, streams))
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
 
-            # XData
-            if include_xdata:
-                try:
-                    data.xdata = self._extract_xdata(ent)
-                except Exception:
-                    data.xdata = None
+        entities: List[EntityProperties] = []
+        skipped = 0
+        for slot, (range_start, range_stop) in enumerate(ranges):
+            if results[slot] is None:
+                # Воркер не смог получить ModelSpace — диапазон извлекается в текущем потоке
+                logger.warning(f"Re-extracting range [{range_start}, {range_stop}) sequentially.")
+                results[slot] = self._extract_sequence(
+                    self._iter_range(self.model_space, range_start, range_stop), extract
+                )
+            part, part_skipped = results[slot]
+            entities.extend(part)
+            skipped += part_skipped
 
-            # Extension Dictionary
-            if include_dict:
-                try:
-                    if hasattr(ent, 'HasExtensionDictionary') and ent.HasExtensionDictionary:
-                        data.extension_dict = self._extract_extension_dict(ent)
-                except Exception:
-                    data.extension_dict = None
+        return entities, skipped
 
-            return data
+    def _extract_entity_core(self, ent) -> Tuple[EntityProperties, ExtractionPlan, EntityReader]:
+        """Базовые поля и bounding box объекта по плану извлечения его типа."""
+        if self.profiler is not None:
+            ent = self.profiler.wrap(ent)
+        reader = EntityReader(ent)
+        try:
+            obj_name = str(reader.get('ObjectName'))
+        except AttributeError:
+            obj_name = "Unknown"
+        plan = self._plans.get(ent, obj_name)
+
+        data = EntityProperties(
+            handle=str(reader.get('Handle')) if plan.has_handle else "UNKNOWN",
+            object_name=obj_name,
+            layer=str(reader.get('Layer')) if plan.has_layer else "0",
+            color=int(reader.get('Color')) if plan.has_color else 7,
+            linetype=str(reader.get('Linetype')) if plan.has_linetype else "ByLayer"
+        )
+
+        # ✅ Bounding box (ОБЯЗАТЕЛЬНО ДЛЯ ВСЕХ)
+        if plan.has_bounding_box:
+            try:
+                data.bounding_box = self._get_bounding_box(ent)
+            except Exception as e:
+                logger.debug(f"Could not get bounding box: {e}")
 
+        return data, plan, reader
+
+    def _extract_entity_full(self, ent, include_xdata: bool,
+                             include_dict: bool) -> Optional[EntityProperties]:
+        """
+        Полное извлечение данных одного объекта с типизацией.
+        Набор свойств определяется планом извлечения для ObjectName,
+        поэтому hasattr-проверки выполняются один раз на тип, а не на объект.
+        """
+        try:
+            data, plan, reader = self._extract_entity_core(ent)
+            return self._complete_entity(ent, data, plan, reader, include_xdata, include_dict)
         except Exception as e:
             logger.error(f"Error extracting entity data: {e}", exc_info=True)
             # Если совсем не получилось — возвращаем минимум
@@ -396,346 +747,246 @@ class AutoCADClient:
             except Exception:
                 return None
 
-    def _get_bounding_box(self, ent) -> Optional[BoundingBox]:
-        """Получение ограничивающего прямоугольника объекта."""
+    def _extract_entity_skeleton(self, ent) -> Optional[EntityProperties]:
+        """
+        Скелетная запись объекта: базовые поля, bounding box, числовые свойства
+        и координаты без вершин. type_properties, XData, Extension Dictionary
+        и вершины полилиний догружаются позже через extract_entity_details().
+        """
         try:
-            if hasattr(ent, 'GetBoundingBox'):
-                min_pt = win32com.client.VARIANT(
-                    pythoncom.VT_ARRAY | pythoncom.VT_R8,
-                    [0, 0, 0]
-                )
-                max_pt = win32com.client.VARIANT(
-                    pythoncom.VT_ARRAY | pythoncom.VT_R8,
-                    [0, 0, 0]
-                )
-                ent.GetBoundingBox(min_pt, max_pt)
-                return BoundingBox(
-                    min_x=float(min_pt[0]), min_y=float(min_pt[1]), min_z=float(min_pt[2]),
-                    max_x=float(max_pt[0]), max_y=float(max_pt[1]), max_z=float(max_pt[2])
-                )
+            data, plan, reader = self._extract_entity_core(ent)
+            self._read_signature_fields(data, plan, reader, details=False)
+            data.details_loaded = False
+            return data
         except Exception as e:
-            logger.debug(f"GetBoundingBox failed: {e}")
-        return None
+            logger.error(f"Error extracting entity skeleton: {e}", exc_info=True)
+            return None
 
-    def _extract_coordinates(self, ent) -> Coordinates:
-        """Извлечение координат в зависимости от типа объекта."""
-        coords = Coordinates()
-        obj_name = getattr(ent, 'ObjectName', '')
+    @staticmethod
+    def _read_signature_fields(data: EntityProperties, plan: ExtractionPlan,
+                               reader: EntityReader, details: bool):
+        """
+        Дешёвые поля сигнатуры изменений поверх базовых: общие числовые свойства
+        и координаты; при details — также вершины и тип-свойства сигнатуры.
+        """
+        for field_name, attr, convert in plan.common:
+            try:
+                setattr(data, field_name, convert(reader.get(attr)))
+            except Exception:
+                pass
+        for field_name, attr, convert in (plan.coordinates if details else plan.skeleton_coordinates):
+            try:
+                setattr(data.coordinates, field_name, convert(reader.get(attr)))
+            except Exception:
+                pass
+        if not details:
+            return
+        props = {}
+        for key, read in plan.signature_properties:
+            try:
+                props[key] = read(reader)
+            except Exception:
+                pass
+        data.type_properties = compact_properties(props)
+        AutoCADClient._fill_from_vertices(data)
 
+    @staticmethod
+    def _fill_from_vertices(data: EntityProperties):
+        """
+        Bounding box и длина полилинии по буферу вершин, если COM их не вернул.
+        Габарит контрольных точек сплайна содержит сам сплайн; дуги bulge в длине не учитываются.
+        """
+        vertices = data.coordinates.vertices
+        if not len(vertices):
+            return
+        if data.bounding_box is None:
+            data.bounding_box = GeometryAnalyzer.vertices_bbox(vertices)
+        if data.length is None and data.object_name in POLYLINE_OBJECT_NAMES:
+            data.length = GeometryAnalyzer.polyline_length(vertices, bool(data.type_properties.get("closed")))
+
+    def extract_entity_details(self, handle: str, include_xdata: bool = True,
+                               include_dict: bool = True) -> Optional[EntityProperties]:
+        """Полное извлечение одного объекта по handle (HandleToObject)."""
         try:
-            if obj_name == "AcDbLine":
-                if hasattr(ent, 'StartPoint'):
-                    coords.start = [
-                        float(ent.StartPoint[0]),
-                        float(ent.StartPoint[1]),
-                        float(ent.StartPoint[2])
-                    ]
-                if hasattr(ent, 'EndPoint'):
-                    coords.end = [
-                        float(ent.EndPoint[0]),
-                        float(ent.EndPoint[1]),
-                        float(ent.EndPoint[2])
-                    ]
-            elif obj_name in ["AcDbCircle", "AcDbArc"]:
-                if hasattr(ent, 'Center'):
-                    coords.center = [
-                        float(ent.Center[0]),
-                        float(ent.Center[1]),
-                        float(ent.Center[2])
-                    ]
-            elif obj_name == "AcDbBlockReference":
-                if hasattr(ent, 'InsertionPoint'):
-                    coords.insertion = [
-                        float(ent.InsertionPoint[0]),
-                        float(ent.InsertionPoint[1]),
-                        float(ent.InsertionPoint[2])
-                    ]
-            elif obj_name == "AcDbText":
-                if hasattr(ent, 'InsertionPoint'):
-                    coords.insertion = [
-                        float(ent.InsertionPoint[0]),
-                        float(ent.InsertionPoint[1]),
-                        float(ent.InsertionPoint[2])
-                    ]
-            elif obj_name == "AcDbPolyline":
-                if hasattr(ent, 'Coordinates'):
-                    raw = list(ent.Coordinates)
-                    coords.vertices = [
-                        [float(raw[i]), float(raw[i + 1]), float(raw[i + 2] if i + 2 < len(raw) else 0)]
-                        for i in range(0, len(raw), 3)
-                    ]
-            elif obj_name == "AcDbPoint":
-                if hasattr(ent, 'Coordinates'):
-                    coords.point = [
-                        float(ent.Coordinates[0]),
-                        float(ent.Coordinates[1]),
-                        float(ent.Coordinates[2])
-                    ]
+            if not self.doc:
+                logger.error("Document not available")
+                return None
+            ent = self.doc.HandleToObject(handle)
+            return self._extract_entity_full(ent, include_xdata, include_dict)
         except Exception as e:
-            logger.debug(f"Coordinate extraction error: {e}")
+            logger.warning(f"Could not load details for {handle}: {e}")
+            return None
 
-        return coords
+    def _complete_entity(self, ent, data: EntityProperties, plan: ExtractionPlan,
+                         reader: EntityReader, include_xdata: bool,
+                         include_dict: bool) -> EntityProperties:
+        """Дополнение базовых полей остальными свойствами объекта."""
+        # reader.ent — объект под профайлером, если он включён
+        ent = reader.ent
+        # Дополнительные общие и числовые свойства
+        for field_name, attr, convert in plan.common:
+            try:
+                setattr(data, field_name, convert(reader.get(attr)))
+            except Exception:
+                pass
 
-    def _extract_type_properties(self, ent) -> Dict[str, Any]:
-        """Извлечение свойств, специфичных для типа объекта."""
-        props = {}
-        obj_name = getattr(ent, 'ObjectName', '')
+        # Координаты
+        try:
+            data.coordinates = self._extract_coordinates(ent, plan, reader)
+        except Exception as e:
+            logger.debug(f"Could not extract coordinates: {e}")
 
+        # Тип-специфичные свойства
         try:
-            # === AcDbLine ===
-            if obj_name == "AcDbLine":
-                try:
-                    props["angle"] = float(ent.Angle)
-                except Exception:
-                    pass
-                try:
-                    if hasattr(ent, 'Delta'):
-                        props["delta"] = [
-                            float(ent.Delta[0]),
-                            float(ent.Delta[1]),
-                            float(ent.Delta[2])
-                        ]
-                except Exception:
-                    pass
+            data.type_properties = compact_properties(self._extract_type_properties(ent, plan, reader))
+        except Exception as e:
+            logger.debug(f"Could not extract type properties: {e}")
+        self._fill_from_vertices(data)
 
-            # === AcDbCircle ===
-            elif obj_name == "AcDbCircle":
-                try:
-                    props["radius"] = float(ent.Radius)
-                except Exception:
-                    pass
-                try:
-                    props["diameter"] = float(ent.Diameter)
-                except Exception:
-                    pass
-                try:
-                    props["circumference"] = float(ent.Circumference)
-                except Exception:
-                    pass
+        # XData
+        if include_xdata and plan.has_xdata and self._xdata_apps != ():
+            try:
+                data.xdata = self._extract_xdata(ent)
+            except Exception:
+                data.xdata = None
 
-            # === AcDbArc ===
-            elif obj_name == "AcDbArc":
-                try:
-                    props["radius"] = float(ent.Radius)
-                except Exception:
-                    pass
-                try:
-                    props["start_angle"] = float(ent.StartAngle)
-                except Exception:
-                    pass
-                try:
-                    props["end_angle"] = float(ent.EndAngle)
-                except Exception:
-                    pass
-                try:
-                    props["total_angle"] = float(ent.TotalAngle)
-                except Exception:
-                    pass
-                try:
-                    props["arc_length"] = float(ent.ArcLength)
-                except Exception:
-                    pass
+        # Extension Dictionary
+        if include_dict and plan.has_extension_dict:
+            try:
+                if reader.get('HasExtensionDictionary'):
+                    data.extension_dict = self._extract_extension_dict(ent)
+            except Exception:
+                data.extension_dict = None
 
-            # === AcDbPolyline ===
-            elif obj_name == "AcDbPolyline":
-                try:
-                    props["closed"] = bool(ent.Closed)
-                except Exception:
-                    pass
-                try:
-                    props["constant_width"] = float(ent.ConstantWidth)
-                except Exception:
-                    pass
-                try:
-                    props["elevation"] = float(ent.Elevation)
-                except Exception:
-                    pass
-                try:
-                    if hasattr(ent, 'Coordinates'):
-                        coords_list = list(ent.Coordinates)
-                        props["num_vertices"] = len(coords_list) // 3
-                except Exception:
-                    pass
+        return data
 
-            # === AcDbSpline ===
-            elif obj_name == "AcDbSpline":
-                try:
-                    props["degree"] = int(ent.Degree)
-                except Exception:
-                    pass
-                try:
-                    props["closed"] = bool(ent.Closed)
-                except Exception:
-                    pass
-                try:
-                    props["periodic"] = bool(ent.Periodic)
-                except Exception:
-                    pass
-                try:
-                    props["num_control_points"] = int(ent.NumberOfControlPoints)
-                except Exception:
-                    pass
-                try:
-                    props["num_fit_points"] = int(ent.NumberOfFitPoints)
-                except Exception:
-                    pass
+    def extract_changed_entities(self, known: Dict[str, EntityProperties],
+                                 include_xdata: bool = True,
+                                 include_dict: bool = True) -> Tuple[List[EntityProperties], List[EntityProperties], List[str]]:
+        """
+        Сравнение ModelSpace с известными сущностями по сигнатуре изменений.
+        Полностью извлекаются только новые и изменённые объекты.
+        Возвращает (добавленные, изменённые, handles удалённых).
+        """
+        added: List[EntityProperties] = []
+        modified: List[EntityProperties] = []
+        seen = set()
+        failed = 0
 
-            # === AcDbText ===
-            elif obj_name == "AcDbText":
-                try:
-                    props["text_string"] = str(ent.TextString)
-                except Exception:
-                    pass
-                try:
-                    props["height"] = float(ent.Height)
-                except Exception:
-                    pass
-                try:
-                    props["oblique_angle"] = float(ent.ObliqueAngle)
-                except Exception:
-                    pass
-                try:
-                    props["style_name"] = str(ent.StyleName)
-                except Exception:
-                    pass
-                try:
-                    props["rotation"] = float(ent.Rotation)
-                except Exception:
-                    pass
+        if not self.model_space:
+            logger.error("ModelSpace not available")
+            return added, modified, []
 
-            # === AcDbMText ===
-            elif obj_name == "AcDbMText":
-                try:
-                    props["text_string"] = str(ent.TextString)
-                except Exception:
-                    pass
-                try:
-                    props["height"] = float(ent.Height)
-                except Exception:
-                    pass
-                try:
-                    props["width"] = float(ent.Width)
-                except Exception:
-                    pass
-                try:
-                    props["attachment_point"] = int(ent.AttachmentPoint)
-                except Exception:
-                    pass
+        if include_xdata:
+            self.refresh_xdata_apps()
+        for ent in self.model_space:
+            try:
+                data, plan, reader = self._extract_entity_core(ent)
+                seen.add(data.handle)
+                cached = known.get(data.handle)
+                if cached is not None:
+                    details = cached.details_loaded
+                    self._read_signature_fields(data, plan, reader, details)
+                    if cached.signature(details) == data.signature(details):
+                        continue
+                data = self._complete_entity(ent, data, plan, reader, include_xdata, include_dict)
+                (added if cached is None else modified).append(data)
+            except Exception as e:
+                logger.warning(f"Error comparing entity: {e}")
+                failed += 1
+                continue
 
-            # === AcDbBlockReference ===
-            elif obj_name == "AcDbBlockReference":
-                try:
-                    props["block_name"] = str(ent.Name)
-                except Exception:
-                    pass
-                try:
-                    props["effective_name"] = str(
-                        getattr(ent, 'EffectiveName', ent.Name)
-                    )
-                except Exception:
-                    pass
-                try:
-                    props["scale_factors"] = {
-                        "x": float(ent.XScaleFactor),
-                        "y": float(ent.YScaleFactor),
-                        "z": float(ent.ZScaleFactor)
-                    }
-                except Exception:
-                    pass
-                try:
-                    props["rotation"] = float(ent.Rotation)
-                except Exception:
-                    pass
-                try:
-                    props["is_dynamic"] = bool(
-                        getattr(ent, 'IsDynamicBlock', False)
-                    )
-                except Exception:
-                    pass
-                # Атрибуты
-                try:
-                    if hasattr(ent, 'GetAttributes'):
-                        attrs = []
-                        for attr in ent.GetAttributes():
-                            try:
-                                attrs.append({
-                                    "tag": str(attr.TagString),
-                                    "text": str(attr.TextString),
-                                })
-                            except Exception:
-                                continue
-                        props["attributes"] = attrs
-                except Exception:
-                    pass
+        if failed:
+            # Handle нечитаемых объектов неизвестен — удаления не фиксируем
+            logger.warning(f"{failed} entities could not be read; erased entities are not detected.")
+            erased = []
+        else:
+            erased = [handle for handle in known if handle not in seen]
+        logger.info(
+            f"Delta scan: {len(added)} added, {len(modified)} modified, {len(erased)} erased, "
+            f"{len(seen) - len(added) - len(modified)} unchanged."
+        )
+        return added, modified, erased
 
-            # === AcDbHatch ===
-            elif obj_name == "AcDbHatch":
-                try:
-                    props["pattern_name"] = str(ent.PatternName)
-                except Exception:
-                    pass
-                try:
-                    props["pattern_scale"] = float(ent.PatternScale)
-                except Exception:
-                    pass
-                try:
-                    props["pattern_angle"] = float(ent.PatternAngle)
-                except Exception:
-                    pass
-                try:
-                    props["num_loops"] = int(ent.NumLoops)
-                except Exception:
-                    pass
+    @staticmethod
+    def _out_point():
+        """Выходной параметр-точка для COM-методов вида GetBoundingBox."""
+        if win32com is None:
+            return [0.0, 0.0, 0.0]
+        return win32com.client.VARIANT(
+            pythoncom.VT_ARRAY | pythoncom.VT_R8,
+            [0, 0, 0]
+        )
 
-            # === AcDbDimension ===
-            elif "AcDbDimension" in obj_name:
-                try:
-                    props["dimension_type"] = int(ent.DimensionType)
-                except Exception:
-                    pass
-                try:
-                    props["measurement"] = float(ent.Measurement)
-                except Exception:
-                    pass
-                try:
-                    props["style_name"] = str(ent.StyleName)
-                except Exception:
-                    pass
-                try:
-                    props["text_string"] = str(
-                        getattr(ent, 'TextString', getattr(ent, 'TextOverride', ''))
-                    )
-                except Exception:
-                    pass
+    def _get_bounding_box(self, ent) -> Optional[BoundingBox]:
+        """Получение ограничивающего прямоугольника объекта."""
+        try:
+            min_pt = self._out_point()
+            max_pt = self._out_point()
+            ent.GetBoundingBox(min_pt, max_pt)
+            return BoundingBox(
+                min_x=float(min_pt[0]), min_y=float(min_pt[1]), min_z=float(min_pt[2]),
+                max_x=float(max_pt[0]), max_y=float(max_pt[1]), max_z=float(max_pt[2])
+            )
+        except Exception as e:
+            logger.debug(f"GetBoundingBox failed: {e}")
+        return None
+
+    def _resolve_plan(self, ent, plan: Optional[ExtractionPlan],
+                      reader: Optional[EntityReader]) -> Tuple[ExtractionPlan, EntityReader]:
+        """План и reader для объекта, если они не переданы вызывающим."""
+        if reader is None:
+            reader = EntityReader(ent)
+        if plan is None:
+            plan = self._plans.get(ent, str(getattr(ent, 'ObjectName', '')))
+        return plan, reader
+
+    def _extract_coordinates(self, ent, plan: Optional[ExtractionPlan] = None,
+                             reader: Optional[EntityReader] = None) -> Coordinates:
+        """Извлечение координат в зависимости от типа объекта."""
+        coords = Coordinates()
 
-            # === AcDbMLeader ===
-            elif obj_name == "AcDbMLeader":
+        try:
+            plan, reader = self._resolve_plan(ent, plan, reader)
+            for field_name, attr, convert in plan.coordinates:
+                setattr(coords, field_name, convert(reader.get(attr)))
+        except Exception as e:
+            logger.debug(f"Coordinate extraction error: {e}")
+
+        return coords
+
+    def _extract_type_properties(self, ent, plan: Optional[ExtractionPlan] = None,
+                                 reader: Optional[EntityReader] = None) -> Dict[str, Any]:
+        """Извлечение свойств, специфичных для типа объекта."""
+        props = {}
+
+        try:
+            plan, reader = self._resolve_plan(ent, plan, reader)
+            for key, read in plan.type_properties:
                 try:
-                    props["text_string"] = str(ent.TextString)
+                    props[key] = read(reader)
                 except Exception:
                     pass
-
         except Exception as e:
             logger.debug(f"Type properties extraction error: {e}")
 
         return props
 
     def _extract_xdata(self, ent) -> Optional[Dict[str, Any]]:
-        """Извлечение XData (Extended Data) объекта."""
+        """Извлечение XData (Extended Data) объекта по зарегистрированным приложениям чертежа."""
         xdata = {}
         try:
-            if hasattr(ent, 'GetXData'):
-                known_apps = ["ACAD", "AUTODESK", "ROBOT", "REVIT"]
-                for app_name in known_apps:
-                    try:
-                        result = ent.GetXData(app_name)
-                        if result and len(result) >= 2:
-                            xdata[app_name] = {
-                                "type_codes": list(result[0]) if hasattr(result[0], '__iter__') else [result[0]],
-                                "values": list(result[1]) if hasattr(result[1], '__iter__') else [result[1]]
-                            }
-                    except Exception:
-                        continue
+            apps = self._xdata_apps if self._xdata_apps is not None else self.refresh_xdata_apps()
+            for app_name in apps:
+                try:
+                    result = ent.GetXData(app_name)
+                    if result and len(result) >= 2:
+                        xdata[app_name] = {
+                            "type_codes": list(result[0]) if hasattr(result[0], '__iter__') else [result[0]],
+                            "values": list(result[1]) if hasattr(result[1], '__iter__') else [result[1]]
+                        }
+                except Exception:
+                    continue
         except Exception:
             pass
         return xdata if xdata else None
@@ -0,0 +1,156 @@
+"""
+Хранилище bounding box сущностей в виде параллельных массивов (struct of arrays).
+✅ Матрица N×6 float64 по столбцам: min_x, min_y, min_z, max_x, max_y, max_z — выровнена с массивом handle
+✅ Колонки area и length — для сводной статистики без обхода объектов
+✅ С NumPy окно, общий габарит и суммы считаются векторными масками; без NumPy — циклом по массивам
+✅ Замена сущности обновляет строку на месте, удаление оставляет пустую строку (NaN);
+   пустые строки вычищаются, когда их становится больше половины — порядок строк не меняется
+"""
+import math
+import logging
+from array import array
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+logger = logging.getLogger(__name__)
+
+NAN = float("nan")
+_EMPTY_ROW = (NAN,) * 6
+# Пустые строки не вычищаются, пока их меньше этого числа
+_COMPACT_MIN = 1024
+# Окно, покрывающее больше этой доли занятых ячеек сетки, проверяется маской по всем строкам
+VECTOR_COVERAGE = 0.01
+
+Box6 = Tuple[float, float, float, float, float, float]
+
+
+def vectorized() -> bool:
+    """Запросы хранилища выполняются векторно (установлен NumPy)."""
+    return numpy is not None
+
+
+def _number(value: Optional[float]) -> float:
+    return NAN if value is None else float(value)
+
+
+class BoundingBoxStore:
+    """
+    Bounding box, area и length сущностей по строкам в порядке добавления handle.
+    Сущность без bounding box занимает строку из NaN (участвует только в суммах).
+    Представления NumPy над колонками живут только внутри вызова: пока они есть, array нельзя расширить.
+    """
+
+    def __init__(self):
+        self._handles: List[Optional[str]] = []
+        self._rows: Dict[str, int] = {}
+        self._bounds = [array('d') for _ in range(6)]
+        self._area = array('d')
+        self._length = array('d')
+        self._dead = 0
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, handle: str) -> bool:
+        return handle in self._rows
+
+    def set(self, handle: str, box: Optional[Box6], area: Optional[float] = None,
+            length: Optional[float] = None):
+        """Добавление строки или замена строки того же handle на месте."""
+        values = box if box is not None else _EMPTY_ROW
+        row = self._rows.get(handle)
+        if row is None:
+            self._rows[handle] = len(self._handles)
+            self._handles.append(handle)
+            for column, value in zip(self._bounds, values):
+                column.append(value)
+            self._area.append(_number(area))
+            self._length.append(_number(length))
+            return
+        for column, value in zip(self._bounds, values):
+            column[row] = value
+        self._area[row] = _number(area)
+        self._length[row] = _number(length)
+
+    def remove(self, handle: str):
+        row = self._rows.pop(handle, None)
+        if row is None:
+            return
+        self._handles[row] = None
+        for column in self._bounds:
+            column[row] = NAN
+        self._area[row] = NAN
+        self._length[row] = NAN
+        self._dead += 1
+        if self._dead > _COMPACT_MIN and self._dead * 2 > len(self._handles):
+            self._compact()
+
+    def _compact(self):
+        live = [row for row, handle in enumerate(self._handles) if handle is not None]
+        self._handles = [self._handles[row] for row in live]
+        self._bounds = [array('d', (column[row] for row in live)) for column in self._bounds]
+        self._area = array('d', (self._area[row] for row in live))
+        self._length = array('d', (self._length[row] for row in live))
+        self._rows = {handle: row for row, handle in enumerate(self._handles)}
+        self._dead = 0
+
+    def _views(self) -> List[Any]:
+        return [numpy.frombuffer(column, dtype=numpy.float64) for column in self._bounds]
+
+    def ordered(self, handles: List[str]) -> List[str]:
+        """Handle, упорядоченные по строкам хранилища (порядок добавления)."""
+        return sorted(handles, key=self._rows.__getitem__)
+
+    def in_box(self, low: Tuple[float, float, float], high: Tuple[float, float, float],
+               exclude: Optional[str] = None) -> List[str]:
+        """Handle сущностей, чей bounding box пересекает параллелепипед (в порядке строк)."""
+        handles = self._handles
+        if numpy is not None:
+            min_x, min_y, min_z, max_x, max_y, max_z = self._views()
+            mask = ((max_x >= low[0]) & (min_x <= high[0]) & (max_y >= low[1])
+                    & (min_y <= high[1]) & (max_z >= low[2]) & (min_z <= high[2]))
+            rows = numpy.flatnonzero(mask).tolist()
+        else:
+            min_x, min_y, min_z, max_x, max_y, max_z = self._bounds
+            rows = [
+                row for row in range(len(handles))
+                if max_x[row] >= low[0] and min_x[row] <= high[0] and max_y[row] >= low[1]
+                and min_y[row] <= high[1] and max_z[row] >= low[2] and min_z[row] <= high[2]
+            ]
+        return [handles[row] for row in rows if handles[row] != exclude]
+
+    def extent(self) -> Optional[Box6]:
+        """Общий габарит всех bounding box (None — ни у одной сущности его нет)."""
+        if numpy is not None:
+            views = self._views()
+            if not len(views[0]) or numpy.isnan(views[0]).all():
+                return None
+            return tuple([float(numpy.nanmin(v)) for v in views[:3]] + [float(numpy.nanmax(v)) for v in views[3:]])
+        rows = [row for row, value in enumerate(self._bounds[0]) if not math.isnan(value)]
+        if not rows:
+            return None
+        return tuple(
+            [min(column[row] for row in rows) for column in self._bounds[:3]]
+            + [max(column[row] for row in rows) for column in self._bounds[3:]]
+        )
+
+    def totals(self) -> Dict[str, float]:
+        """Суммарные area и length и число сущностей с bounding box."""
+        if numpy is not None:
+            area = numpy.frombuffer(self._area, dtype=numpy.float64)
+            length = numpy.frombuffer(self._length, dtype=numpy.float64)
+            min_x = numpy.frombuffer(self._bounds[0], dtype=numpy.float64)
+            return {
+                "total_area": float(numpy.nansum(area)),
+                "total_length": float(numpy.nansum(length)),
+                "entities_with_bbox": int(numpy.count_nonzero(~numpy.isnan(min_x)))
+            }
+        return {
+            "total_area": sum((v for v in self._area if not math.isnan(v)), 0.0),
+            "total_length": sum((v for v in self._length if not math.isnan(v)), 0.0),
+            "entities_with_bbox": sum(1 for v in self._bounds[0] if not math.isnan(v))
+        }
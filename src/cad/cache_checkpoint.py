@@ -0,0 +1,183 @@
+"""
+Потоковая запись кэша чертежа с контрольными точками.
+✅ Сущности пишутся в файл порциями по мере извлечения
+✅ Контрольная точка хранит индекс последнего обработанного объекта
+✅ Прерванное извлечение продолжается с контрольной точки
+"""
+import json
+import os
+import logging
+from datetime import datetime
+from typing import Dict, List, Any, Optional, BinaryIO
+
+from .columnar_cache import ColumnarCacheBuilder
+from .sqlite_cache import SqliteCacheBuilder
+from .cache_journal import write_json_atomic
+from .cache_index import JsonCacheWriter, entity_key, INDEX_VERSION
+
+logger = logging.getLogger(__name__)
+
+# Секции итогового файла кэша, наполняемые порциями
+# (blocks/texts/dimensions не сохраняются — они строятся из entities при загрузке)
+SECTIONS = ("entities",)
+# Промежуточный файл индексируемых полей сущностей (для индекса смещений JSON-кэша)
+KEYS_PART = "keys"
+
+
+class CheckpointedCacheWriter:
+    """
+    Запись кэша через промежуточные файлы секций (JSON Lines).
+    После каждой порции файлы сбрасываются на диск, а контрольная точка
+    фиксирует их размеры и индекс следующего объекта ModelSpace.
+    """
+
+    def __init__(self, cache_file: str, cache_format: str = "json", compression: str = "none"):
+        self.cache_file = cache_file
+        self.cache_format = cache_format
+        # Кодек сжатия итогового JSON-файла (части и контрольная точка не сжимаются)
+        self.compression = compression
+        self.checkpoint_file = cache_file + ".checkpoint"
+        self._part_files = {name: f"{cache_file}.{name}.part" for name in SECTIONS + (KEYS_PART,)}
+        self._handles: Dict[str, BinaryIO] = {}
+        self.state: Dict[str, Any] = {}
+
+    @property
+    def counts(self) -> Dict[str, int]:
+        return self.state.get("counts", {})
+
+    def _read_checkpoint(self) -> Optional[Dict[str, Any]]:
+        if not os.path.exists(self.checkpoint_file):
+            return None
+        try:
+            with open(self.checkpoint_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.warning(f"Unreadable checkpoint ignored: {e}")
+            return None
+
+    def _can_resume(self, checkpoint: Optional[Dict[str, Any]], drawing_path: Optional[str],
+                    entity_count: int, mode: str) -> bool:
+        if not checkpoint:
+            return False
+        if (checkpoint.get("drawing_path") != drawing_path or
+                checkpoint.get("entity_count") != entity_count or
+                checkpoint.get("mode", "full") != mode or
+                checkpoint.get("index_version") != INDEX_VERSION):
+            logger.info("Checkpoint belongs to another drawing state, starting over.")
+            return False
+        sizes = checkpoint.get("sizes", {})
+        return all(
+            os.path.exists(path) and os.path.getsize(path) >= sizes.get(name, 0)
+            for name, path in self._part_files.items()
+        )
+
+    def open(self, drawing_path: Optional[str], entity_count: int, resume: bool = True,
+             mode: str = "full") -> int:
+        """
+        Подготовка к записи. Возвращает индекс ModelSpace, с которого нужно
+        продолжить извлечение (0 — если подходящей контрольной точки нет).
+        mode различает полный и скелетный проходы: их порции не смешиваются.
+        """
+        checkpoint = self._read_checkpoint() if resume else None
+
+        if self._can_resume(checkpoint, drawing_path, entity_count, mode):
+            self.state = checkpoint
+            # Данные, записанные после последней контрольной точки, отбрасываются
+            for name, path in self._part_files.items():
+                with open(path, 'r+b') as f:
+                    f.truncate(self.state["sizes"][name])
+            logger.info(
+                f"▶️ Resuming extraction from checkpoint: {self.state['next_index']}/{entity_count} "
+                f"({self.state['counts']['entities']} entities already saved)"
+            )
+        else:
+            self.state = {
+                "drawing_path": drawing_path,
+                "entity_count": entity_count,
+                "mode": mode,
+                "index_version": INDEX_VERSION,
+                "next_index": 0,
+                "started": datetime.now().isoformat(),
+                "sizes": {name: 0 for name in self._part_files},
+                "counts": {name: 0 for name in SECTIONS}
+            }
+            for path in self._part_files.values():
+                open(path, 'wb').close()
+            write_json_atomic(self.checkpoint_file, self.state)
+
+        self._handles = {name: open(path, 'ab') for name, path in self._part_files.items()}
+        return self.state["next_index"]
+
+    def write_chunk(self, next_index: int, sections: Dict[str, List[Dict[str, Any]]]):
+        """Запись порции и фиксация контрольной точки."""
+        for name in SECTIONS:
+            records = sections.get(name, [])
+            f = self._handles[name]
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False, default=str).encode('utf-8'))
+                f.write(b"\n")
+            self.state["counts"][name] += len(records)
+        keys = self._handles[KEYS_PART]
+        for entity in sections.get("entities", []):
+            keys.write(json.dumps(entity_key(entity), ensure_ascii=False, default=str).encode('utf-8'))
+            keys.write(b"\n")
+
+        for name, f in self._handles.items():
+            f.flush()
+            os.fsync(f.fileno())
+            self.state["sizes"][name] = f.tell()
+
+        self.state["next_index"] = next_index
+        write_json_atomic(self.checkpoint_file, self.state)
+
+    def assemble(self, header: Dict[str, Any], trailer: Dict[str, Any]):
+        """
+        Сборка итогового файла кэша: header, секции, trailer.
+        Секции копируются построчно, итоговый файл заменяется атомарно;
+        для несжатого JSON рядом пишется индекс смещений сущностей.
+        """
+        self.close()
+        if self.cache_format in ("columnar", "sqlite"):
+            self._assemble_binary(header, trailer)
+            return
+        writer = JsonCacheWriter(self.cache_file, self.compression)
+        try:
+            for key, value in header.items():
+                writer.field(key, value)
+            writer.begin_entities()
+            with open(self._part_files["entities"], 'rb') as part, open(self._part_files[KEYS_PART], 'rb') as keys:
+                for line, key in zip(part, keys):
+                    writer.entity(line.rstrip(b"\n"), json.loads(key))
+            writer.end_entities()
+            for key, value in trailer.items():
+                writer.field(key, value)
+            writer.close()
+        except BaseException:
+            writer.abort()
+            raise
+        self.discard()
+
+    def _assemble_binary(self, header: Dict[str, Any], trailer: Dict[str, Any]):
+        """Сборка колоночного файла или базы SQLite из файлов секций."""
+        if self.cache_format == "sqlite":
+            builder = SqliteCacheBuilder(self.cache_file)
+        else:
+            builder = ColumnarCacheBuilder()
+        with open(self._part_files["entities"], 'r', encoding='utf-8') as part:
+            for line in part:
+                builder.add_entity(json.loads(line))
+        builder.write(self.cache_file, {**header, **trailer})
+        self.discard()
+
+    def close(self):
+        """Закрытие файлов секций (контрольная точка сохраняется)."""
+        for f in self._handles.values():
+            f.close()
+        self._handles = {}
+
+    def discard(self):
+        """Удаление промежуточных файлов и контрольной точки."""
+        self.close()
+        for path in list(self._part_files.values()) + [self.checkpoint_file]:
+            if os.path.exists(path):
+                os.remove(path)
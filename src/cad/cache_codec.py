@@ -0,0 +1,180 @@
+"""
+Сжатие JSON-кэша чертежа (gzip/lzma из stdlib).
+✅ Кодек выбирается CACHE_COMPRESSION и определяется при чтении по сигнатуре файла
+✅ Потоковое чтение: сжатые байты и весь текст файла в памяти одновременно не держатся
+✅ Массивы верхнего уровня разбираются поэлементно
+"""
+import gzip
+import json
+import lzma
+import os
+import logging
+from typing import Dict, Any, IO, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+CODECS = ("none", "gzip", "lzma")
+# Сигнатуры сжатых файлов: кодек записан в самом файле
+CODEC_MAGIC = {
+    "gzip": b"\x1f\x8b",
+    "lzma": b"\xfd7zXZ\x00",
+}
+GZIP_LEVEL = 6
+_CHUNK_SIZE = 1 << 16
+_SHARED_STRING_LENGTH = 32
+
+
+def cache_compression() -> str:
+    """Кодек записи JSON-кэша из CACHE_COMPRESSION: none (по умолчанию), gzip или lzma."""
+    value = os.getenv("CACHE_COMPRESSION", "none").lower()
+    return value if value in CODECS else "none"
+
+
+def detect_codec(path: str) -> str:
+    """Кодек файла по сигнатуре."""
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(max(len(m) for m in CODEC_MAGIC.values()))
+    except OSError:
+        return "none"
+    for codec, magic in CODEC_MAGIC.items():
+        if head.startswith(magic):
+            return codec
+    return "none"
+
+
+def open_text(path: str, mode: str = "rt", codec: str = "none") -> IO[str]:
+    """Текстовый поток файла с учётом кодека ('rt' — чтение, 'wt' — запись)."""
+    if mode.startswith("r"):
+        codec = detect_codec(path)
+    if codec == "gzip":
+        if mode.startswith("w"):
+            return gzip.open(path, mode, encoding='utf-8', compresslevel=GZIP_LEVEL)
+        return gzip.open(path, mode, encoding='utf-8')
+    if codec == "lzma":
+        return lzma.open(path, mode, encoding='utf-8')
+    return open(path, mode[0], encoding='utf-8')
+
+
+def open_binary(path: str, mode: str = "wb", codec: str = "none") -> IO[bytes]:
+    """Двоичный поток файла с учётом кодека (запись несжатых байтов JSON)."""
+    if codec == "gzip":
+        return gzip.open(path, mode, compresslevel=GZIP_LEVEL)
+    if codec == "lzma":
+        return lzma.open(path, mode)
+    return open(path, mode)
+
+
+class _StreamParser:
+    """Разбор JSON-объекта из потока с окном ограниченного размера."""
+
+    def __init__(self, stream: IO[str]):
+        self._stream = stream
+        # raw_decode не разделяет ключи между вызовами — повторяющиеся ключи и короткие
+        # строки (слои, типы линий) хранятся в одном экземпляре
+        self._strings: Dict[str, str] = {}
+        self._decoder = json.JSONDecoder(object_pairs_hook=self._object)
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+
+    def _object(self, pairs: List[Tuple[str, Any]]) -> Dict[str, Any]:
+        strings = self._strings
+        return {
+            strings.setdefault(key, key):
+                strings.setdefault(value, value) if value.__class__ is str and len(value) < _SHARED_STRING_LENGTH else value
+            for key, value in pairs
+        }
+
+    def _read(self, size: int = 0) -> bool:
+        if self._eof:
+            return False
+        chunk = self._stream.read(size or _CHUNK_SIZE)
+        if not chunk:
+            self._eof = True
+            return False
+        if self._pos > _CHUNK_SIZE:
+            # Разобранная часть окна отбрасывается
+            self._buffer = self._buffer[self._pos:]
+            self._pos = 0
+        self._buffer += chunk
+        return True
+
+    def _peek(self) -> str:
+        """Следующий значащий символ (без пропуска)."""
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in " \t\r\n":
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._read():
+                raise ValueError("Unexpected end of JSON stream")
+
+    def _expect(self, char: str):
+        if self._peek() != char:
+            raise ValueError(f"Expected '{char}' at position {self._pos} of JSON stream")
+        self._pos += 1
+
+    def _value(self) -> Any:
+        """Одно значение; окно расширяется, пока значение не поместится целиком."""
+        self._peek()
+        size = _CHUNK_SIZE
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+                # Число на границе окна могло быть обрезано — дочитываем и разбираем заново
+                if end < len(self._buffer) or self._eof:
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            self._read(size)
+            size *= 2
+
+    def _array(self) -> List[Any]:
+        self._expect("[")
+        items = []
+        if self._peek() == "]":
+            self._pos += 1
+            return items
+        while True:
+            items.append(self._value())
+            if self._peek() == ",":
+                self._pos += 1
+                continue
+            self._expect("]")
+            return items
+
+    def parse_object(self) -> Dict[str, Any]:
+        self._expect("{")
+        result: Dict[str, Any] = {}
+        if self._peek() == "}":
+            return result
+        while True:
+            key = self._value()
+            self._expect(":")
+            result[key] = self._array() if self._peek() == "[" else self._value()
+            if self._peek() == ",":
+                self._pos += 1
+                continue
+            self._expect("}")
+            return result
+
+
+def load_json_stream(stream: IO[str]) -> Any:
+    """
+    Разбор JSON из текстового потока.
+    Объект верхнего уровня читается по ключам, массивы — поэлементно,
+    поэтому в памяти одновременно находится только окно текста.
+    """
+    parser = _StreamParser(stream)
+    if parser._peek() != "{":
+        return json.loads(parser._buffer[parser._pos:] + stream.read())
+    return parser.parse_object()
+
+
+def load_json_file(path: str) -> Any:
+    """Потоковая загрузка JSON-файла с автоопределением кодека."""
+    with open_text(path, "rt") as f:
+        return load_json_stream(f)
@@ -0,0 +1,150 @@
+"""
+Проверка актуальности кэша относительно исходного файла DWG.
+✅ При извлечении в DrawingMetadata записывается отпечаток DWG: путь, размер, mtime
+   и хэш нескольких выборочных блоков (CACHE_FINGERPRINT_SAMPLES=0 — без хэшей)
+✅ Проверка — один stat; если mtime изменился при том же размере, сверяются выборочные блоки
+✅ CACHE_FINGERPRINT_FULL_HASH=1 — в отпечаток добавляется хэш всего файла, и правка
+   вне выборочных блоков не пропускается ценой чтения всего DWG
+✅ Подтверждённый новый mtime сохраняется рядом с кэшем: повторная проверка снова — один stat
+✅ Результат: fresh, stale или unknown (отпечатка нет или файл DWG недоступен)
+"""
+import hashlib
+import json
+import os
+import logging
+from typing import Optional, Dict, Any, Union
+
+from .dataclasses import DrawingFingerprint
+
+logger = logging.getLogger(__name__)
+
+FRESH = "fresh"
+STALE = "stale"
+UNKNOWN = "unknown"
+
+DEFAULT_SAMPLES = 4
+SAMPLE_BLOCK_SIZE = 1 << 16
+HASH_CHUNK_SIZE = 1 << 20
+# Файл рядом с кэшем: mtime DWG, для которого совпадение содержимого уже подтверждено
+CONFIRMED_SUFFIX = ".dwgcheck"
+
+
+def fingerprint_samples() -> int:
+    """Число выборочных блоков хэша из CACHE_FINGERPRINT_SAMPLES (0 — без хэша)."""
+    try:
+        return max(0, int(os.getenv("CACHE_FINGERPRINT_SAMPLES", str(DEFAULT_SAMPLES))))
+    except ValueError:
+        return DEFAULT_SAMPLES
+
+
+def full_hash_enabled() -> bool:
+    """Хэш всего файла в отпечатке из CACHE_FINGERPRINT_FULL_HASH (1 — включён, по умолчанию выключен)."""
+    return os.getenv("CACHE_FINGERPRINT_FULL_HASH", "0") == "1"
+
+
+def sample_hash(path: str, size: int, samples: int) -> Optional[str]:
+    """Хэш samples блоков, равномерно расположенных по файлу (начало и конец включены)."""
+    if samples <= 0:
+        return None
+    digest = hashlib.blake2b(str(size).encode("ascii"), digest_size=16)
+    last = max(0, size - SAMPLE_BLOCK_SIZE)
+    offsets = sorted({last * i // max(1, samples - 1) for i in range(samples)})
+    try:
+        with open(path, 'rb') as f:
+            for offset in offsets:
+                f.seek(offset)
+                digest.update(f.read(SAMPLE_BLOCK_SIZE))
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+def content_hash(path: str) -> Optional[str]:
+    """Хэш всего файла (None — файл недоступен)."""
+    digest = hashlib.blake2b(digest_size=16)
+    try:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                digest.update(block)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+def take_fingerprint(drawing_path: Optional[str]) -> Optional[DrawingFingerprint]:
+    """Отпечаток файла DWG (None — файл не сохранён на диске или недоступен)."""
+    if not drawing_path:
+        return None
+    try:
+        stat = os.stat(drawing_path)
+    except OSError:
+        return None
+    samples = fingerprint_samples()
+    return DrawingFingerprint(
+        path=drawing_path,
+        size=stat.st_size,
+        mtime_ns=stat.st_mtime_ns,
+        sample_hash=sample_hash(drawing_path, stat.st_size, samples),
+        samples=samples,
+        content_hash=content_hash(drawing_path) if samples and full_hash_enabled() else None
+    )
+
+
+def _confirmed_key(fingerprint: DrawingFingerprint, stat: os.stat_result) -> Dict[str, Any]:
+    return {"path": fingerprint.path, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+            "content_hash": fingerprint.content_hash}
+
+
+def _is_confirmed(confirmed_path: Optional[str], key: Dict[str, Any]) -> bool:
+    if not confirmed_path:
+        return False
+    try:
+        with open(confirmed_path, 'r', encoding='utf-8') as f:
+            return json.load(f) == key
+    except (OSError, ValueError):
+        return False
+
+
+def _confirm(confirmed_path: Optional[str], key: Dict[str, Any]):
+    if not confirmed_path:
+        return
+    try:
+        with open(confirmed_path + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump(key, f)
+        os.replace(confirmed_path + ".tmp", confirmed_path)
+    except OSError as e:
+        logger.warning(f"Failed to record confirmed DWG fingerprint: {e}")
+
+
+def check_freshness(fingerprint: Union[DrawingFingerprint, Dict[str, Any], None],
+                    confirmed_path: Optional[str] = None) -> str:
+    """
+    Сравнение записанного отпечатка с текущим файлом DWG.
+    Другой размер — stale; тот же mtime — fresh. При другом mtime файл мог быть скопирован
+    или пересохранён без изменений: fresh — при совпадении выборочных блоков и, если он
+    записан в отпечатке, хэша всего файла. Подтверждённый mtime записывается
+    в confirmed_path и при следующих проверках принимается без чтения файла.
+    """
+    if not fingerprint:
+        return UNKNOWN
+    if isinstance(fingerprint, dict):
+        fingerprint = DrawingFingerprint.from_dict(fingerprint)
+    try:
+        stat = os.stat(fingerprint.path)
+    except OSError:
+        return UNKNOWN
+    if stat.st_size != fingerprint.size:
+        return STALE
+    if stat.st_mtime_ns == fingerprint.mtime_ns:
+        return FRESH
+    if fingerprint.sample_hash is None:
+        return STALE
+    key = _confirmed_key(fingerprint, stat)
+    if _is_confirmed(confirmed_path, key):
+        return FRESH
+    if sample_hash(fingerprint.path, stat.st_size, fingerprint.samples) != fingerprint.sample_hash:
+        return STALE
+    if fingerprint.content_hash is not None and content_hash(fingerprint.path) != fingerprint.content_hash:
+        return STALE
+    _confirm(confirmed_path, key)
+    return FRESH
@@ -0,0 +1,125 @@
+"""
+Резидентный кэш чертежа на уровне процесса.
+✅ Файл кэша разбирается один раз и переиспользуется между вызовами инструментов
+✅ Перечитывание только при изменении mtime, размера файла или версии
+✅ Версия увеличивается при записи кэша в этом процессе (mtime может не успеть измениться)
+✅ Подмена снимка фоновым обновлением ждёт завершения начатых запросов (reading())
+✅ Снимок, сменившийся во время запроса (get() после изменения файла, invalidate()),
+   закрывается только после завершения всех начатых запросов
+"""
+import os
+import threading
+import logging
+from contextlib import contextmanager
+from typing import Optional, Any, Callable, Tuple, Sequence, Iterator, List
+
+logger = logging.getLogger(__name__)
+
+
+class LoadedCacheHolder:
+    """
+    Держатель загруженного кэша: ключ (путь, mtime, размер, inode, версия) → разобранная структура.
+    Отдаёт один и тот же объект, пока файл не изменился; вызывающий код не должен его менять.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._key: Optional[Tuple] = None
+        self._data: Any = None
+        self.version = 0
+        # Номер снимка: увеличивается при подмене файла кэша фоновым обновлением
+        self.generation = 0
+        self.loads = 0
+        self.hits = 0
+        self._readers = 0
+        self._idle = threading.Condition(self._lock)
+        # Прежние снимки, которые ещё могут читать начатые запросы
+        self._retired: List[Any] = []
+
+    @staticmethod
+    def _stat_key(path: str) -> Optional[Tuple]:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return os.path.abspath(path), stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def get(self, path: str, loader: Callable[[str], Any], depends_on: Sequence[str] = ()) -> Any:
+        """
+        Загруженный кэш для path; loader вызывается только при изменении файла
+        или файлов depends_on (например, журнала изменений).
+        """
+        with self._lock:
+            stat_key = self._stat_key(path)
+            if stat_key is None:
+                self._release()
+                return None
+
+            key = (stat_key, tuple(self._stat_key(p) for p in depends_on), self.version)
+            if key == self._key:
+                self.hits += 1
+                return self._data
+
+            self._release()
+            self._data = loader(path)
+            self._key = key
+            self.loads += 1
+            logger.debug(f"Cache {path} loaded into memory (version {self.version})")
+            return self._data
+
+    def invalidate(self):
+        """
+        Сброс перед записью кэша: отображения и соединения закрываются
+        (если идут запросы — после их завершения), версия увеличивается.
+        """
+        with self._lock:
+            self._release()
+            self.version += 1
+
+    @contextmanager
+    def reading(self) -> Iterator[None]:
+        """Запрос к кэшу: пока он выполняется, swap() не закрывает и не подменяет снимок."""
+        with self._lock:
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._readers -= 1
+                if not self._readers:
+                    retired, self._retired = self._retired, []
+                    for data in retired:
+                        self._close(data)
+                    self._idle.notify_all()
+
+    def swap(self, install: Callable[[], None], timeout: Optional[float] = None) -> bool:
+        """
+        Атомарная подмена снимка: после завершения начатых запросов прежний снимок
+        закрывается, install() переносит новые файлы на место текущих.
+        Новые запросы ждут окончания подмены. False — запросы не завершились за timeout.
+        """
+        with self._idle:
+            if not self._idle.wait_for(lambda: self._readers == 0, timeout):
+                return False
+            self._release()
+            install()
+            self.version += 1
+            self.generation += 1
+        return True
+
+    def _release(self):
+        data, self._data, self._key = self._data, None, None
+        if data is None or not hasattr(data, "close"):
+            return
+        if self._readers:
+            # Снимок ещё читают начатые запросы — закрывается после последнего из них
+            self._retired.append(data)
+        else:
+            self._close(data)
+
+    @staticmethod
+    def _close(data: Any):
+        try:
+            data.close()
+        except Exception as e:
+            logger.warning(f"Failed to close loaded cache: {e}")
@@ -0,0 +1,518 @@
+"""
+Индекс смещений записей JSON-кэша чертежа.
+✅ JSON-кэш пишется потоково: поля заголовка и по одной сущности на строку
+✅ Рядом с несжатым файлом — индекс <cache>.idx: handle → смещение и длина записи в байтах,
+   коды object_name/layer, флаг details_loaded, bounding box XY и строки сущностей каждой категории
+✅ load_cache открывает файл через mmap и декодирует только записи, которых коснулся запрос
+✅ Журнал изменений накладывается поверх индекса без разбора снимка
+"""
+import json
+import math
+import mmap
+import os
+import sys
+import logging
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping, Sequence
+from typing import Optional, Dict, List, Any, Iterable, Iterator, Tuple
+
+from .cache_codec import open_binary
+from .cache_journal import HEADER_FIELDS
+from .cache_layout import CATEGORY_SECTIONS, DerivedSection, entity_category
+from .spatial_index import SpatialGrid
+
+logger = logging.getLogger(__name__)
+
+INDEX_SUFFIX = ".idx"
+INDEX_MAGIC = b"ACADIDX1"
+INDEX_VERSION = 2
+_ALIGN = 8
+# Поля сущности, значения которых хранятся в индексе кодами словаря
+CODED_FIELDS = ("object_name", "layer")
+INDEXED_FIELDS = CODED_FIELDS + ("details_loaded",)
+_NO_BOX = (float("nan"),) * 4
+
+
+def entity_key(entity: Dict[str, Any]) -> List[Any]:
+    """Индексируемые поля сущности: handle, object_name, layer, details_loaded, bounding box XY."""
+    box = entity.get("bounding_box")
+    return [
+        str(entity.get("handle", "UNKNOWN")), entity.get("object_name"), entity.get("layer"),
+        bool(entity.get("details_loaded", True)),
+        [box["min"][0], box["min"][1], box["max"][0], box["max"][1]] if box else None
+    ]
+
+
+class CacheIndexBuilder:
+    """Накопление индекса по мере записи сущностей в файл кэша."""
+
+    def __init__(self):
+        self.fields: Dict[str, Tuple[int, int]] = {}
+        self.snapshot_id: Optional[str] = None
+        self._handles: List[str] = []
+        self._starts = array('Q')
+        self._lengths = array('Q')
+        self._dictionaries: Dict[str, Dict[Any, int]] = {name: {} for name in CODED_FIELDS}
+        self._codes = {name: array('I') for name in CODED_FIELDS}
+        self._details = array('B')
+        # min_x, min_y, max_x, max_y на строку (NaN — без bounding box)
+        self._bbox = array('d')
+        self._categories = {name: array('Q') for name in CATEGORY_SECTIONS}
+
+    def add(self, key: List[Any], start: int, length: int):
+        handle, object_name, layer, details_loaded = key[:4]
+        box = key[4] if len(key) > 4 else None
+        row = len(self._handles)
+        self._handles.append(handle)
+        self._starts.append(start)
+        self._lengths.append(length)
+        for name, value in zip(CODED_FIELDS, (object_name, layer)):
+            table = self._dictionaries[name]
+            self._codes[name].append(table.setdefault(value, len(table)))
+        self._details.append(1 if details_loaded else 0)
+        self._bbox.extend(box if box else _NO_BOX)
+        category = entity_category(object_name)
+        if category is not None:
+            self._categories[category].append(row)
+
+    def write(self, cache_file: str):
+        """Запись индекса рядом с файлом кэша (с его размером и mtime для проверки)."""
+        buffers: List[Any] = []
+        columns: Dict[str, Dict[str, Any]] = {}
+        position = 0
+
+        def add(name: str, buffer: Any, typecode: str):
+            nonlocal position
+            nbytes = len(buffer) * (buffer.itemsize if isinstance(buffer, array) else 1)
+            columns[name] = {"offset": position, "nbytes": nbytes, "typecode": typecode}
+            buffers.append(buffer)
+            padding = (-nbytes) % _ALIGN
+            if padding:
+                buffers.append(bytes(padding))
+            position += nbytes + padding
+
+        add("handles", "\n".join(self._handles).encode('utf-8'), 'B')
+        add("start", self._starts, 'Q')
+        add("length", self._lengths, 'Q')
+        for name in CODED_FIELDS:
+            add(name, self._codes[name], 'I')
+        add("details_loaded", self._details, 'B')
+        add("bbox", self._bbox, 'd')
+        for name in CATEGORY_SECTIONS:
+            add(f"category.{name}", self._categories[name], 'Q')
+
+        stat = os.stat(cache_file)
+        header = json.dumps({
+            "version": INDEX_VERSION,
+            "byteorder": sys.byteorder,
+            "snapshot_id": self.snapshot_id,
+            "cache_size": stat.st_size,
+            "cache_mtime_ns": stat.st_mtime_ns,
+            "count": len(self._handles),
+            "fields": self.fields,
+            "dictionaries": {
+                name: sorted(table, key=table.get) for name, table in self._dictionaries.items()
+            },
+            "columns": columns
+        }, ensure_ascii=False, default=str).encode('utf-8')
+
+        path = cache_file + INDEX_SUFFIX
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(INDEX_MAGIC)
+            f.write(len(header).to_bytes(8, "little"))
+            f.write(header)
+            for buffer in buffers:
+                f.write(buffer)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+
+class JsonCacheWriter:
+    """
+    Потоковая запись JSON-объекта кэша во временный файл с атомарной заменой.
+    Поля верхнего уровня пишутся целиком, сущности — по одной на строку.
+    Для несжатого файла одновременно строится индекс смещений.
+    """
+
+    def __init__(self, path: str, codec: str = "none"):
+        self.path = path
+        self._tmp_path = path + ".tmp"
+        self._file = open_binary(self._tmp_path, 'wb', codec)
+        self._position = 0
+        self._first_key = True
+        self._first_record = True
+        self.index = CacheIndexBuilder() if codec == "none" else None
+
+    def _write(self, data: bytes):
+        self._file.write(data)
+        self._position += len(data)
+
+    def _key(self, key: str):
+        self._write((("{" if self._first_key else ",") + f"\n{json.dumps(key)}: ").encode('utf-8'))
+        self._first_key = False
+
+    def field(self, key: str, value: Any):
+        self._key(key)
+        data = json.dumps(value, ensure_ascii=False, default=str).encode('utf-8')
+        if self.index is not None:
+            self.index.fields[key] = (self._position, len(data))
+            if key == "snapshot_id":
+                self.index.snapshot_id = value
+        self._write(data)
+
+    def begin_entities(self):
+        self._key("entities")
+        self._write(b"[")
+        self._first_record = True
+
+    def entity(self, data: bytes, key: List[Any]):
+        """Запись сущности (байты JSON без перевода строки) с её индексируемыми полями."""
+        self._write(b"\n" if self._first_record else b",\n")
+        self._first_record = False
+        if self.index is not None:
+            self.index.add(key, self._position, len(data))
+        self._write(data)
+
+    def end_entities(self):
+        self._write(b"\n]")
+
+    def close(self):
+        """Завершение файла, fsync, замена кэша и запись (или удаление устаревшего) индекса."""
+        self._write(b"{}\n" if self._first_key else b"\n}\n")
+        self._file.close()
+        with open(self._tmp_path, 'rb+') as f:
+            os.fsync(f.fileno())
+        os.replace(self._tmp_path, self.path)
+        if self.index is not None:
+            self.index.write(self.path)
+        elif os.path.exists(self.path + INDEX_SUFFIX):
+            # Сжатый файл не индексируется: индекс прежнего файла больше не действителен
+            os.remove(self.path + INDEX_SUFFIX)
+
+    def abort(self):
+        self._file.close()
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+
+def write_json_cache(path: str, data: Dict[str, Any], codec: str = "none"):
+    """Запись словаря формата EntityCache.to_dict() (с snapshot_id) в JSON-кэш с индексом."""
+    writer = JsonCacheWriter(path, codec)
+    try:
+        for key, value in data.items():
+            if key != "entities":
+                writer.field(key, value)
+                continue
+            writer.begin_entities()
+            for entity in value:
+                writer.entity(json.dumps(entity, ensure_ascii=False, default=str).encode('utf-8'),
+                              entity_key(entity))
+            writer.end_entities()
+        writer.close()
+    except BaseException:
+        writer.abort()
+        raise
+
+
+class CacheIndex:
+    """Прочитанный индекс: колонки — типизированные массивы, handle — список строк."""
+
+    def __init__(self, header: Dict[str, Any], columns: Dict[str, array], handles: List[str]):
+        self.header = header
+        self.count: int = header["count"]
+        self.fields: Dict[str, List[int]] = header["fields"]
+        self.dictionaries: Dict[str, List[Any]] = header["dictionaries"]
+        self.columns = columns
+        self.handles = handles
+
+
+def load_cache_index(cache_file: str) -> Optional[CacheIndex]:
+    """
+    Индекс файла кэша или None — если индекса нет, он повреждён
+    или относится к другому состоянию файла (размер, mtime).
+    """
+    path = cache_file + INDEX_SUFFIX
+    try:
+        with open(path, 'rb') as f:
+            content = f.read()
+        stat = os.stat(cache_file)
+    except OSError:
+        return None
+    try:
+        if not content.startswith(INDEX_MAGIC):
+            return None
+        header_length = int.from_bytes(content[len(INDEX_MAGIC):len(INDEX_MAGIC) + 8], "little")
+        data_start = len(INDEX_MAGIC) + 8 + header_length
+        header = json.loads(content[len(INDEX_MAGIC) + 8:data_start].decode('utf-8'))
+        if (header.get("version") != INDEX_VERSION or header.get("byteorder") != sys.byteorder
+                or header.get("cache_size") != stat.st_size
+                or header.get("cache_mtime_ns") != stat.st_mtime_ns):
+            return None
+        columns = {}
+        for name, spec in header["columns"].items():
+            start = data_start + spec["offset"]
+            column = array(spec["typecode"])
+            column.frombytes(content[start:start + spec["nbytes"]])
+            columns[name] = column
+        handles_blob = columns.pop("handles").tobytes().decode('utf-8')
+        handles = handles_blob.split("\n") if header["count"] else []
+        return CacheIndex(header, columns, handles)
+    except Exception as e:
+        logger.warning(f"Cache index {path} ignored: {e}")
+        return None
+
+
+class _IndexedSource:
+    """
+    Файл кэша через mmap, его индекс и наложенные изменения журнала.
+    Ссылка на запись: номер строки индекса (< count) или count + номер добавленной записи.
+    """
+
+    def __init__(self, cache_file: str, index: CacheIndex):
+        self.index = index
+        self.count = index.count
+        with open(cache_file, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._starts = index.columns["start"]
+        self._lengths = index.columns["length"]
+        self.overrides: Dict[int, Dict[str, Any]] = {}
+        self.added: List[Dict[str, Any]] = []
+        # Живые ссылки (None — все строки индекса без изменений)
+        self.refs: Optional[array] = None
+        self._positions: Optional[Dict[str, int]] = None
+        self._rows_by_code: Dict[str, List[array]] = {}
+        self._grid: Optional[SpatialGrid] = None
+
+    def raw(self, start: int, length: int) -> bytes:
+        return self._mmap[start:start + length]
+
+    def record(self, ref: int) -> Dict[str, Any]:
+        if ref >= self.count:
+            return self.added[ref - self.count]
+        override = self.overrides.get(ref)
+        if override is not None:
+            return override
+        return json.loads(self._mmap[self._starts[ref]:self._starts[ref] + self._lengths[ref]])
+
+    def changed(self, ref: int) -> bool:
+        """Запись добавлена или заменена журналом (индекс её полей не описывает)."""
+        return ref >= self.count or ref in self.overrides
+
+    def coded(self, field: str) -> Tuple[array, List[Any]]:
+        """Колонка кодов индексируемого поля и значения кодов."""
+        if field == "details_loaded":
+            return self.index.columns[field], [False, True]
+        return self.index.columns[field], self.index.dictionaries[field]
+
+    def rows_by_code(self, field: str) -> List[array]:
+        """Строки индекса по кодам поля (строятся один раз за время жизни загруженного кэша)."""
+        rows = self._rows_by_code.get(field)
+        if rows is None:
+            codes, names = self.coded(field)
+            rows = [array('Q') for _ in names]
+            for row, code in enumerate(codes):
+                rows[code].append(row)
+            self._rows_by_code[field] = rows
+        return rows
+
+    def spatial(self) -> SpatialGrid:
+        """Сетка строк индекса по bounding box, без записей, изменённых журналом."""
+        if self._grid is None:
+            bbox = self.index.columns["bbox"].tolist()
+            self._grid = SpatialGrid.build(
+                (row, tuple(bbox[row * 4:row * 4 + 4])) for row in range(self.count)
+                if not math.isnan(bbox[row * 4]) and row not in self.overrides
+            )
+        return self._grid
+
+    def positions(self) -> Dict[str, int]:
+        """handle → ссылка (строится при первом поиске по handle)."""
+        if self._positions is None:
+            self._positions = {handle: row for row, handle in enumerate(self.index.handles)}
+        return self._positions
+
+    def apply_journal(self, records: List[Dict[str, Any]]):
+        """Наложение записей журнала с той же семантикой, что и CacheJournal.replay()."""
+        if not records:
+            return
+        positions = self.positions()
+        for record in records:
+            for handle in record.get("erase", []):
+                ref = positions.pop(handle, None)
+                if ref is not None:
+                    self.overrides.pop(ref, None)
+            for item in record.get("entities", []):
+                handle = item.get("handle")
+                ref = positions.get(handle)
+                if ref is None:
+                    positions[handle] = self.count + len(self.added)
+                    self.added.append(item)
+                elif ref >= self.count:
+                    self.added[ref - self.count] = item
+                else:
+                    self.overrides[ref] = item
+        self.refs = array('Q', sorted(positions.values()))
+
+    def close(self):
+        self._mmap.close()
+
+
+class IndexedEntities(Sequence):
+    """
+    Ленивая последовательность сущностей индексированного JSON-кэша.
+    where()/value_counts() по object_name, layer и details_loaded работают по индексу,
+    in_bbox() — по сетке колонки bbox, find() — поиск по handle без чтения других записей.
+    """
+
+    def __init__(self, source: _IndexedSource, refs: Optional[array] = None):
+        self._source = source
+        self._refs = refs
+
+    def _all_refs(self) -> Iterable[int]:
+        if self._refs is not None:
+            return self._refs
+        return self._source.refs if self._source.refs is not None else range(self._source.count)
+
+    def __len__(self) -> int:
+        return len(self._all_refs())
+
+    def __getitem__(self, position):
+        refs = self._all_refs()
+        if isinstance(position, slice):
+            return [self._source.record(ref) for ref in refs[position]]
+        return self._source.record(refs[position])
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for ref in self._all_refs():
+            yield self._source.record(ref)
+
+    def _select(self, predicate) -> "IndexedEntities":
+        return IndexedEntities(self._source, array('Q', (ref for ref in self._all_refs() if predicate(ref))))
+
+    def where(self, field: str, value: Any) -> "IndexedEntities":
+        """Подвыборка по равенству поля (индексируемые поля — без декодирования записей)."""
+        if field == "details_loaded":
+            value = bool(value)
+        return self.where_in(field, [value])
+
+    def where_in(self, field: str, values: Iterable[Any]) -> "IndexedEntities":
+        """Подвыборка по вхождению значения поля в values."""
+        wanted = set(values)
+        source = self._source
+        if field not in INDEXED_FIELDS:
+            return self._select(lambda ref: source.record(ref).get(field) in wanted)
+        codes, names = source.coded(field)
+        wanted_codes = {code for code, name in enumerate(names) if name in wanted}
+        if self._refs is None and source.refs is None:
+            # Весь файл без изменений журнала: готовые списки строк по значению
+            rows_by_code = source.rows_by_code(field)
+            selected = [rows_by_code[code] for code in sorted(wanted_codes)]
+            if len(selected) == 1:
+                return IndexedEntities(source, selected[0])
+            return IndexedEntities(source, array('Q', sorted(row for rows in selected for row in rows)))
+        return self._select(
+            lambda ref: source.record(ref).get(field) in wanted if source.changed(ref) else codes[ref] in wanted_codes
+        )
+
+    def category(self, section: str) -> "IndexedEntities":
+        """Сущности категории: готовые строки индекса, если журнал их не изменил."""
+        source = self._source
+        if self._refs is None and source.refs is None:
+            return IndexedEntities(source, source.index.columns[f"category.{section}"])
+        names = [name for name in source.index.dictionaries["object_name"] if entity_category(name) == section]
+        return self.where_in("object_name", names + [
+            item.get("object_name") for item in list(source.overrides.values()) + source.added
+            if entity_category(item.get("object_name")) == section
+        ])
+
+    def value_counts(self, field: str) -> Dict[Any, int]:
+        """Количество сущностей по значениям поля в порядке первого появления (индексируемые — по кодам)."""
+        source = self._source
+        counts: Dict[Any, int] = {}
+        if field not in INDEXED_FIELDS:
+            for entity in self:
+                key = entity.get(field, "Unknown")
+                counts[key] = counts.get(key, 0) + 1
+            return counts
+        codes, names = source.coded(field)
+        for ref in self._all_refs():
+            key = source.record(ref).get(field) if source.changed(ref) else names[codes[ref]]
+            counts[key] = counts.get(key, 0) + 1
+        return counts
+
+    def _contains(self, ref: int) -> bool:
+        for refs in (self._source.refs, self._refs):
+            if refs is not None:
+                position = bisect_left(refs, ref)
+                if position == len(refs) or refs[position] != ref:
+                    return False
+        return True
+
+    def in_bbox(self, min_x: float, min_y: float, max_x: float, max_y: float) -> "IndexedEntities":
+        """Подвыборка сущностей, чей bounding box пересекает область XY (по сетке индекса)."""
+        source = self._source
+        refs = [ref for ref in source.spatial().query(min_x, min_y, max_x, max_y) if self._contains(ref)]
+        # Записи журнала индекс не описывает — они проверяются по содержимому
+        changed = list(source.overrides) + list(range(source.count, source.count + len(source.added)))
+        for ref in changed:
+            box = source.record(ref).get("bounding_box")
+            if box and self._contains(ref) and box["max"][0] >= min_x and box["min"][0] <= max_x \
+                    and box["max"][1] >= min_y and box["min"][1] <= max_y:
+                refs.append(ref)
+        return IndexedEntities(source, array('Q', sorted(refs)))
+
+    def find(self, handle: str) -> Optional[Dict[str, Any]]:
+        """Поиск сущности по handle через индекс."""
+        ref = self._source.positions().get(handle)
+        if ref is None:
+            return None
+        if self._refs is not None:
+            position = bisect_left(self._refs, ref)
+            if position == len(self._refs) or self._refs[position] != ref:
+                return None
+        return self._source.record(ref)
+
+
+class IndexedJsonCache(Mapping):
+    """
+    Несжатый JSON-кэш с индексом в интерфейсе словаря load_cache().
+    Поля заголовка декодируются по смещениям, сущности и категории — лениво.
+    """
+
+    def __init__(self, cache_file: str, index: CacheIndex, journal_records: Optional[List[Dict[str, Any]]] = None):
+        self._source = _IndexedSource(cache_file, index)
+        try:
+            self._values: Dict[str, Any] = {
+                name: json.loads(self._source.raw(start, length))
+                for name, (start, length) in index.fields.items()
+            }
+            if self._values.get("snapshot_id") != index.header.get("snapshot_id"):
+                raise ValueError("cache index belongs to another snapshot")
+            for record in journal_records or []:
+                for name in HEADER_FIELDS:
+                    if name in record:
+                        self._values[name] = record[name]
+            self._source.apply_journal(journal_records or [])
+        except Exception:
+            self._source.close()
+            raise
+        self._values["entities"] = IndexedEntities(self._source)
+        for name in CATEGORY_SECTIONS:
+            self._values[name] = DerivedSection(
+                self._values["entities"], name, self._values.get("block_definitions", [])
+            )
+
+    def __getitem__(self, key: str) -> Any:
+        return self._values[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._values)
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def close(self):
+        self._source.close()
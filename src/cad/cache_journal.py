@@ -0,0 +1,136 @@
+"""
+Журнал инкрементальных изменений кэша чертежа.
+✅ Базовый снимок пишется атомарно (временный файл и переименование)
+✅ Добавленные, изменённые и удалённые объекты дописываются в журнал (JSON Lines)
+✅ load_cache применяет журнал к снимку; при росте журнала он сворачивается в снимок
+✅ Записи журнала привязаны к snapshot_id снимка — журнал старого снимка не применяется
+"""
+import json
+import os
+import uuid
+import logging
+from typing import Optional, Dict, List, Any
+
+from .cache_codec import open_text
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_SUFFIX = ".journal"
+# Секции, записи которых заменяются по handle (категории строятся из entities при загрузке)
+SECTIONS = ("entities",)
+# Поля снимка, которые запись журнала заменяет целиком
+HEADER_FIELDS = ("metadata", "last_updated", "layers", "block_definitions")
+
+
+def new_snapshot_id() -> str:
+    """Идентификатор нового базового снимка."""
+    return uuid.uuid4().hex
+
+
+def write_json_atomic(path: str, data: Dict[str, Any], indent: Optional[int] = None, codec: str = "none"):
+    """Запись JSON (при необходимости сжатого) через временный файл и переименование."""
+    tmp_path = path + ".tmp"
+    with open_text(tmp_path, 'wt', codec) as f:
+        json.dump(data, f, indent=indent, ensure_ascii=False, default=str)
+    with open(tmp_path, 'rb+') as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class CacheJournal:
+    """
+    Журнал изменений рядом с файлом кэша (<cache_file>.journal).
+    Каждая строка — одно обновление: новые версии сущностей,
+    удалённые handle и заменённые поля заголовка.
+    """
+
+    def __init__(self, cache_file: str):
+        self.cache_file = cache_file
+        self.path = cache_file + JOURNAL_SUFFIX
+        self.compact_ratio = float(os.getenv("CACHE_JOURNAL_COMPACT_RATIO", "0.25"))
+
+    def size(self) -> int:
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    def append(self, snapshot_id: str, record: Dict[str, Any]):
+        """Дописывание записи с принудительным сбросом на диск."""
+        line = json.dumps({"snapshot_id": snapshot_id, **record}, ensure_ascii=False, default=str)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(line + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def needs_compaction(self) -> bool:
+        """Журнал вырос больше compact_ratio от размера снимка."""
+        try:
+            base_size = os.path.getsize(self.cache_file)
+        except OSError:
+            return True
+        return self.size() > base_size * self.compact_ratio
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def records(self, snapshot_id: Optional[str]) -> List[Dict[str, Any]]:
+        """Записи журнала, относящиеся к снимку snapshot_id (повреждённые строки пропускаются)."""
+        if not snapshot_id or not os.path.exists(self.path):
+            return []
+        records = []
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for number, line in enumerate(f, 1):
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    logger.warning(f"Skipping damaged journal line {number} in {self.path}")
+                    continue
+                if record.get("snapshot_id") == snapshot_id:
+                    records.append(record)
+        return records
+
+    def replay(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Применение журнала к загруженному снимку (изменяет data).
+        Записи другого снимка и оборванная последняя строка пропускаются.
+        """
+        records = self.records(data.get("snapshot_id"))
+        if not records:
+            return data
+
+        positions = {
+            name: {item.get("handle"): index for index, item in enumerate(data.get(name, []))}
+            for name in SECTIONS
+        }
+        for record in records:
+            self._apply(data, positions, record)
+
+        # Удалённые записи помечены None и выбрасываются один раз в конце
+        for name in SECTIONS:
+            data[name] = [item for item in data.get(name, []) if item is not None]
+        logger.info(f"📒 Cache journal replayed: {len(records)} updates")
+        return data
+
+    @staticmethod
+    def _apply(data: Dict[str, Any], positions: Dict[str, Dict[str, int]], record: Dict[str, Any]):
+        for name in SECTIONS:
+            items = data.setdefault(name, [])
+            index = positions[name]
+            for handle in record.get("erase", []):
+                position = index.pop(handle, None)
+                if position is not None:
+                    items[position] = None
+            for item in record.get(name, []):
+                handle = item.get("handle")
+                position = index.get(handle)
+                if position is not None:
+                    items[position] = item
+                else:
+                    index[handle] = len(items)
+                    items.append(item)
+
+        for field in HEADER_FIELDS:
+            if field in record:
+                data[field] = record[field]
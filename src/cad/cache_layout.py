@@ -0,0 +1,259 @@
+"""
+Нормализованная структура файла кэша.
+✅ Каждая сущность хранится один раз — в секции entities
+✅ Секции blocks/texts/dimensions не сохраняются, а строятся из сущностей при загрузке
+✅ Для ленивых форматов (колоночный, SQLite) категории строятся при обращении к записи
+✅ Сущности разобранного целиком JSON отвечают на фильтры по хэш-индексам (EntityRecords)
+✅ Поиск по области — по пространственной сетке bounding box (EntityRecords.in_bbox)
+"""
+import logging
+from collections.abc import Sequence
+from typing import Optional, Dict, List, Any, Iterable, Tuple, Union
+
+from .dataclasses import (
+    EntityProperties, BlockReference, TextEntity, DimensionEntity, BlockDefinition
+)
+from .geometry_analysis import GeometryAnalyzer
+from .spatial_index import SpatialGrid
+
+logger = logging.getLogger(__name__)
+
+CATEGORY_SECTIONS = ("blocks", "texts", "dimensions")
+TEXT_OBJECT_NAMES = ("AcDbText", "AcDbMText")
+# Поля записей сущностей с хэш-индексом в EntityRecords
+HASHED_FIELDS = ("object_name", "layer")
+
+CategoryRecord = Union[BlockReference, TextEntity, DimensionEntity]
+
+
+def entity_category(object_name: Optional[str]) -> Optional[str]:
+    """Секция категории по ObjectName (None — сущность вне категорий)."""
+    name = str(object_name or "")
+    if name == "AcDbBlockReference":
+        return "blocks"
+    if name in TEXT_OBJECT_NAMES:
+        return "texts"
+    if "AcDbDimension" in name:
+        return "dimensions"
+    return None
+
+
+def definition_origins(definitions: Iterable[Union[BlockDefinition, Dict[str, Any]]]) -> Dict[str, List[float]]:
+    """Базовые точки определений блоков по имени (нужны для transform вставок)."""
+    origins = {}
+    for definition in definitions:
+        if isinstance(definition, dict):
+            origins[definition.get("name")] = definition.get("origin") or [0.0, 0.0, 0.0]
+        else:
+            origins[definition.name] = definition.origin
+    return origins
+
+
+def convert_to_block(entity: EntityProperties, origins: Dict[str, List[float]]) -> BlockReference:
+    """Конвертация в BlockReference."""
+    tp = entity.type_properties
+    scale = tp.get("scale_factors", {"x": 1, "y": 1, "z": 1})
+    name = tp.get("block_name", "")
+    origin = origins.get(name)
+    insertion = entity.coordinates.insertion or [0, 0, 0]
+    return BlockReference(
+        handle=entity.handle,
+        name=name,
+        effective_name=tp.get("effective_name", ""),
+        layer=entity.layer,
+        insertion_point=insertion,
+        scale_x=scale.get("x", 1),
+        scale_y=scale.get("y", 1),
+        scale_z=scale.get("z", 1),
+        rotation=tp.get("rotation", 0),
+        attributes=tp.get("attributes", []),
+        definition=name if origin is not None else None,
+        transform=GeometryAnalyzer.block_transform(
+            insertion, scale, tp.get("rotation", 0), origin
+        ) if origin is not None else None
+    )
+
+
+def convert_to_text(entity: EntityProperties) -> TextEntity:
+    """Конвертация в TextEntity."""
+    tp = entity.type_properties
+    return TextEntity(
+        handle=entity.handle,
+        text=tp.get("text_string", ""),
+        layer=entity.layer,
+        height=tp.get("height", 0),
+        style=tp.get("style_name", ""),
+        position=entity.coordinates.insertion or entity.coordinates.center or [0, 0, 0],
+        rotation=tp.get("rotation", 0),
+        width=tp.get("width"),
+        attachment_point=tp.get("attachment_point")
+    )
+
+
+def convert_to_dimension(entity: EntityProperties) -> DimensionEntity:
+    """Конвертация в DimensionEntity."""
+    tp = entity.type_properties
+    return DimensionEntity(
+        handle=entity.handle,
+        dim_type=tp.get("dimension_type", 0),
+        measurement=tp.get("measurement", 0),
+        text=tp.get("text_string", ""),
+        style=tp.get("style_name", ""),
+        scale_factor=tp.get("linear_scale_factor", 1),
+        position=entity.coordinates.center or [0, 0, 0],
+        rotation=tp.get("rotation", 0)
+    )
+
+
+def category_record(entity: EntityProperties,
+                    origins: Dict[str, List[float]]) -> Optional[Tuple[str, CategoryRecord]]:
+    """Секция и запись категории для сущности (None — вне категорий)."""
+    section = entity_category(entity.object_name)
+    if section == "blocks":
+        return section, convert_to_block(entity, origins)
+    if section == "texts":
+        return section, convert_to_text(entity)
+    if section == "dimensions":
+        return section, convert_to_dimension(entity)
+    return None
+
+
+def _record_dict(entity: Dict[str, Any], origins: Dict[str, List[float]]) -> Optional[Tuple[str, Dict[str, Any]]]:
+    result = category_record(EntityProperties.from_dict(entity), origins)
+    return (result[0], result[1].to_dict()) if result else None
+
+
+class EntityRecords(list):
+    """
+    Записи сущностей JSON-кэша, разобранного целиком, с хэш-индексами
+    (слой, тип, имя блока, handle → позиции) и сеткой bounding box. Индекс строится
+    при первом запросе за один проход; фильтры затем стоят O(результата).
+    Записи не должны изменяться.
+    """
+
+    def __init__(self, records: Iterable[Dict[str, Any]] = ()):
+        super().__init__(records)
+        self._hashes: Dict[str, Dict[Any, List[int]]] = {}
+        self._grid: Optional[SpatialGrid] = None
+
+    def _hash(self, field: str) -> Dict[Any, List[int]]:
+        index = self._hashes.get(field)
+        if index is None:
+            index = {}
+            if field == "block":
+                for position, entity in enumerate(self):
+                    tp = entity.get("type_properties") or {}
+                    for name in {tp.get("block_name"), tp.get("effective_name")} - {None, ""}:
+                        index.setdefault(name, []).append(position)
+            else:
+                for position, entity in enumerate(self):
+                    index.setdefault(entity.get(field), []).append(position)
+            self._hashes[field] = index
+        return index
+
+    def _rows(self, positions: Iterable[int]) -> "EntityRecords":
+        return EntityRecords(self[position] for position in positions)
+
+    def where(self, field: str, value: Any) -> List[Dict[str, Any]]:
+        """Записи с field == value."""
+        if field not in HASHED_FIELDS:
+            return EntityRecords(e for e in self if e.get(field) == value)
+        return self._rows(self._hash(field).get(value, ()))
+
+    def where_in(self, field: str, values: Iterable[Any]) -> List[Dict[str, Any]]:
+        """Записи, у которых значение field входит в values (в порядке файла)."""
+        wanted = set(values)
+        if field not in HASHED_FIELDS:
+            return EntityRecords(e for e in self if e.get(field) in wanted)
+        index = self._hash(field)
+        return self._rows(sorted(p for value in wanted for p in index.get(value, ())))
+
+    def with_block(self, name: str) -> List[Dict[str, Any]]:
+        """Вставки блока по имени или эффективному имени."""
+        return self._rows(self._hash("block").get(name, ()))
+
+    def value_counts(self, field: str) -> Dict[Any, int]:
+        """Количество записей по значениям поля в порядке первого появления."""
+        if field not in HASHED_FIELDS:
+            counts: Dict[Any, int] = {}
+            for entity in self:
+                key = entity.get(field, "Unknown")
+                counts[key] = counts.get(key, 0) + 1
+            return counts
+        return {key: len(positions) for key, positions in self._hash(field).items()}
+
+    def find(self, handle: str) -> Optional[Dict[str, Any]]:
+        """Запись по handle."""
+        positions = self._hash("handle").get(handle)
+        return self[positions[0]] if positions else None
+
+    def in_bbox(self, min_x: float, min_y: float, max_x: float, max_y: float) -> List[Dict[str, Any]]:
+        """Записи, чей bounding box пересекает область XY (в порядке файла)."""
+        if self._grid is None:
+            boxes = []
+            for position, entity in enumerate(self):
+                box = entity.get("bounding_box")
+                if box:
+                    boxes.append((position, (box["min"][0], box["min"][1], box["max"][0], box["max"][1])))
+            self._grid = SpatialGrid.build(boxes)
+        return self._rows(self._grid.query(min_x, min_y, max_x, max_y))
+
+
+def derive_sections(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Построение секций категорий загруженного JSON-кэша из entities (изменяет data).
+    Секции старых файлов, где они ещё хранились, заменяются построенными;
+    entities оборачиваются в EntityRecords.
+    """
+    data["entities"] = EntityRecords(data.get("entities", []))
+    origins = definition_origins(data.get("block_definitions", []))
+    sections: Dict[str, List[Dict[str, Any]]] = {name: [] for name in CATEGORY_SECTIONS}
+    for entity in data.get("entities", []):
+        if entity_category(entity.get("object_name")) is None:
+            continue
+        result = _record_dict(entity, origins)
+        if result:
+            sections[result[0]].append(result[1])
+    data.update(sections)
+    return data
+
+
+class DerivedSection(Sequence):
+    """
+    Ленивая секция категории поверх выборки сущностей колоночного файла или базы SQLite:
+    запись категории строится при обращении к элементу.
+    """
+
+    def __init__(self, entities, section: str, block_definitions: List[Dict[str, Any]]):
+        self._all = entities
+        self._section = section
+        self._origins = definition_origins(block_definitions)
+        self._selected = None
+
+    @property
+    def _entities(self):
+        """Выборка сущностей категории (строится при первом обращении)."""
+        if self._selected is None:
+            if hasattr(self._all, "category"):
+                # Индексированный JSON-кэш хранит строки категорий готовыми
+                self._selected = self._all.category(self._section)
+            else:
+                names = [name for name in self._all.value_counts("object_name")
+                         if entity_category(name) == self._section]
+                self._selected = self._all.where_in("object_name", names)
+        return self._selected
+
+    def __len__(self) -> int:
+        return len(self._entities)
+
+    def _convert(self, entity: Dict[str, Any]) -> Dict[str, Any]:
+        return _record_dict(entity, self._origins)[1]
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self._convert(e) for e in self._entities[position]]
+        return self._convert(self._entities[position])
+
+    def __iter__(self):
+        for entity in self._entities:
+            yield self._convert(entity)
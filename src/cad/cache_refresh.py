@@ -0,0 +1,151 @@
+"""
+Фоновое обновление кэша чертежа.
+✅ Полное сканирование в отдельном потоке со своим COM-апартаментом и прокси AutoCAD
+✅ Запросы всё это время читают текущий снимок; новый подменяет его атомарно (второй буфер)
+✅ Запуск по запросу, по таймеру (CACHE_REFRESH_INTERVAL) или при изменении DWG на диске
+"""
+import os
+import threading
+import time
+import logging
+from typing import Optional
+
+from .autocad_client import AutoCADClient
+from .drawing_cache import DrawingCache
+from .cache_freshness import STALE
+
+try:
+    import pythoncom
+except ImportError:
+    pythoncom = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POLL_SECONDS = 5.0
+
+
+def background_refresh_enabled() -> bool:
+    """Фоновое обновление кэша из CACHE_BACKGROUND_REFRESH (1 — включено, по умолчанию выключено)."""
+    return os.getenv("CACHE_BACKGROUND_REFRESH", "0") == "1"
+
+
+def _seconds(name: str, default: float) -> float:
+    try:
+        return max(0.0, float(os.getenv(name, str(default))))
+    except ValueError:
+        return default
+
+
+class BackgroundCacheRefresher:
+    """
+    Поток фонового обновления: пересобирает кэш через DrawingCache.rebuild_snapshot().
+    Каждые poll секунд проверяет отпечаток DWG; обновление запускается, если DWG
+    изменился, истёк interval (0 — без таймера) или вызван request().
+    """
+
+    def __init__(self, client: AutoCADClient, extraction_workers: int = 1,
+                 interval: Optional[float] = None, poll: Optional[float] = None):
+        self.client = client
+        self.extraction_workers = extraction_workers
+        self.interval = _seconds("CACHE_REFRESH_INTERVAL", 0.0) if interval is None else interval
+        self.poll = _seconds("CACHE_REFRESH_POLL", DEFAULT_POLL_SECONDS) if poll is None else poll
+        self.refreshes = 0
+        self.failures = 0
+        self._requested = False
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        # Установлен, когда запрошенных или выполняемых обновлений нет
+        self._idle = threading.Event()
+        self._idle.set()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def refreshing(self) -> bool:
+        """Обновление запрошено или выполняется."""
+        return not self._idle.is_set()
+
+    def start(self):
+        """Запуск потока; Application маршалится в его апартамент."""
+        if self.running:
+            return
+        self._stop.clear()
+        marshalled = self.client.marshal_application()
+        self._thread = threading.Thread(
+            target=self._run, args=(marshalled,), name="acad-cache-refresh", daemon=True
+        )
+        self._thread.start()
+        logger.info(f"🔁 Background cache refresh started (poll {self.poll:g}s, interval {self.interval:g}s)")
+
+    def stop(self, timeout: Optional[float] = None):
+        """Остановка потока (начатое сканирование завершается, прерванное продолжится с контрольной точки)."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def request(self):
+        """Запрос полного обновления; вызывающий поток не ждёт."""
+        with self._lock:
+            self._requested = True
+            self._idle.clear()
+        self._wake.set()
+
+    def check(self) -> str:
+        """Проверка актуальности текущего снимка; устаревший обновляется в фоне. Возвращает статус."""
+        status = DrawingCache.cache_status(DrawingCache.load_cache())
+        if status == STALE and not self.refreshing:
+            self.request()
+        return status
+
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        """Ожидание завершения запрошенных обновлений."""
+        return self._idle.wait(timeout)
+
+    def _due(self, last: float) -> bool:
+        if self._requested:
+            return True
+        if self.interval and time.monotonic() - last >= self.interval:
+            return True
+        try:
+            return DrawingCache.cache_status(DrawingCache.load_cache()) == STALE
+        except Exception as e:
+            logger.warning(f"Cache freshness check failed: {e}")
+            return False
+
+    def _refresh(self, cache: DrawingCache):
+        try:
+            if cache.rebuild_snapshot():
+                self.refreshes += 1
+                return
+        except Exception as e:
+            logger.error(f"❌ Background cache refresh error: {e}", exc_info=True)
+        self.failures += 1
+
+    def _run(self, marshalled):
+        if pythoncom is not None:
+            pythoncom.CoInitialize()
+        try:
+            cache = DrawingCache(self.client.thread_client(marshalled), self.extraction_workers)
+            last = time.monotonic()
+            while not self._stop.is_set():
+                self._wake.wait(self.poll or None)
+                self._wake.clear()
+                if self._stop.is_set():
+                    break
+                if self._due(last):
+                    with self._lock:
+                        self._requested = False
+                    self._refresh(cache)
+                    last = time.monotonic()
+                with self._lock:
+                    if not self._requested:
+                        self._idle.set()
+        finally:
+            if pythoncom is not None:
+                pythoncom.CoUninitialize()
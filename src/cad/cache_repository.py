@@ -0,0 +1,186 @@
+"""
+Репозиторий кэшей нескольких чертежей.
+✅ Отдельный каталог кэша на каждый чертёж (ключ — нормализованный путь DWG)
+✅ Отпечаток файла DWG (DrawingFingerprint) сохраняется при записи кэша
+✅ Бюджет размера на диске и вытеснение давно не использованных кэшей (LRU)
+✅ Текущий чертёж хранится в индексе — load_cache() без AutoCAD читает последний выбранный
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import logging
+from typing import Optional, Dict, List, Any
+
+from .cache_journal import write_json_atomic
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = "index.json"
+DEFAULT_MAX_SIZE_MB = 2048
+# Не чаще этого интервала (секунды) обновляется last_used при повторном выборе чертежа
+_TOUCH_INTERVAL = 60.0
+
+
+def drawing_key(drawing_path: str) -> str:
+    """Ключ чертежа: хэш нормализованного пути и читаемое имя файла."""
+    normalized = os.path.normcase(os.path.normpath(drawing_path.replace("\\", "/")))
+    digest = hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:16]
+    stem = re.sub(r"[^\w.-]+", "_", os.path.splitext(os.path.basename(normalized))[0])[:40]
+    return f"{stem}_{digest}" if stem else digest
+
+
+def _directory_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class CacheRepository:
+    """
+    Каталог с кэшами чертежей: <root>/<key>/drawing_cache.* и index.json.
+    Индекс хранит путь, отпечаток DWG, размер и время последнего использования записей.
+    """
+
+    def __init__(self, root: str, max_bytes: int = DEFAULT_MAX_SIZE_MB * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(root, INDEX_FILE)
+        self._lock = threading.RLock()
+        self._index: Dict[str, Any] = {}
+        self._index_mtime: Optional[int] = None
+
+    def _load_index(self) -> Dict[str, Any]:
+        """Индекс перечитывается, только если файл изменился (его может писать другой процесс)."""
+        try:
+            mtime = os.stat(self.index_path).st_mtime_ns
+        except OSError:
+            self._index, self._index_mtime = {"current": None, "entries": {}}, None
+            return self._index
+        if mtime != self._index_mtime:
+            try:
+                with open(self.index_path, 'r', encoding='utf-8') as f:
+                    self._index = json.load(f)
+                self._index.setdefault("entries", {})
+            except Exception as e:
+                logger.warning(f"Cache repository index is damaged, starting a new one: {e}")
+                self._index = {"current": None, "entries": {}}
+            self._index_mtime = mtime
+        return self._index
+
+    def _save_index(self):
+        os.makedirs(self.root, exist_ok=True)
+        write_json_atomic(self.index_path, self._index, indent=2)
+        self._index_mtime = os.stat(self.index_path).st_mtime_ns
+
+    def entry_dir(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def current_key(self) -> Optional[str]:
+        with self._lock:
+            return self._load_index().get("current")
+
+    def current_dir(self) -> Optional[str]:
+        """Каталог текущего чертежа (None — чертёж ещё не выбирался)."""
+        key = self.current_key()
+        return self.entry_dir(key) if key else None
+
+    def entry(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._load_index()["entries"].get(key)
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """Записи, начиная с последней использованной."""
+        with self._lock:
+            items = [dict(value, key=key) for key, value in self._load_index()["entries"].items()]
+        return sorted(items, key=lambda item: item.get("last_used", 0), reverse=True)
+
+    def select(self, drawing_path: str, drawing_name: Optional[str] = None) -> str:
+        """Выбор чертежа текущим: запись создаётся при первом обращении. Возвращает ключ."""
+        key = drawing_key(drawing_path)
+        with self._lock:
+            index = self._load_index()
+            entry = index["entries"].setdefault(key, {
+                "drawing_path": drawing_path,
+                "drawing_name": drawing_name or os.path.basename(drawing_path),
+                "fingerprint": None,
+                "size": 0
+            })
+            changed = index.get("current") != key
+            if not changed and time.time() - entry.get("last_used", 0) < _TOUCH_INTERVAL:
+                # Повторный выбор того же чертежа не переписывает индекс на каждом запросе
+                return key
+            entry["last_used"] = time.time()
+            index["current"] = key
+            os.makedirs(self.entry_dir(key), exist_ok=True)
+            self._save_index()
+        if changed:
+            logger.info(f"🗂️ Active drawing cache: {entry['drawing_name']} ({key})")
+        return key
+
+    def record_write(self, key: str, fingerprint: Optional[Dict[str, Any]] = None):
+        """
+        Учёт записи кэша: отпечаток DWG (None — прежний), размер каталога;
+        затем вытеснение по бюджету.
+        """
+        with self._lock:
+            index = self._load_index()
+            entry = index["entries"].get(key)
+            if entry is None:
+                return
+            if fingerprint is not None:
+                entry["fingerprint"] = fingerprint
+            entry["size"] = _directory_size(self.entry_dir(key))
+            entry["last_used"] = time.time()
+            entry["written"] = time.time()
+            self._save_index()
+            self.evict()
+
+    def evict(self) -> List[str]:
+        """Удаление давно не использованных кэшей, пока сумма размеров больше бюджета."""
+        removed = []
+        with self._lock:
+            index = self._load_index()
+            entries = index["entries"]
+            total = sum(e.get("size", 0) for e in entries.values())
+            for key in sorted(entries, key=lambda k: entries[k].get("last_used", 0)):
+                if total <= self.max_bytes:
+                    break
+                if key == index.get("current"):
+                    continue
+                total -= entries[key].get("size", 0)
+                shutil.rmtree(self.entry_dir(key), ignore_errors=True)
+                logger.info(f"🧹 Evicted drawing cache {entries[key].get('drawing_name')} ({key})")
+                del entries[key]
+                removed.append(key)
+            if removed:
+                self._save_index()
+        return removed
+
+
+_repositories: Dict[str, CacheRepository] = {}
+
+
+def cache_repository() -> Optional[CacheRepository]:
+    """
+    Репозиторий из CACHE_DIR и CACHE_MAX_SIZE_MB.
+    Без CACHE_DIR используется один файл кэша в рабочем каталоге.
+    """
+    root = os.getenv("CACHE_DIR", "").strip()
+    if not root:
+        return None
+    max_bytes = int(float(os.getenv("CACHE_MAX_SIZE_MB", str(DEFAULT_MAX_SIZE_MB))) * 1024 * 1024)
+    root = os.path.abspath(root)
+    repository = _repositories.get(root)
+    if repository is None:
+        repository = _repositories[root] = CacheRepository(root, max_bytes)
+    repository.max_bytes = max_bytes
+    return repository
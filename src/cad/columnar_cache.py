@@ -0,0 +1,420 @@
+"""
+Бинарный колоночный формат кэша чертежа с загрузкой через mmap.
+✅ Числовые колонки (bounding box, area, length, color...) — упакованные типизированные массивы
+✅ Строковые колонки (layer, object_name, linetype) — коды в словаре строк
+✅ Вершины полилиний и сплайнов — общая колонка float64 со смещениями (без JSON)
+✅ Остальные поля сущности — JSON-блоб на строку, декодируется только при обращении
+✅ Загрузка через mmap: с диска читаются только колонки, которых коснулся запрос
+✅ Поиск по области — по пространственной сетке, построенной из колонки bbox
+"""
+import json
+import math
+import mmap
+import os
+import sys
+import logging
+from array import array
+from collections.abc import Mapping, Sequence
+from typing import Optional, Dict, List, Any, Iterable, Iterator, Union
+
+from .dataclasses import BoundingBox, vertex_array
+from .cache_layout import CATEGORY_SECTIONS, DerivedSection
+from .spatial_index import SpatialGrid
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"ACADCOL1"
+FORMAT_VERSION = 3
+# Версия 1 дополнительно хранила секции blocks/texts/dimensions — при чтении они не используются;
+# до версии 3 вершины лежали в JSON-блобе coordinates
+READABLE_VERSIONS = (1, 2, 3)
+_ALIGN = 8
+# Значение None в int-колонках
+INT_NONE = -2 ** 31
+
+# Колонки словарного кодирования и числовые колонки: (имя, typecode)
+STRING_COLUMNS = ("layer", "object_name", "linetype")
+FLOAT_COLUMNS = ("area", "length", "volume")
+INT_COLUMNS = ("color", "lineweight")
+FLAG_COLUMNS = ("visible", "details_loaded")
+# Поля, которые хранятся в JSON-блобе строки
+REST_FIELDS = ("transparency", "coordinates", "xdata", "extension_dict", "type_properties", "error")
+
+
+def is_columnar_file(path: str) -> bool:
+    """Проверка сигнатуры колоночного файла."""
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+class _BlobColumn:
+    """Колонка байтовых строк переменной длины: смещения + данные."""
+
+    def __init__(self):
+        self.offsets = array('Q', [0])
+        self.data = bytearray()
+
+    def append(self, value: bytes):
+        self.data += value
+        self.offsets.append(len(self.data))
+
+
+class _VertexColumn:
+    """Вершины всех строк подряд (float64) и смещения строк в числах."""
+
+    def __init__(self):
+        self.offsets = array('Q', [0])
+        self.data = array('d')
+
+    def append(self, vertices: Any):
+        if vertices:
+            self.data.extend(vertex_array(vertices))
+        self.offsets.append(len(self.data))
+
+
+class ColumnarCacheBuilder:
+    """
+    Накопление сущностей по колонкам и запись файла.
+    Колонки компактны (типизированные массивы), поэтому строятся в памяти
+    даже для больших чертежей; исходные словари сущностей не удерживаются.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self._dictionaries: Dict[str, Dict[str, int]] = {name: {} for name in STRING_COLUMNS}
+        self._codes = {name: array('I') for name in STRING_COLUMNS}
+        self._floats = {name: array('d') for name in FLOAT_COLUMNS}
+        self._ints = {name: array('i') for name in INT_COLUMNS}
+        self._flags = {name: array('B') for name in FLAG_COLUMNS}
+        self._bbox = array('d')
+        self._handles = _BlobColumn()
+        self._rest = _BlobColumn()
+        self._vertices = _VertexColumn()
+
+    def add_entity(self, entity: Dict[str, Any]):
+        """Добавление сущности в формате EntityProperties.to_dict()."""
+        self._handles.append(str(entity.get("handle", "UNKNOWN")).encode('utf-8'))
+        for name in STRING_COLUMNS:
+            value = str(entity.get(name, ""))
+            table = self._dictionaries[name]
+            code = table.get(value)
+            if code is None:
+                code = table[value] = len(table)
+            self._codes[name].append(code)
+        for name in FLOAT_COLUMNS:
+            value = entity.get(name)
+            self._floats[name].append(float(value) if value is not None else math.nan)
+        for name in INT_COLUMNS:
+            value = entity.get(name)
+            self._ints[name].append(int(value) if value is not None else INT_NONE)
+        self._flags["visible"].append(1 if entity.get("visible", True) else 0)
+        self._flags["details_loaded"].append(1 if entity.get("details_loaded", True) else 0)
+
+        bbox = entity.get("bounding_box")
+        if bbox:
+            self._bbox.extend(float(v) for v in list(bbox["min"]) + list(bbox["max"]))
+        else:
+            self._bbox.extend([math.nan] * 6)
+
+        rest = {name: entity.get(name) for name in REST_FIELDS if entity.get(name) not in (None, {}, [])}
+        coordinates = rest.get("coordinates")
+        self._vertices.append(coordinates.get("vertices") if coordinates else None)
+        if coordinates and "vertices" in coordinates:
+            coordinates = {key: value for key, value in coordinates.items() if key != "vertices"}
+            if coordinates:
+                rest["coordinates"] = coordinates
+            else:
+                del rest["coordinates"]
+        self._rest.append(json.dumps(rest, ensure_ascii=False, default=str).encode('utf-8'))
+        self.count += 1
+
+    def write(self, path: str, header: Dict[str, Any]):
+        """
+        Запись файла: сигнатура, длина заголовка, JSON-заголовок, выровненные колонки.
+        header — metadata, last_updated, layers, block_definitions.
+        Файл пишется во временный и атомарно заменяет существующий.
+        """
+        buffers: List[Union[array, bytearray]] = []
+        columns: Dict[str, Dict[str, Any]] = {}
+        position = 0
+
+        def add(name: str, buffer: Union[array, bytearray], typecode: str):
+            nonlocal position
+            nbytes = len(buffer) * (buffer.itemsize if isinstance(buffer, array) else 1)
+            columns[name] = {"offset": position, "nbytes": nbytes, "typecode": typecode}
+            buffers.append(buffer)
+            padding = (-nbytes) % _ALIGN
+            if padding:
+                buffers.append(bytearray(padding))
+            position += nbytes + padding
+
+        add("handle.offsets", self._handles.offsets, 'Q')
+        add("handle.data", self._handles.data, 'B')
+        for name in STRING_COLUMNS:
+            add(name, self._codes[name], 'I')
+        for name in FLOAT_COLUMNS:
+            add(name, self._floats[name], 'd')
+        for name in INT_COLUMNS:
+            add(name, self._ints[name], 'i')
+        for name in FLAG_COLUMNS:
+            add(name, self._flags[name], 'B')
+        add("bbox", self._bbox, 'd')
+        add("rest.offsets", self._rest.offsets, 'Q')
+        add("rest.data", self._rest.data, 'B')
+        add("vertices.offsets", self._vertices.offsets, 'Q')
+        add("vertices.data", self._vertices.data, 'd')
+
+        meta = dict(header)
+        meta.update({
+            "version": FORMAT_VERSION,
+            "byteorder": sys.byteorder,
+            "count": self.count,
+            "dictionaries": {
+                name: sorted(table, key=table.get) for name, table in self._dictionaries.items()
+            },
+            "columns": columns
+        })
+        header_bytes = json.dumps(meta, ensure_ascii=False, default=str).encode('utf-8')
+        header_bytes += b" " * ((-(len(MAGIC) + 8 + len(header_bytes))) % _ALIGN)
+
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(MAGIC)
+            f.write(len(header_bytes).to_bytes(8, "little"))
+            f.write(header_bytes)
+            for buffer in buffers:
+                f.write(buffer)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        logger.info(f"💾 Columnar cache written: {self.count} entities, {position} bytes of columns")
+
+
+def write_columnar_cache(path: str, data: Dict[str, Any]):
+    """Запись словаря формата EntityCache.to_dict() в колоночный файл."""
+    builder = ColumnarCacheBuilder()
+    for entity in data.get("entities", []):
+        builder.add_entity(entity)
+    builder.write(path, {
+        "metadata": data.get("metadata", {}),
+        "last_updated": data.get("last_updated"),
+        "layers": data.get("layers", []),
+        "block_definitions": data.get("block_definitions", [])
+    })
+
+
+class ColumnarFile:
+    """Открытый через mmap колоночный файл; колонки — memoryview без копирования."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a columnar cache file")
+            header_length = int.from_bytes(f.read(8), "little")
+            self.header: Dict[str, Any] = json.loads(f.read(header_length).decode('utf-8'))
+            self._data_start = len(MAGIC) + 8 + header_length
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.header.get("version") not in READABLE_VERSIONS or self.header.get("byteorder") != sys.byteorder:
+            raise ValueError("Unsupported columnar cache version or byte order")
+        self.count: int = self.header["count"]
+        self.dictionaries: Dict[str, List[str]] = self.header["dictionaries"]
+        self._columns: Dict[str, memoryview] = {}
+        self._grid: Optional[SpatialGrid] = None
+
+    def spatial(self) -> SpatialGrid:
+        """Сетка номеров строк по bounding box в плоскости XY (строится при первом запросе)."""
+        if self._grid is None:
+            bbox = self.column("bbox").tolist()
+            self._grid = SpatialGrid.build(
+                (i, (bbox[i * 6], bbox[i * 6 + 1], bbox[i * 6 + 3], bbox[i * 6 + 4]))
+                for i in range(self.count) if not math.isnan(bbox[i * 6])
+            )
+        return self._grid
+
+    def column(self, name: str) -> memoryview:
+        """Колонка как типизированный memoryview (страницы читаются при обращении)."""
+        view = self._columns.get(name)
+        if view is None:
+            spec = self.header["columns"][name]
+            start = self._data_start + spec["offset"]
+            view = memoryview(self._mmap)[start:start + spec["nbytes"]].cast(spec["typecode"])
+            self._columns[name] = view
+        return view
+
+    def blob(self, name: str, index: int) -> bytes:
+        offsets = self.column(f"{name}.offsets")
+        return bytes(self.column(f"{name}.data")[offsets[index]:offsets[index + 1]])
+
+    def vertices(self, index: int) -> Optional[memoryview]:
+        """Вершины строки из колонки вершин (None — файл версии без неё)."""
+        if "vertices.offsets" not in self.header["columns"]:
+            return None
+        offsets = self.column("vertices.offsets")
+        return self.column("vertices.data")[offsets[index]:offsets[index + 1]]
+
+    def blob_count(self, name: str) -> int:
+        return len(self.column(f"{name}.offsets")) - 1
+
+    def close(self):
+        self._grid = None
+        for view in self._columns.values():
+            view.release()
+        self._columns.clear()
+        self._mmap.close()
+
+
+class ColumnarEntities(Sequence):
+    """
+    Ленивая последовательность сущностей колоночного файла.
+    Элемент — словарь в формате EntityProperties.to_dict(), собирается при обращении.
+    where()/value_counts()/numeric() работают по колонкам, не собирая строки;
+    in_bbox() — по сетке колонки bbox.
+    """
+    numeric_fields = FLOAT_COLUMNS
+
+    def __init__(self, source: ColumnarFile, rows: Optional[array] = None):
+        self._source = source
+        self._rows = rows
+
+    def __len__(self) -> int:
+        return self._source.count if self._rows is None else len(self._rows)
+
+    def _row_index(self, position: int) -> int:
+        return position if self._rows is None else self._rows[position]
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(len(self)))]
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError(position)
+        return self.row(self._row_index(position))
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for position in range(len(self)):
+            yield self.row(self._row_index(position))
+
+    def _indices(self) -> Iterable[int]:
+        return range(self._source.count) if self._rows is None else self._rows
+
+    def row(self, index: int) -> Dict[str, Any]:
+        """Сборка словаря сущности по номеру строки файла."""
+        source = self._source
+        entity: Dict[str, Any] = {
+            "handle": source.blob("handle", index).decode('utf-8'),
+        }
+        for name in STRING_COLUMNS:
+            entity[name] = source.dictionaries[name][source.column(name)[index]]
+        for name in INT_COLUMNS:
+            value = source.column(name)[index]
+            entity[name] = None if value == INT_NONE else value
+        entity["visible"] = bool(source.column("visible")[index])
+        bbox = source.column("bbox")[index * 6:index * 6 + 6].tolist()
+        entity["bounding_box"] = None if math.isnan(bbox[0]) else BoundingBox(*bbox).to_dict()
+        for name in FLOAT_COLUMNS:
+            value = source.column(name)[index]
+            entity[name] = None if math.isnan(value) else value
+        rest = json.loads(source.blob("rest", index))
+        for name in REST_FIELDS:
+            entity[name] = rest.get(name, {} if name in ("coordinates", "type_properties") else None)
+        vertices = source.vertices(index)
+        if vertices:
+            entity["coordinates"] = dict(entity["coordinates"], vertices=vertices.tolist())
+        entity["details_loaded"] = bool(source.column("details_loaded")[index])
+        return entity
+
+    def where(self, field: str, value: Any) -> "ColumnarEntities":
+        """
+        Подвыборка по равенству строковой (сравнение кодов словаря) или флаговой колонки.
+        Для остальных полей строки собираются и сравниваются как словари.
+        """
+        if field in FLAG_COLUMNS:
+            code = 1 if value else 0
+        elif field in STRING_COLUMNS:
+            try:
+                code = self._source.dictionaries[field].index(value)
+            except ValueError:
+                return ColumnarEntities(self._source, array('Q'))
+        else:
+            return ColumnarEntities(self._source, array(
+                'Q', (i for i in self._indices() if self.row(i).get(field) == value)
+            ))
+        codes = self._source.column(field)
+        return ColumnarEntities(self._source, array('Q', (i for i in self._indices() if codes[i] == code)))
+
+    def where_in(self, field: str, values: Iterable[str]) -> "ColumnarEntities":
+        """Подвыборка строк, значение строковой колонки которых входит в values."""
+        names = self._source.dictionaries[field]
+        wanted = {names.index(value) for value in values if value in names}
+        codes = self._source.column(field)
+        return ColumnarEntities(self._source, array('Q', (i for i in self._indices() if codes[i] in wanted)))
+
+    def value_counts(self, field: str) -> Dict[str, int]:
+        """Количество строк по значениям строковой колонки."""
+        names = self._source.dictionaries[field]
+        counts = [0] * len(names)
+        codes = self._source.column(field)
+        for i in self._indices():
+            counts[codes[i]] += 1
+        return {name: count for name, count in zip(names, counts) if count}
+
+    def numeric(self, field: str) -> List[float]:
+        """Непустые значения числовой колонки подвыборки."""
+        column = self._source.column(field)
+        return [column[i] for i in self._indices() if not math.isnan(column[i])]
+
+    def in_bbox(self, min_x: float, min_y: float, max_x: float, max_y: float) -> "ColumnarEntities":
+        """Подвыборка строк, чей bounding box пересекает область XY (по сетке файла)."""
+        rows = sorted(self._source.spatial().query(min_x, min_y, max_x, max_y))
+        if self._rows is not None:
+            subset = set(self._rows)
+            rows = [i for i in rows if i in subset]
+        return ColumnarEntities(self._source, array('Q', rows))
+
+    def find(self, handle: str) -> Optional[Dict[str, Any]]:
+        """Поиск сущности по handle (читается только колонка handle)."""
+        target = handle.encode('utf-8')
+        for i in self._indices():
+            if self._source.blob("handle", i) == target:
+                return self.row(i)
+        return None
+
+
+class ColumnarCache(Mapping):
+    """
+    Колоночный файл в интерфейсе словаря load_cache():
+    metadata/last_updated/layers/block_definitions из заголовка,
+    entities и производные секции категорий — ленивые последовательности.
+    """
+
+    def __init__(self, path: str):
+        self.file = ColumnarFile(path)
+        header = self.file.header
+        self._values: Dict[str, Any] = {
+            "metadata": header.get("metadata", {}),
+            "last_updated": header.get("last_updated"),
+            "layers": header.get("layers", []),
+            "block_definitions": header.get("block_definitions", []),
+            "entities": ColumnarEntities(self.file),
+        }
+        for name in CATEGORY_SECTIONS:
+            self._values[name] = DerivedSection(
+                self._values["entities"], name, self._values["block_definitions"]
+            )
+
+    def __getitem__(self, key: str) -> Any:
+        return self._values[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._values)
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def close(self):
+        self.file.close()
@@ -0,0 +1,193 @@
+"""
+Профилирование COM-вызовов при извлечении данных.
+✅ Число вызовов, ошибки и гистограмма задержек по свойству и ObjectName
+✅ Включается явно — без профайлера объекты не оборачиваются
+✅ Отсортированный текстовый отчёт и JSON для анализа
+"""
+import json
+import logging
+import threading
+import time
+import types
+from typing import Optional, Dict, List, Any, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Верхние границы интервалов гистограммы задержек (секунды)
+HISTOGRAM_BOUNDS: List[Tuple[str, float]] = [
+    ("<10us", 1e-5),
+    ("<100us", 1e-4),
+    ("<1ms", 1e-3),
+    ("<10ms", 1e-2),
+    ("<100ms", 1e-1),
+    (">=100ms", float("inf")),
+]
+
+
+def _bucket(seconds: float) -> int:
+    for index, (_, bound) in enumerate(HISTOGRAM_BOUNDS):
+        if seconds < bound:
+            return index
+    return len(HISTOGRAM_BOUNDS) - 1
+
+
+class CallStats:
+    """Накопленная статистика одного свойства/метода."""
+    __slots__ = ("calls", "failures", "total", "max", "histogram")
+
+    def __init__(self):
+        self.calls = 0
+        self.failures = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.histogram = [0] * len(HISTOGRAM_BOUNDS)
+
+    def add(self, seconds: float, failed: bool):
+        self.calls += 1
+        self.failures += failed
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.histogram[_bucket(seconds)] += 1
+
+    def merge(self, other: "CallStats"):
+        self.calls += other.calls
+        self.failures += other.failures
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        self.histogram = [a + b for a, b in zip(self.histogram, other.histogram)]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "failures": self.failures,
+            "total_ms": round(self.total * 1000, 3),
+            "avg_us": round(self.total / self.calls * 1e6, 2) if self.calls else 0.0,
+            "max_ms": round(self.max * 1000, 3),
+            "histogram": {label: count for (label, _), count in zip(HISTOGRAM_BOUNDS, self.histogram)}
+        }
+
+
+class ProfiledComObject:
+    """
+    Прокси COM-объекта: замеряет чтение свойств и вызовы методов.
+    ObjectName запоминается при первом чтении и используется как метка типа.
+    """
+    __slots__ = ("_obj", "_profiler", "_object_name")
+
+    def __init__(self, obj, profiler: "ComCallProfiler"):
+        self._obj = obj
+        self._profiler = profiler
+        self._object_name = "Unknown"
+
+    def __getattr__(self, name: str) -> Any:
+        start = time.perf_counter()
+        try:
+            value = getattr(self._obj, name)
+        except Exception:
+            self._profiler.record(self._object_name, name, time.perf_counter() - start, failed=True)
+            raise
+
+        if isinstance(value, types.MethodType):
+            # Методы (GetBoundingBox, GetXData...) замеряются при вызове
+            return self._timed_method(name, value)
+
+        if name == "ObjectName":
+            self._object_name = str(value)
+        self._profiler.record(self._object_name, name, time.perf_counter() - start)
+        return value
+
+    def _timed_method(self, name: str, method):
+        def call(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = method(*args, **kwargs)
+            except Exception:
+                self._profiler.record(self._object_name, name, time.perf_counter() - start, failed=True)
+                raise
+            self._profiler.record(self._object_name, name, time.perf_counter() - start)
+            return result
+        return call
+
+
+class ComCallProfiler:
+    """
+    Сбор статистики COM-вызовов по паре (ObjectName, свойство).
+    Потокобезопасен: используется и параллельными воркерами извлечения.
+    """
+
+    def __init__(self):
+        self._stats: Dict[Tuple[str, str], CallStats] = {}
+        self._lock = threading.Lock()
+        self.started = time.perf_counter()
+
+    def wrap(self, ent) -> ProfiledComObject:
+        """Обёртка объекта для замеров (повторная обёртка не создаётся)."""
+        if isinstance(ent, ProfiledComObject):
+            return ent
+        return ProfiledComObject(ent, self)
+
+    def record(self, object_name: str, name: str, seconds: float, failed: bool = False):
+        key = (object_name, name)
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = CallStats()
+            stats.add(seconds, failed)
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self.started = time.perf_counter()
+
+    def _grouped(self, index: int) -> Dict[str, CallStats]:
+        grouped: Dict[str, CallStats] = {}
+        with self._lock:
+            for key, stats in self._stats.items():
+                grouped.setdefault(key[index], CallStats()).merge(stats)
+        return grouped
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Статистика, отсортированная по суммарному времени."""
+        with self._lock:
+            items = sorted(self._stats.items(), key=lambda item: item[1].total, reverse=True)
+            calls = [dict(object_name=o, property=p, **s.to_dict()) for (o, p), s in items]
+        by_property = sorted(self._grouped(1).items(), key=lambda item: item[1].total, reverse=True)
+        by_object = sorted(self._grouped(0).items(), key=lambda item: item[1].total, reverse=True)
+        return {
+            "wall_time_s": round(time.perf_counter() - self.started, 3),
+            "com_time_s": round(sum(s.total for s in self._grouped(0).values()), 3),
+            "total_calls": sum(c["calls"] for c in calls),
+            "by_property": {name: stats.to_dict() for name, stats in by_property},
+            "by_object_name": {name: stats.to_dict() for name, stats in by_object},
+            "calls": calls
+        }
+
+    def report(self, top: int = 20) -> str:
+        """Текстовый отчёт: самые дорогие пары (ObjectName, свойство) и итоги по типам."""
+        data = self.to_dict()
+        lines = [
+            f"COM profile: {data['total_calls']} calls, {data['com_time_s']} s in COM, "
+            f"{data['wall_time_s']} s wall time",
+            f"{'ObjectName.Property':<48} {'calls':>9} {'fails':>7} {'total ms':>11} {'avg us':>9}"
+        ]
+        for entry in data["calls"][:top]:
+            label = f"{entry['object_name']}.{entry['property']}"
+            lines.append(
+                f"{label:<48} {entry['calls']:>9} {entry['failures']:>7} "
+                f"{entry['total_ms']:>11.1f} {entry['avg_us']:>9.1f}"
+            )
+        lines.append("By ObjectName:")
+        for name, stats in data["by_object_name"].items():
+            lines.append(f"  {name:<46} {stats['calls']:>9} {stats['failures']:>7} {stats['total_ms']:>11.1f}")
+        return "\n".join(lines)
+
+    def save(self, path: str) -> bool:
+        """Сохранение статистики в JSON."""
+        try:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(self.to_dict(), f, indent=2, ensure_ascii=False)
+            logger.info(f"📊 COM profile saved to {path}")
+            return True
+        except Exception as e:
+            logger.error(f"Failed to save COM profile: {e}", exc_info=True)
+            return False
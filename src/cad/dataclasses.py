@@ -1,13 +1,66 @@
 """
 Типизированные структуры данных для AutoCAD entities.
 Использует dataclasses для строгой типизации и валидации.
+✅ BoundingBox, Coordinates и EntityProperties — со __slots__ (Python 3.10+), без __dict__ на объект
+✅ Низкокардинальные строки (слой, тип линий, ObjectName, имена блоков и стилей) интернируются;
+   пустые type_properties и vertices — общие неизменяемые объекты
+✅ Вершины полилиний и сплайнов — плоский array('d') (x, y, z подряд), без списка на каждую вершину
 """
+import sys
+from array import array
 from dataclasses import dataclass, field
-from typing import Optional, Dict, List, Any, Tuple
+from types import MappingProxyType
+from typing import Optional, Dict, List, Any, Tuple, Iterable, Mapping, Sequence
 from datetime import datetime
 
-
-@dataclass
+from .spatial_index import SpatialGrid
+from .bbox_store import BoundingBoxStore, VECTOR_COVERAGE, vectorized
+
+# dataclass(slots=True) появился в Python 3.10; на 3.9 классы остаются с __dict__
+_SLOTS: Dict[str, Any] = {"slots": True} if sys.version_info >= (3, 10) else {}
+# Строковые значения type_properties с малым числом различных значений
+INTERNED_PROPERTIES = ("block_name", "effective_name", "style_name", "pattern_name")
+# Общие пустые type_properties: не изменяются, в to_dict() отдаются новым словарём
+EMPTY_PROPERTIES: Mapping[str, Any] = MappingProxyType({})
+# Чисел на вершину в плоском буфере vertices
+VERTEX_STRIDE = 3
+# Тип-свойства в сигнатуре изменений: правки, которые не сдвигают bounding box
+# (текст, переопределение размера, замыкание полилинии, образец штриховки, атрибуты блока)
+SIGNATURE_PROPERTIES = (
+    "text_string", "measurement", "closed", "pattern_name", "pattern_scale", "pattern_angle",
+    "block_name", "effective_name", "attributes",
+)
+
+
+def _intern(value: Any) -> Any:
+    return sys.intern(value) if type(value) is str else value
+
+
+def compact_properties(properties: Optional[Mapping[str, Any]]) -> Mapping[str, Any]:
+    """type_properties с интернированными ключами и именами; пустые — общий EMPTY_PROPERTIES."""
+    if not properties:
+        return EMPTY_PROPERTIES
+    return {
+        sys.intern(key): _intern(value) if key in INTERNED_PROPERTIES else value
+        for key, value in properties.items()
+    }
+
+
+def vertex_array(values: Optional[Sequence[Any]]) -> Sequence[float]:
+    """
+    Плоский array('d') вершин (x, y, z подряд) из буфера или списка чисел;
+    список точек [[x, y, z], ...] кэшей прежнего формата разворачивается (z по умолчанию 0).
+    """
+    if values is None or not len(values):
+        return ()
+    if isinstance(values, array) and values.typecode == 'd':
+        return values
+    if isinstance(values[0], (list, tuple)):
+        return array('d', [v for p in values for v in (p[0], p[1], p[2] if len(p) > 2 else 0.0)])
+    return array('d', values)
+
+
+@dataclass(**_SLOTS)
 class BoundingBox:
     """Ограничивающий прямоугольник 3D объекта."""
     min_x: float
@@ -25,6 +78,16 @@ class BoundingBox:
             (self.min_z + self.max_z) / 2
         )
 
+    @property
+    def bounds(self) -> Tuple[float, float, float, float, float, float]:
+        """Все координаты: min_x, min_y, min_z, max_x, max_y, max_z."""
+        return self.min_x, self.min_y, self.min_z, self.max_x, self.max_y, self.max_z
+
+    @property
+    def xy(self) -> Tuple[float, float, float, float]:
+        """Проекция на плоскость XY: min_x, min_y, max_x, max_y."""
+        return self.min_x, self.min_y, self.max_x, self.max_y
+
     @property
     def size(self) -> Tuple[float, float, float]:
         return (
@@ -51,26 +114,34 @@ class BoundingBox:
         )
 
 
-@dataclass
+@dataclass(**_SLOTS)
 class Coordinates:
-    """Координаты объекта в зависимости от типа."""
+    """
+    Координаты объекта в зависимости от типа.
+    vertices — плоский array('d') с шагом VERTEX_STRIDE (без вершин — общий пустой кортеж);
+    в словаре to_dict() — плоский список чисел.
+    """
     start: Optional[List[float]] = None
     end: Optional[List[float]] = None
     center: Optional[List[float]] = None
     insertion: Optional[List[float]] = None
-    vertices: List[List[float]] = field(default_factory=list)
+    vertices: Sequence[float] = ()
     point: Optional[List[float]] = None
 
+    @property
+    def vertex_count(self) -> int:
+        return len(self.vertices) // VERTEX_STRIDE
+
     def to_dict(self) -> Dict[str, Any]:
         result = {}
         for attr in ["start", "end", "center", "insertion", "vertices", "point"]:
             val = getattr(self, attr)
             if val:
-                result[attr] = val
+                result[attr] = val.tolist() if isinstance(val, array) else val
         return result
 
 
-@dataclass
+@dataclass(**_SLOTS)
 class EntityProperties:
     """Общие свойства всех AutoCAD объектов."""
     handle: str
@@ -88,8 +159,15 @@ class EntityProperties:
     coordinates: Coordinates = field(default_factory=Coordinates)
     xdata: Optional[Dict[str, Any]] = None
     extension_dict: Optional[Dict[str, Any]] = None
-    type_properties: Dict[str, Any] = field(default_factory=dict)
+    type_properties: Mapping[str, Any] = field(default_factory=lambda: EMPTY_PROPERTIES)
     error: Optional[str] = None
+    # False — скелетная запись: type_properties, xdata, extension_dict и вершины не извлекались
+    details_loaded: bool = True
+
+    def __post_init__(self):
+        self.object_name = _intern(self.object_name)
+        self.layer = _intern(self.layer)
+        self.linetype = _intern(self.linetype)
 
     def to_dict(self) -> Dict[str, Any]:
         return {
@@ -108,8 +186,9 @@ class EntityProperties:
             "coordinates": self.coordinates.to_dict(),
             "xdata": self.xdata,
             "extension_dict": self.extension_dict,
-            "type_properties": self.type_properties,
-            "error": self.error
+            "type_properties": self.type_properties or {},
+            "error": self.error,
+            "details_loaded": self.details_loaded
         }
 
     @classmethod
@@ -121,9 +200,10 @@ class EntityProperties:
         coords = Coordinates()
         if data.get("coordinates"):
             coord_data = data["coordinates"]
-            for attr in ["start", "end", "center", "insertion", "vertices", "point"]:
+            for attr in ["start", "end", "center", "insertion", "point"]:
                 if attr in coord_data:
                     setattr(coords, attr, coord_data[attr])
+            coords.vertices = vertex_array(coord_data.get("vertices"))
 
         return cls(
             handle=str(data.get("handle", "UNKNOWN")),
@@ -141,10 +221,30 @@ class EntityProperties:
             coordinates=coords,
             xdata=data.get("xdata"),
             extension_dict=data.get("extension_dict"),
-            type_properties=data.get("type_properties", {}),
-            error=data.get("error")
+            type_properties=compact_properties(data.get("type_properties")),
+            error=data.get("error"),
+            details_loaded=bool(data.get("details_loaded", True))
         )
 
+    def signature(self, details: bool = True) -> Tuple[Any, ...]:
+        """
+        Сигнатура изменений: дешёвые для чтения через COM свойства.
+        Используется дельта-обновлением кэша для поиска изменённых объектов.
+        details=False — для скелетных записей: без вершин и type_properties.
+        """
+        bbox = self.bounding_box
+        coords = self.coordinates
+        signature = (
+            self.object_name, self.layer, self.color, self.linetype,
+            (bbox.min_x, bbox.min_y, bbox.min_z, bbox.max_x, bbox.max_y, bbox.max_z) if bbox else None,
+            self.area, self.length, self.volume,
+            coords.start, coords.end, coords.center, coords.insertion, coords.point
+        )
+        if not details:
+            return signature
+        props = self.type_properties or EMPTY_PROPERTIES
+        return signature + (tuple(coords.vertices), tuple(props.get(key) for key in SIGNATURE_PROPERTIES))
+
 
 @dataclass
 class LayerInfo:
@@ -174,6 +274,21 @@ class LayerInfo:
             "description": self.description
         }
 
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "LayerInfo":
+        return cls(
+            name=str(data.get("name", "")),
+            color=int(data.get("color", 7)),
+            linetype=str(data.get("linetype", "Continuous")),
+            lineweight=int(data.get("lineweight", 0)),
+            is_on=bool(data.get("on", True)),
+            is_frozen=bool(data.get("frozen", False)),
+            is_locked=bool(data.get("locked", False)),
+            viewport_frozen=bool(data.get("viewport_frozen", False)),
+            plot=bool(data.get("plot", True)),
+            description=str(data.get("description", ""))
+        )
+
 
 @dataclass
 class BlockReference:
@@ -188,6 +303,9 @@ class BlockReference:
     scale_z: float
     rotation: float
     attributes: List[Dict[str, Any]] = field(default_factory=list)
+    # Имя общего BlockDefinition и матрица 4x4 перехода из координат блока в мировые
+    definition: Optional[str] = None
+    transform: Optional[List[List[float]]] = None
 
     def to_dict(self) -> Dict[str, Any]:
         return {
@@ -198,9 +316,47 @@ class BlockReference:
             "insertion_point": self.insertion_point,
             "scale": {"x": self.scale_x, "y": self.scale_y, "z": self.scale_z},
             "rotation": self.rotation,
-            "attributes": self.attributes
+            "attributes": self.attributes,
+            "definition": self.definition,
+            "transform": self.transform
+        }
+
+
+@dataclass
+class BlockDefinition:
+    """
+    Определение блока из doc.Blocks.
+    Геометрия хранится один раз в координатах блока и разделяется всеми вставками.
+    """
+    name: str
+    origin: List[float] = field(default_factory=lambda: [0.0, 0.0, 0.0])
+    entities: List[EntityProperties] = field(default_factory=list)
+    # Количество объектов по COM (Block.Count) — признак переопределения блока
+    count: int = 0
+    is_xref: bool = False
+    bounding_box: Optional[BoundingBox] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "origin": self.origin,
+            "count": self.count,
+            "is_xref": self.is_xref,
+            "bounding_box": self.bounding_box.to_dict() if self.bounding_box else None,
+            "entities": [e.to_dict() for e in self.entities]
         }
 
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "BlockDefinition":
+        return cls(
+            name=str(data.get("name", "")),
+            origin=data.get("origin") or [0.0, 0.0, 0.0],
+            entities=[EntityProperties.from_dict(item) for item in data.get("entities", [])],
+            count=int(data.get("count", 0)),
+            is_xref=bool(data.get("is_xref", False)),
+            bounding_box=BoundingBox.from_dict(data["bounding_box"]) if data.get("bounding_box") else None
+        )
+
 
 @dataclass
 class TextEntity:
@@ -260,6 +416,39 @@ class DimensionEntity:
         }
 
 
+@dataclass
+class DrawingFingerprint:
+    """Отпечаток файла DWG на момент извлечения кэша."""
+    path: str
+    size: int
+    mtime_ns: int
+    sample_hash: Optional[str] = None
+    samples: int = 0
+    # Хэш всего файла: сверяется, только если mtime изменился, а размер и выборочные блоки совпали
+    content_hash: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "path": self.path,
+            "size": self.size,
+            "mtime_ns": self.mtime_ns,
+            "sample_hash": self.sample_hash,
+            "samples": self.samples,
+            "content_hash": self.content_hash
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "DrawingFingerprint":
+        return cls(
+            path=str(data.get("path", "")),
+            size=int(data.get("size", 0)),
+            mtime_ns=int(data.get("mtime_ns", 0)),
+            sample_hash=data.get("sample_hash"),
+            samples=int(data.get("samples", 0)),
+            content_hash=data.get("content_hash")
+        )
+
+
 @dataclass
 class DrawingMetadata:
     """Метаданные чертежа."""
@@ -268,6 +457,9 @@ class DrawingMetadata:
     last_update: Optional[str] = None
     acad_version: Optional[str] = None
     created_by: Optional[str] = None
+    fingerprint: Optional[DrawingFingerprint] = None
+    # Число скелетных записей в кэше (None — неизвестно, например кэш прежнего формата)
+    skeleton_pending: Optional[int] = None
 
     def to_dict(self) -> Dict[str, Any]:
         return {
@@ -275,52 +467,232 @@ class DrawingMetadata:
             "drawing_path": self.drawing_path,
             "last_update": self.last_update,
             "acad_version": self.acad_version,
-            "created_by": self.created_by
+            "created_by": self.created_by,
+            "fingerprint": self.fingerprint.to_dict() if self.fingerprint else None,
+            "skeleton_pending": self.skeleton_pending
         }
 
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "DrawingMetadata":
+        return cls(
+            drawing_name=data.get("drawing_name"),
+            drawing_path=data.get("drawing_path"),
+            last_update=data.get("last_update"),
+            acad_version=data.get("acad_version"),
+            created_by=data.get("created_by"),
+            fingerprint=DrawingFingerprint.from_dict(data["fingerprint"]) if data.get("fingerprint") else None,
+            skeleton_pending=data.get("skeleton_pending")
+        )
+
+
+def entity_block_names(entity: EntityProperties) -> Tuple[str, ...]:
+    """Имена блока вставки: block_name и effective_name (у динамических блоков они различаются)."""
+    if entity.object_name != "AcDbBlockReference":
+        return ()
+    tp = entity.type_properties
+    names = (tp.get("block_name"), tp.get("effective_name"))
+    return tuple(name for i, name in enumerate(names) if name and name not in names[:i])
+
 
 @dataclass
 class EntityCache:
-    """Кэш сущностей с быстрым доступом по handle."""
+    """
+    Кэш сущностей с быстрым доступом по handle.
+    Вторичные индексы (слой, тип, имя блока → handle), пространственная сетка и массивы
+    bounding box (BoundingBoxStore) обновляются в add_entity/remove_entity; после
+    присваивания entities целиком они перестраиваются при первом запросе.
+    """
     entities: Dict[str, EntityProperties] = field(default_factory=dict)
     blocks: Dict[str, BlockReference] = field(default_factory=dict)
     texts: Dict[str, TextEntity] = field(default_factory=dict)
     dimensions: Dict[str, DimensionEntity] = field(default_factory=dict)
+    block_definitions: Dict[str, BlockDefinition] = field(default_factory=dict)
     layers: Dict[str, LayerInfo] = field(default_factory=dict)
     metadata: DrawingMetadata = field(default_factory=DrawingMetadata)
     last_updated: Optional[datetime] = None
+    # Значение → handle; вложенные dict — упорядоченные множества (порядок добавления)
+    _by_layer: Dict[str, Dict[str, None]] = field(default_factory=dict, init=False, repr=False, compare=False)
+    _by_type: Dict[str, Dict[str, None]] = field(default_factory=dict, init=False, repr=False, compare=False)
+    _by_block: Dict[str, Dict[str, None]] = field(default_factory=dict, init=False, repr=False, compare=False)
+    # Сетка bounding box по handle (строится при первом пространственном запросе)
+    _spatial: Optional[SpatialGrid] = field(default=None, init=False, repr=False, compare=False)
+    # Bounding box, area и length по строкам в порядке entities (строятся при первом запросе)
+    _store: Optional[BoundingBoxStore] = field(default=None, init=False, repr=False, compare=False)
+    # Словарь entities, по которому построены индексы
+    _indexed: Optional[Dict[str, EntityProperties]] = field(default=None, init=False, repr=False, compare=False)
+
+    def _indexes(self):
+        if self._indexed is not self.entities:
+            self._by_layer, self._by_type, self._by_block = {}, {}, {}
+            self._spatial = None
+            self._store = None
+            self._indexed = self.entities
+            for entity in self.entities.values():
+                self._link(entity)
+
+    def _spatial_index(self) -> SpatialGrid:
+        self._indexes()
+        if self._spatial is None or self._spatial.needs_rebuild():
+            self._spatial = SpatialGrid.build(
+                (e.handle, e.bounding_box.xy) for e in self.entities.values() if e.bounding_box
+            )
+        return self._spatial
+
+    def _box_store(self) -> BoundingBoxStore:
+        self._indexes()
+        if self._store is None:
+            self._store = BoundingBoxStore()
+            for entity in self.entities.values():
+                self._store_entity(entity)
+        return self._store
+
+    def _store_entity(self, entity: EntityProperties):
+        bbox = entity.bounding_box
+        self._store.set(entity.handle, bbox.bounds if bbox else None, entity.area, entity.length)
+
+    def _link(self, entity: EntityProperties):
+        self._by_layer.setdefault(entity.layer, {})[entity.handle] = None
+        self._by_type.setdefault(entity.object_name, {})[entity.handle] = None
+        for name in entity_block_names(entity):
+            self._by_block.setdefault(name, {})[entity.handle] = None
+        if self._spatial is not None:
+            # Замена сохраняет место handle в порядке сетки, как и в словаре entities
+            if entity.bounding_box:
+                self._spatial.insert(entity.handle, entity.bounding_box.xy)
+            else:
+                self._spatial.remove(entity.handle)
+        if self._store is not None:
+            self._store_entity(entity)
+
+    def _unlink(self, entity: EntityProperties):
+        keys = [(self._by_layer, entity.layer), (self._by_type, entity.object_name)]
+        keys += [(self._by_block, name) for name in entity_block_names(entity)]
+        for index, key in keys:
+            handles = index.get(key)
+            if handles is not None:
+                handles.pop(entity.handle, None)
+                if not handles:
+                    del index[key]
+
+    def add_entity(self, entity: EntityProperties):
+        """Добавление или замена сущности с обновлением индексов."""
+        self._indexes()
+        previous = self.entities.get(entity.handle)
+        if previous is not None:
+            self._unlink(previous)
+        self.entities[entity.handle] = entity
+        self._link(entity)
+
+    def add_entities(self, entities: Iterable[EntityProperties]):
+        for entity in entities:
+            self.add_entity(entity)
+
+    def remove_entity(self, handle: str) -> Optional[EntityProperties]:
+        """Удаление сущности из кэша и индексов. Возвращает удалённую сущность."""
+        self._indexes()
+        entity = self.entities.pop(handle, None)
+        if entity is not None:
+            self._unlink(entity)
+            if self._spatial is not None:
+                self._spatial.remove(handle)
+            if self._store is not None:
+                self._store.remove(handle)
+        return entity
+
+    def _select(self, index: Dict[str, Dict[str, None]], key: str) -> List[EntityProperties]:
+        entities = self.entities
+        return [entities[handle] for handle in index.get(key, ())]
 
     def get_entity_by_handle(self, handle: str) -> Optional[EntityProperties]:
         """Быстрый поиск сущности по handle."""
         return self.entities.get(handle)
 
     def get_all_entities_by_layer(self, layer: str) -> List[EntityProperties]:
-        """Получить все сущности на слое."""
-        return [e for e in self.entities.values() if e.layer == layer]
+        """Получить все сущности на слое (по индексу, O(результата))."""
+        self._indexes()
+        return self._select(self._by_layer, layer)
 
     def get_all_entities_by_type(self, object_name: str) -> List[EntityProperties]:
-        """Получить все сущности по типу."""
-        return [e for e in self.entities.values() if e.object_name == object_name]
+        """Получить все сущности по типу (по индексу, O(результата))."""
+        self._indexes()
+        return self._select(self._by_type, object_name)
+
+    def get_all_entities_by_block(self, block_name: str) -> List[EntityProperties]:
+        """Вставки блока по имени или эффективному имени динамического блока."""
+        self._indexes()
+        return self._select(self._by_block, block_name)
+
+    def entity_layers(self) -> List[str]:
+        """Слои, на которых есть сущности (ключи индекса)."""
+        self._indexes()
+        return list(self._by_layer)
+
+    def entity_types(self) -> List[str]:
+        """Типы сущностей в кэше (ключи индекса)."""
+        self._indexes()
+        return list(self._by_type)
+
+    def _in_box(self, low: Tuple[float, float, float], high: Tuple[float, float, float],
+                exclude: Optional[str] = None) -> List[EntityProperties]:
+        """
+        Сущности, чей bounding box пересекает параллелепипед. Кандидаты — из сетки XY;
+        окно на значительную часть чертежа с NumPy проверяется векторной маской по всем строкам.
+        """
+        grid = self._spatial_index()
+        store = self._box_store()
+        if vectorized() and grid.coverage(low[0], low[1], high[0], high[1]) > VECTOR_COVERAGE:
+            handles = store.in_box(low, high, exclude)
+        else:
+            # Порядок сетки может расходиться с entities (bounding box появился при замене)
+            handles = []
+            for handle in store.ordered(grid.query(low[0], low[1], high[0], high[1])):
+                eb = self.entities[handle].bounding_box
+                if handle != exclude and eb.max_z >= low[2] and eb.min_z <= high[2]:
+                    handles.append(handle)
+        entities = self.entities
+        return [entities[handle] for handle in handles]
 
     def find_entities_in_bbox(self, bbox: BoundingBox) -> List[EntityProperties]:
-        """Найти все сущности в ограничивающем прямоугольнике."""
-        result = []
-        for entity in self.entities.values():
-            if entity.bounding_box:
-                eb = entity.bounding_box
-                if not (eb.max_x < bbox.min_x or eb.min_x > bbox.max_x or
-                        eb.max_y < bbox.min_y or eb.min_y > bbox.max_y or
-                        eb.max_z < bbox.min_z or eb.min_z > bbox.max_z):
-                    result.append(entity)
-        return result
+        """Найти все сущности, пересекающие ограничивающий прямоугольник (по сетке)."""
+        return self._in_box((bbox.min_x, bbox.min_y, bbox.min_z), (bbox.max_x, bbox.max_y, bbox.max_z))
+
+    def find_entities_near(self, point: Tuple[float, float, float], distance: float) -> List[EntityProperties]:
+        """Сущности, bounding box которых ближе distance к точке по каждой оси."""
+        x, y, z = point
+        return self._in_box((x - distance, y - distance, z - distance), (x + distance, y + distance, z + distance))
+
+    def find_intersecting_entities(self, target: EntityProperties) -> List[EntityProperties]:
+        """Сущности, bounding box которых пересекается с bounding box целевой."""
+        tb = target.bounding_box
+        if not tb:
+            return []
+        return self._in_box((tb.min_x, tb.min_y, tb.min_z), (tb.max_x, tb.max_y, tb.max_z), exclude=target.handle)
+
+    def combined_bbox(self) -> Optional[BoundingBox]:
+        """Общий габарит всех сущностей (по массивам bounding box)."""
+        extent = self._box_store().extent()
+        return BoundingBox(*extent) if extent else None
+
+    def statistics(self) -> Dict[str, Any]:
+        """Статистика в формате GeometryAnalyzer.calculate_statistics: счётчики — по индексам, суммы — по массивам."""
+        self._indexes()
+        stats: Dict[str, Any] = {
+            "total_count": len(self.entities),
+            "by_type": {name: len(handles) for name, handles in self._by_type.items()},
+            "by_layer": {name: len(handles) for name, handles in self._by_layer.items()},
+        }
+        stats.update(self._box_store().totals())
+        return stats
 
     def to_dict(self) -> Dict[str, Any]:
+        """
+        Сохраняемая структура: каждая сущность записывается один раз.
+        blocks/texts/dimensions — производные индексы, они строятся из entities при загрузке.
+        """
         return {
             "metadata": self.metadata.to_dict(),
             "last_updated": self.last_updated.isoformat() if self.last_updated else None,
             "entities": [e.to_dict() for e in self.entities.values()],
-            "blocks": [b.to_dict() for b in self.blocks.values()],
-            "texts": [t.to_dict() for t in self.texts.values()],
-            "dimensions": [d.to_dict() for d in self.dimensions.values()],
+            "block_definitions": [b.to_dict() for b in self.block_definitions.values()],
             "layers": [l.to_dict() for l in self.layers.values()]
         }
\ No newline at end of file
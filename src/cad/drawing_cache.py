@@ -3,24 +3,70 @@
 ✅ Кэш сущностей для быстрого доступа по handle
 ✅ Использование dataclasses для структурированных данных
 """
-import json
 import os
-import pythoncom
 import logging
-from typing import Dict, List, Any, Optional
+from dataclasses import replace
+from fnmatch import fnmatchcase
+from typing import Dict, List, Any, Optional, Tuple
 from datetime import datetime
-from .autocad_client import AutoCADClient
+from .autocad_client import AutoCADClient, dxf_entity_name
 from .dataclasses import (
     EntityCache, EntityProperties, LayerInfo,
-    BlockReference, TextEntity, DimensionEntity,
-    DrawingMetadata, BoundingBox
+    DrawingMetadata, BoundingBox, BlockDefinition, DrawingFingerprint
 )
 from .geometry_analysis import GeometryAnalyzer
+from .cache_checkpoint import CheckpointedCacheWriter
+from .com_profiler import ComCallProfiler
+from .columnar_cache import ColumnarCache, is_columnar_file, write_columnar_cache
+from .sqlite_cache import SqliteCache, is_sqlite_file, write_sqlite_cache
+from .cache_holder import LoadedCacheHolder
+from .cache_journal import CacheJournal, new_snapshot_id
+from .cache_index import INDEX_SUFFIX, IndexedJsonCache, load_cache_index, write_json_cache
+from .cache_codec import cache_compression, load_json_file
+from .cache_repository import cache_repository
+from .cache_freshness import FRESH, STALE, UNKNOWN, CONFIRMED_SUFFIX, check_freshness, take_fingerprint
+from .cache_layout import category_record, definition_origins, derive_sections
+
+try:
+    import pythoncom
+except ImportError:
+    pythoncom = None
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 CACHE_FILE = "drawing_cache.json"
+COLUMNAR_CACHE_FILE = "drawing_cache.colc"
+SQLITE_CACHE_FILE = "drawing_cache.sqlite"
+
+CACHE_FILES = {"json": CACHE_FILE, "columnar": COLUMNAR_CACHE_FILE, "sqlite": SQLITE_CACHE_FILE}
+# Второй буфер: новый снимок собирается рядом с текущим и подменяет его целиком
+SNAPSHOT_SUFFIX = ".next"
+
+# Разобранный файл кэша, общий для всех вызовов load_cache() в процессе
+_loaded_cache = LoadedCacheHolder()
+
+
+def cache_format() -> str:
+    """Формат файла кэша из CACHE_FORMAT: json (по умолчанию), columnar или sqlite."""
+    value = os.getenv("CACHE_FORMAT", "json").lower()
+    return value if value in CACHE_FILES else "json"
+
+
+def _matches(value: str, pattern: str) -> bool:
+    """Совпадение с шаблоном AutoCAD: список через запятую, * и ?, без учёта регистра."""
+    return any(fnmatchcase(value.upper(), p.strip().upper()) for p in pattern.split(","))
+
+
+def cache_file_path() -> str:
+    """
+    Путь к файлу кэша текущего формата.
+    С CACHE_DIR — файл в каталоге текущего чертежа репозитория, иначе в рабочем каталоге.
+    """
+    name = CACHE_FILES[cache_format()]
+    repository = cache_repository()
+    directory = repository.current_dir() if repository else None
+    return os.path.join(directory, name) if directory else name
 
 
 class DrawingCache:
@@ -29,157 +75,631 @@ class DrawingCache:
     ✅ Быстрый доступ по handle
     ✅ Полная геометрия и bounding box для всех сущностей
     """
+    # Актуальность последнего загруженного кэша относительно DWG (fresh, stale, unknown)
+    last_status: str = UNKNOWN
 
-    def __init__(self, acad_client: AutoCADClient):
+    def __init__(self, acad_client: AutoCADClient, extraction_workers: Optional[int] = None,
+                 profile: Optional[bool] = None):
         self.client = acad_client
         self.entity_cache = EntityCache()
-
-    def full_cache_update(self):
-        """Полное обновление ВСЕХ данных чертежа."""
-        logger.info("🔄 Starting full drawing scan...")
-        pythoncom.CoInitialize()
-
+        if extraction_workers is None:
+            extraction_workers = int(os.getenv("CACHE_EXTRACTION_WORKERS", "1"))
+        self.extraction_workers = max(1, extraction_workers)
+        self.chunk_size = max(1, int(os.getenv("CACHE_CHUNK_SIZE", "1000")))
+        self._entities_loaded = False
+        # snapshot_id базового файла, к которому дописывается журнал изменений
+        self._snapshot_id: Optional[str] = None
+        # Запись репозитория кэшей (CACHE_DIR) для чертежа, с которым работает кэш
+        self._drawing_key: Optional[str] = None
+        self._drawing_path: Optional[str] = None
+        # Номер снимка резидентного кэша, к которому относятся сущности в памяти
+        self._generation = _loaded_cache.generation
+        if profile is None:
+            profile = os.getenv("COM_PROFILE", "0") == "1"
+        if profile and self.client.profiler is None:
+            self.client.profiler = ComCallProfiler()
+        self.profile_file = os.getenv("COM_PROFILE_FILE", "com_profile.json")
+
+    def full_cache_update(self, resume: bool = True, skeleton: bool = False,
+                          cache_file: Optional[str] = None) -> bool:
+        """
+        Полное обновление ВСЕХ данных чертежа.
+        Сущности извлекаются порциями и сразу пишутся на диск с контрольной точкой;
+        после сбоя повторный запуск продолжает извлечение с неё (resume=True).
+        Сущности в память не накапливаются — они читаются из файла по требованию.
+        skeleton=True — быстрый скелетный проход, детали догружаются через ensure_details().
+        cache_file — запись во второй буфер (rebuild_snapshot()): текущий снимок не трогается.
+        Возвращает True, если кэш собран.
+        """
+        logger.info(f"🔄 Starting {'skeleton' if skeleton else 'full'} drawing scan...")
+        if pythoncom is not None:
+            pythoncom.CoInitialize()
+
+        self.select_drawing()
+        fingerprint = self._source_fingerprint()
+        staging = cache_file is not None
+        writer = CheckpointedCacheWriter(cache_file or cache_file_path(), cache_format(), cache_compression())
+        if self.client.profiler is not None:
+            self.client.profiler.reset()
         try:
             # Сброс кэша
             self.entity_cache = EntityCache()
+            self._entities_loaded = False
 
-            doc = self.client.doc
-
-            # Сбор метаданных
+            # Сбор метаданных; отпечаток DWG снят до извлечения
             self.entity_cache.metadata = self.client.get_drawing_metadata()
+            self.entity_cache.metadata.fingerprint = fingerprint
 
             # Сбор слоёв
             layers = self.client.get_layers_info()
             self.entity_cache.layers = {l.name: l for l in layers}
 
-            # Сбор всех сущностей с полной геометрией
-            entities = self.client.get_all_entities_detailed(
+            # Определения блоков — по одному разу на определение, до вставок (нужны для transform)
+            self.entity_cache.block_definitions = self.client.get_block_definitions()
+
+            # Потоковое извлечение сущностей с полной геометрией
+            total = self.client.get_entity_count()
+            start = writer.open(
+                self.entity_cache.metadata.drawing_path, total, resume=resume,
+                mode="skeleton" if skeleton else "full"
+            )
+            summary: Dict[str, Any] = {}
+            # Скелетные записи порций, извлечённых до сбоя, не подсчитаны — число неизвестно
+            pending: Optional[int] = 0 if start == 0 or not skeleton else None
+
+            for next_index, entities in self.client.iter_entity_chunks(
+                    self.chunk_size, start,
+                    include_xdata=True,
+                    include_dict=True,
+                    workers=self.extraction_workers,
+                    skeleton=skeleton
+            ):
+                writer.write_chunk(next_index, self._chunk_sections(entities))
+                self._update_summary(summary, entities)
+                if pending is not None:
+                    pending += sum(1 for e in entities if not e.details_loaded)
+                logger.info(f"💾 Checkpoint: {next_index}/{total} entities processed")
+
+            self.entity_cache.metadata.skeleton_pending = pending
+            self.entity_cache.last_updated = datetime.now()
+            if not staging:
+                _loaded_cache.invalidate()
+            self._snapshot_id = new_snapshot_id()
+            writer.assemble(
+                header={
+                    "snapshot_id": self._snapshot_id,
+                    "metadata": self.entity_cache.metadata.to_dict(),
+                    "last_updated": self.entity_cache.last_updated.isoformat()
+                },
+                trailer={
+                    "block_definitions": [b.to_dict() for b in self.entity_cache.block_definitions.values()],
+                    "layers": [l.to_dict() for l in self.entity_cache.layers.values()]
+                }
+            )
+            if not staging:
+                # Журнал относился к прежнему снимку
+                CacheJournal(cache_file_path()).clear()
+                self._record_write(fingerprint)
+
+            logger.info(f"Summary generated: {summary}")
+            logger.info(f"✅ Cache updated: {writer.counts['entities']} entities.")
+            return True
+
+        except Exception as e:
+            logger.error(f"❌ Cache update error: {e}", exc_info=True)
+            writer.close()
+            logger.warning(
+                f"⚠️ Scan interrupted at {writer.state.get('next_index', 0)} entities; "
+                f"run full cache update again to resume from the checkpoint."
+            )
+            return False
+        finally:
+            if self.client.profiler is not None:
+                logger.info(f"📊 COM profile report:\n{self.client.profiler.report()}")
+                self.client.profiler.save(self.profile_file)
+            if pythoncom is not None:
+                pythoncom.CoUninitialize()
+
+    @staticmethod
+    def _chunk_sections(entities: List[EntityProperties]) -> Dict[str, List[Dict[str, Any]]]:
+        """Записи порции по секциям файла кэша (категории строятся при загрузке)."""
+        return {"entities": [entity.to_dict() for entity in entities]}
+
+    def _ensure_entities(self):
+        """Загрузка сущностей из файла кэша при первом обращении."""
+        if self._generation != _loaded_cache.generation:
+            # Снимок подменён фоновым обновлением — сущности в памяти относятся к прежнему
+            self.entity_cache = EntityCache()
+            self._entities_loaded = False
+            self._snapshot_id = None
+            self._generation = _loaded_cache.generation
+        if not self._entities_loaded:
+            self.load_entity_cache()
+            self._entities_loaded = True
+
+    def select_drawing(self) -> Optional[str]:
+        """
+        Выбор кэша активного чертежа AutoCAD в репозитории (CACHE_DIR).
+        При смене чертежа кэш в памяти сбрасывается и читается из его каталога.
+        Возвращает ключ записи или None без репозитория.
+        """
+        repository = cache_repository()
+        if repository is None or not self.client.is_connected:
+            return None
+        self.client.refresh_active_document()
+        metadata = self.client.get_drawing_metadata()
+        path = metadata.drawing_path or metadata.drawing_name
+        if not path:
+            return None
+
+        key = repository.select(path, metadata.drawing_name)
+        if key != self._drawing_key:
+            self.entity_cache = EntityCache()
+            self._entities_loaded = False
+            self._snapshot_id = None
+            self._drawing_key = key
+        self._drawing_path = metadata.drawing_path
+        return key
+
+    def rebuild_snapshot(self, skeleton: bool = False) -> bool:
+        """
+        Полное сканирование во второй буфер (файл кэша с суффиксом .next) и атомарная
+        подмена текущего снимка. Всё время сканирования запросы читают текущий снимок;
+        подмена ждёт только завершения начатых запросов (DrawingCache.reading()).
+        Возвращает True, если новый снимок установлен.
+        """
+        self.select_drawing()
+        live = cache_file_path()
+        staging = live + SNAPSHOT_SUFFIX
+        if not self.full_cache_update(skeleton=skeleton, cache_file=staging):
+            return False
+        _loaded_cache.swap(lambda: self._install_snapshot(staging, live))
+        self._generation = _loaded_cache.generation
+        self._record_write(self.entity_cache.metadata.fingerprint)
+        logger.info(f"🔁 Cache snapshot swapped: {live}")
+        return True
+
+    @staticmethod
+    def _install_snapshot(staging: str, live: str):
+        """Перенос второго буфера на место текущего снимка (индекс — первым, кэш — последним)."""
+        if os.path.exists(staging + INDEX_SUFFIX):
+            os.replace(staging + INDEX_SUFFIX, live + INDEX_SUFFIX)
+        elif os.path.exists(live + INDEX_SUFFIX):
+            os.remove(live + INDEX_SUFFIX)
+        os.replace(staging, live)
+        # Журнал относился к прежнему снимку
+        CacheJournal(live).clear()
+
+    @staticmethod
+    def reading():
+        """Контекст запроса к кэшу: снимок не подменяется, пока запрос его читает."""
+        return _loaded_cache.reading()
+
+    def _source_fingerprint(self) -> Optional[DrawingFingerprint]:
+        """Отпечаток файла DWG активного чертежа (снимается до извлечения)."""
+        path = self._drawing_path or self.client.get_drawing_metadata().drawing_path
+        return take_fingerprint(path)
+
+    def _record_write(self, fingerprint: Optional[DrawingFingerprint] = None):
+        """Учёт записи в репозитории: отпечаток DWG, размер, вытеснение по бюджету."""
+        repository = cache_repository()
+        if repository is not None and self._drawing_key:
+            repository.record_write(self._drawing_key, fingerprint.to_dict() if fingerprint else None)
+
+    def delta_cache_update(self) -> Optional[Dict[str, int]]:
+        """
+        Инкрементальное обновление кэша.
+        Объекты сравниваются с кэшем по сигнатуре изменений, полностью
+        извлекаются только добавленные и изменённые, удалённые — выбрасываются.
+        Без кэша выполняется полное сканирование: в статистике full_rescan=True,
+        все объекты считаются добавленными.
+        Возвращает статистику изменений или None при ошибке.
+        """
+        self.select_drawing()
+        fingerprint = self._source_fingerprint()
+        self._ensure_entities()
+        if not self.entity_cache.entities:
+            logger.info("No cached entities to compare with, running full scan.")
+            if not self.full_cache_update():
+                return None
+            total = len((self.load_cache() or {}).get("entities", []))
+            return {"added": total, "modified": 0, "erased": 0, "total": total, "full_rescan": True}
+
+        logger.info("🔄 Starting delta drawing scan...")
+        if pythoncom is not None:
+            pythoncom.CoInitialize()
+
+        try:
+            added, modified, erased = self.client.extract_changed_entities(
+                self.entity_cache.entities,
                 include_xdata=True,
                 include_dict=True
             )
-            self.entity_cache.entities = {e.handle: e for e in entities}
 
-            # Разделение по типам
-            self._categorize_entities(entities)
+            for handle in erased:
+                self.entity_cache.remove_entity(handle)
+                self._uncategorize(handle)
 
-            # Генерация сводки
-            self._generate_summary()
+            changed = added + modified
+            for entity in changed:
+                self._uncategorize(entity.handle)
+                self.entity_cache.add_entity(entity)
+            self._categorize_entities(changed)
+
+            # Слои и метаданные дешёвые — обновляются целиком; кэш снова соответствует DWG
+            self.entity_cache.metadata = self.client.get_drawing_metadata()
+            self.entity_cache.metadata.fingerprint = fingerprint
+            layers = self.client.get_layers_info()
+            self.entity_cache.layers = {l.name: l for l in layers}
+
+            redefined = self._refresh_block_definitions()
 
             self.entity_cache.last_updated = datetime.now()
-            self._save_cache()
+            if changed or erased or redefined:
+                self._save_cache(changed=[e.handle for e in changed], erased=erased, definitions=redefined,
+                                 fingerprint=fingerprint)
+            else:
+                self._record_write(fingerprint)
+
+            stats = {
+                "added": len(added),
+                "modified": len(modified),
+                "erased": len(erased),
+                "total": len(self.entity_cache.entities)
+            }
+            logger.info(f"✅ Delta cache update: {stats}")
+            return stats
+
+        except Exception as e:
+            logger.error(f"❌ Delta cache update error: {e}", exc_info=True)
+            return None
+        finally:
+            if pythoncom is not None:
+                pythoncom.CoUninitialize()
+
+    def partial_cache_update(self, layer: Optional[str] = None, entity_type: Optional[str] = None,
+                             window: Optional[Tuple[Tuple[float, ...], Tuple[float, ...]]] = None,
+                             crossing: bool = False) -> Optional[Dict[str, int]]:
+        """
+        Обновление подмножества кэша: слой, тип объекта и/или рамка.
+        Отбор выполняет AutoCAD (SelectionSets), извлекаются только совпавшие объекты.
+        Закэшированные объекты из той же области, которых нет в выборке, удаляются.
+        Без существующего кэша сохраняется кэш только этого подмножества.
+        Возвращает статистику или None при ошибке.
+        """
+        self.select_drawing()
+        self._ensure_entities()
+        logger.info(f"🔄 Starting partial cache update (layer={layer}, type={entity_type}, window={window})...")
+        if pythoncom is not None:
+            pythoncom.CoInitialize()
 
-            logger.info(
-                f"✅ Cache updated: {len(self.entity_cache.entities)} entities, "
-                f"{len(self.entity_cache.blocks)} blocks, "
-                f"{len(self.entity_cache.texts)} texts, "
-                f"{len(self.entity_cache.dimensions)} dimensions."
+        try:
+            selected = self.client.select_entities(
+                layer=layer, entity_type=entity_type, window=window, crossing=crossing,
+                include_xdata=True, include_dict=True
             )
+            if selected is None:
+                return None
 
-        except Exception as e:
-            logger.error(f"❌ Cache update error: {e}", exc_info=True)
+            redefined = self._refresh_block_definitions()
+
+            fresh = {e.handle: e for e in selected}
+            erased = [
+                entity.handle for entity in self._scope_candidates(layer, entity_type)
+                if entity.handle not in fresh and self._in_scope(entity, layer, entity_type, window, crossing)
+            ]
+            for handle in erased:
+                self.entity_cache.remove_entity(handle)
+                self._uncategorize(handle)
+
+            added = 0
+            for entity in selected:
+                if entity.handle not in self.entity_cache.entities:
+                    added += 1
+                self._uncategorize(entity.handle)
+                self.entity_cache.add_entity(entity)
+            self._categorize_entities(selected)
+
+            # Обновлена только часть объектов — прежний отпечаток DWG сохраняется
+            fingerprint = self.entity_cache.metadata.fingerprint
+            self.entity_cache.metadata = self.client.get_drawing_metadata()
+            self.entity_cache.metadata.fingerprint = fingerprint
+            layers = self.client.get_layers_info()
+            self.entity_cache.layers = {l.name: l for l in layers}
             self.entity_cache.last_updated = datetime.now()
-            self._save_cache()
-            logger.warning("⚠️ Cache partially saved.")
+            self._save_cache(changed=list(fresh), erased=erased, definitions=redefined)
+
+            stats = {
+                "refreshed": len(selected) - added,
+                "added": added,
+                "erased": len(erased),
+                "total": len(self.entity_cache.entities)
+            }
+            logger.info(f"✅ Partial cache update: {stats}")
+            return stats
+
+        except Exception as e:
+            logger.error(f"❌ Partial cache update error: {e}", exc_info=True)
+            return None
         finally:
-            pythoncom.CoUninitialize()
+            if pythoncom is not None:
+                pythoncom.CoUninitialize()
 
-    def _categorize_entities(self, entities: List[EntityProperties]):
-        """Разделение сущностей по категориям."""
-        for entity in entities:
-            obj_name = entity.object_name
-
-            if obj_name == "AcDbBlockReference":
-                self.entity_cache.blocks[entity.handle] = self._convert_to_block(entity)
-            elif obj_name in ["AcDbText", "AcDbMText"]:
-                self.entity_cache.texts[entity.handle] = self._convert_to_text(entity)
-            elif "AcDbDimension" in obj_name:
-                self.entity_cache.dimensions[entity.handle] = self._convert_to_dimension(entity)
-
-    def _convert_to_block(self, entity: EntityProperties) -> BlockReference:
-        """Конвертация в BlockReference."""
-        tp = entity.type_properties
-        scale = tp.get("scale_factors", {"x": 1, "y": 1, "z": 1})
-        return BlockReference(
-            handle=entity.handle,
-            name=tp.get("block_name", ""),
-            effective_name=tp.get("effective_name", ""),
-            layer=entity.layer,
-            insertion_point=entity.coordinates.insertion or [0, 0, 0],
-            scale_x=scale.get("x", 1),
-            scale_y=scale.get("y", 1),
-            scale_z=scale.get("z", 1),
-            rotation=tp.get("rotation", 0),
-            attributes=tp.get("attributes", [])
-        )
+    @staticmethod
+    def _type_pattern(entity_type: str) -> str:
+        return ",".join(dxf_entity_name(t.strip()) for t in entity_type.split(","))
+
+    def _scope_candidates(self, layer: Optional[str], entity_type: Optional[str]) -> List[EntityProperties]:
+        """
+        Закэшированные сущности, которые могут попасть в область частичного обновления:
+        шаблон слоя или типа сверяется с ключами индекса, а не с каждой сущностью.
+        """
+        cache = self.entity_cache
+        if layer:
+            return [e for name in cache.entity_layers() if _matches(name, layer)
+                    for e in cache.get_all_entities_by_layer(name)]
+        if entity_type:
+            pattern = self._type_pattern(entity_type)
+            return [e for name in cache.entity_types() if _matches(dxf_entity_name(name), pattern)
+                    for e in cache.get_all_entities_by_type(name)]
+        return list(cache.entities.values())
 
-    def _convert_to_text(self, entity: EntityProperties) -> TextEntity:
-        """Конвертация в TextEntity."""
-        tp = entity.type_properties
-        return TextEntity(
-            handle=entity.handle,
-            text=tp.get("text_string", ""),
-            layer=entity.layer,
-            height=tp.get("height", 0),
-            style=tp.get("style_name", ""),
-            position=entity.coordinates.insertion or entity.coordinates.center or [0, 0, 0],
-            rotation=tp.get("rotation", 0),
-            width=tp.get("width"),
-            attachment_point=tp.get("attachment_point")
+    @staticmethod
+    def _in_scope(entity: EntityProperties, layer: Optional[str], entity_type: Optional[str],
+                  window: Optional[Tuple[Tuple[float, ...], Tuple[float, ...]]], crossing: bool) -> bool:
+        """Попадает ли закэшированная сущность в область частичного обновления."""
+        if layer and not _matches(entity.layer, layer):
+            return False
+        if entity_type and not _matches(dxf_entity_name(entity.object_name), DrawingCache._type_pattern(entity_type)):
+            return False
+        if window is not None:
+            bbox = entity.bounding_box
+            if bbox is None:
+                return False
+            (x1, y1), (x2, y2) = window[0][:2], window[1][:2]
+            low_x, high_x, low_y, high_y = min(x1, x2), max(x1, x2), min(y1, y2), max(y1, y2)
+            if crossing:
+                return bbox.min_x <= high_x and low_x <= bbox.max_x and bbox.min_y <= high_y and low_y <= bbox.max_y
+            return low_x <= bbox.min_x and bbox.max_x <= high_x and low_y <= bbox.min_y and bbox.max_y <= high_y
+        return True
+
+    def _refresh_block_definitions(self) -> bool:
+        """
+        Обновление определений блоков: извлекаются только новые и переопределённые.
+        Возвращает True, если набор определений изменился.
+        """
+        known = self.entity_cache.block_definitions
+        definitions = self.client.get_block_definitions(known=known)
+        changed = definitions.keys() != known.keys() or any(
+            definitions[name] is not known[name] for name in definitions
         )
+        if changed:
+            self.entity_cache.block_definitions = definitions
+            self._categorize_entities(self.entity_cache.get_all_entities_by_type("AcDbBlockReference"))
+        return changed
+
+    def get_block_geometry(self, handle: str) -> List[EntityProperties]:
+        """
+        Геометрия вставки блока в мировых координатах.
+        Объекты общего определения копируются с преобразованными точками, буфером вершин
+        и bounding box; handle копий — handle объекта в определении блока.
+        """
+        self._ensure_entities()
+        block = self.entity_cache.blocks.get(handle)
+        if block is None or block.definition is None:
+            return []
+        definition = self.entity_cache.block_definitions.get(block.definition)
+        if definition is None:
+            return []
+        return [self._to_world(entity, block.transform) for entity in definition.entities]
 
-    def _convert_to_dimension(self, entity: EntityProperties) -> DimensionEntity:
-        """Конвертация в DimensionEntity."""
-        tp = entity.type_properties
-        return DimensionEntity(
-            handle=entity.handle,
-            dim_type=tp.get("dimension_type", 0),
-            measurement=tp.get("measurement", 0),
-            text=tp.get("text_string", ""),
-            style=tp.get("style_name", ""),
-            scale_factor=tp.get("linear_scale_factor", 1),
-            position=entity.coordinates.center or [0, 0, 0],
-            rotation=tp.get("rotation", 0)
+    @staticmethod
+    def _to_world(entity: EntityProperties, matrix: List[List[float]]) -> EntityProperties:
+        """Копия объекта определения блока, преобразованная матрицей вставки."""
+        coords = entity.coordinates
+        points = {
+            name: GeometryAnalyzer.transform_point(matrix, getattr(coords, name))
+            for name in ("start", "end", "center", "insertion", "point") if getattr(coords, name)
+        }
+        if len(coords.vertices):
+            points["vertices"] = GeometryAnalyzer.transform_vertices(matrix, coords.vertices)
+        return replace(
+            entity,
+            coordinates=replace(coords, **points),
+            bounding_box=GeometryAnalyzer.transform_bbox(matrix, entity.bounding_box) if entity.bounding_box else None
         )
 
-    def _save_cache(self):
-        """Сохранение кэша в файл."""
+    def ensure_details(self, handles: List[str]) -> Dict[str, EntityProperties]:
+        """
+        Догрузка деталей скелетных записей через HandleToObject.
+        Обновлённые сущности записываются обратно в кэш. Возвращает их по handle.
+        """
+        self.select_drawing()
+        self._ensure_entities()
+        pending = [
+            h for h in handles
+            if h in self.entity_cache.entities and not self.entity_cache.entities[h].details_loaded
+        ]
+        if not pending:
+            return {}
+
+        logger.info(f"🔎 Loading details for {len(pending)} entities...")
+        loaded: Dict[str, EntityProperties] = {}
+        for handle in pending:
+            entity = self.client.extract_entity_details(handle)
+            if entity is None or entity.handle != handle:
+                continue
+            self._uncategorize(handle)
+            self.entity_cache.add_entity(entity)
+            loaded[handle] = entity
+        self._categorize_entities(list(loaded.values()))
+
+        if loaded:
+            self._save_cache(changed=list(loaded))
+        return loaded
+
+    def load_entity_cache(self) -> bool:
+        """Восстановление EntityCache из файла кэша."""
+        data = self.load_cache()
+        if data is None:
+            return False
+
         try:
-            with open(CACHE_FILE, 'w', encoding='utf-8') as f:
-                json.dump(self.entity_cache.to_dict(), f, indent=2, ensure_ascii=False, default=str)
-            logger.info(f"💾 Cache saved to {CACHE_FILE}")
+            cache = EntityCache()
+            self._snapshot_id = data.get("snapshot_id")
+            cache.metadata = DrawingMetadata.from_dict(data.get("metadata", {}))
+            if data.get("last_updated"):
+                cache.last_updated = datetime.fromisoformat(data["last_updated"])
+            cache.layers = {
+                l.name: l for l in (LayerInfo.from_dict(item) for item in data.get("layers", []))
+            }
+            entities = [EntityProperties.from_dict(item) for item in data.get("entities", [])]
+            cache.entities = {e.handle: e for e in entities}
+            cache.block_definitions = {
+                b.name: b for b in (BlockDefinition.from_dict(item) for item in data.get("block_definitions", []))
+            }
+
+            self.entity_cache = cache
+            self._entities_loaded = True
+            self._categorize_entities(entities)
+            logger.info(f"📁 Entity cache restored: {len(cache.entities)} entities.")
+            return True
+        except Exception as e:
+            logger.error(f"Entity cache restore error: {e}", exc_info=True)
+            return False
+
+    def _uncategorize(self, handle: str):
+        """Удаление сущности из категорий."""
+        self.entity_cache.blocks.pop(handle, None)
+        self.entity_cache.texts.pop(handle, None)
+        self.entity_cache.dimensions.pop(handle, None)
+
+    def _categorize_entities(self, entities: List[EntityProperties]):
+        """Разделение сущностей по категориям."""
+        origins = definition_origins(self.entity_cache.block_definitions.values())
+        for entity in entities:
+            result = category_record(entity, origins)
+            if result is not None:
+                section, record = result
+                getattr(self.entity_cache, section)[entity.handle] = record
+
+    def _save_cache(self, changed: Optional[List[str]] = None, erased: Optional[List[str]] = None,
+                    definitions: bool = False, fingerprint: Optional[DrawingFingerprint] = None):
+        """
+        Сохранение кэша в файл.
+        changed/erased — handle изменённых и удалённых объектов: для JSON они дописываются
+        в журнал, базовый снимок не переписывается. Без них, при отсутствии снимка
+        или при разросшемся журнале снимок записывается целиком (атомарно).
+        Колоночный файл и база SQLite всегда пишутся целиком через временный файл.
+        fingerprint — отпечаток DWG на момент извлечения (для репозитория кэшей).
+        """
+        try:
+            _loaded_cache.invalidate()
+            self.entity_cache.metadata.skeleton_pending = sum(
+                1 for e in self.entity_cache.entities.values() if not e.details_loaded
+            )
+            path = cache_file_path()
+            journal = CacheJournal(path)
+            if (cache_format() == "json" and changed is not None and self._snapshot_id
+                    and os.path.exists(path)):
+                journal.append(self._snapshot_id, self._journal_record(changed, erased or [], definitions))
+                if not journal.needs_compaction():
+                    logger.info(f"📒 Cache changes journaled: {len(changed)} changed, {len(erased or [])} erased")
+                    self._record_write(fingerprint)
+                    return
+                logger.info("📒 Compacting cache journal into snapshot...")
+
+            data = self.entity_cache.to_dict()
+            if cache_format() == "columnar":
+                write_columnar_cache(path, data)
+            elif cache_format() == "sqlite":
+                write_sqlite_cache(path, data)
+            else:
+                self._snapshot_id = new_snapshot_id()
+                write_json_cache(path, {"snapshot_id": self._snapshot_id, **data}, codec=cache_compression())
+                journal.clear()
+            self._record_write(fingerprint)
+            logger.info(f"💾 Cache saved to {path}")
         except Exception as e:
             logger.error(f"⚠️ Failed to save cache: {e}", exc_info=True)
 
-    def _generate_summary(self):
-        """Генерация сводной статистики."""
-        stats = GeometryAnalyzer.calculate_statistics(
-            list(self.entity_cache.entities.values())
-        )
-        self.entity_cache.metadata.drawing_name = self.entity_cache.metadata.drawing_name
-        logger.info(f"Summary generated: {stats}")
+    def _journal_record(self, changed: List[str], erased: List[str], definitions: bool) -> Dict[str, Any]:
+        """Запись журнала: новые версии сущностей, удалённые handle, заголовок."""
+        cache = self.entity_cache
+        present = [h for h in changed if h in cache.entities]
+        record = {
+            "metadata": cache.metadata.to_dict(),
+            "last_updated": cache.last_updated.isoformat() if cache.last_updated else None,
+            "layers": [l.to_dict() for l in cache.layers.values()],
+            "erase": list(erased),
+            "entities": [cache.entities[h].to_dict() for h in present]
+        }
+        if definitions:
+            record["block_definitions"] = [b.to_dict() for b in cache.block_definitions.values()]
+        return record
+
+    @staticmethod
+    def _update_summary(summary: Dict[str, Any], entities: List[EntityProperties]):
+        """Накопление сводной статистики по порции сущностей."""
+        stats = GeometryAnalyzer.calculate_statistics(entities)
+        for key, value in stats.items():
+            if isinstance(value, dict):
+                target = summary.setdefault(key, {})
+                for name, count in value.items():
+                    target[name] = target.get(name, 0) + count
+            else:
+                summary[key] = summary.get(key, 0) + value
 
     # ========== БЫСТРЫЙ ДОСТУП ПО HANDLE ==========
 
     def get_entity_by_handle(self, handle: str) -> Optional[EntityProperties]:
-        """Быстрый поиск сущности по handle."""
+        """
+        Быстрый поиск сущности по handle.
+        Пока сущности не загружены в память, запись читается из файла по индексу.
+        """
+        if not self._entities_loaded:
+            entities = (self.load_cache() or {}).get("entities")
+            if hasattr(entities, "find"):
+                entity = entities.find(handle)
+                return EntityProperties.from_dict(entity) if entity is not None else None
+        self._ensure_entities()
         return self.entity_cache.get_entity_by_handle(handle)
 
     def get_entities_by_layer(self, layer: str) -> List[EntityProperties]:
         """Получить все сущности на слое."""
+        self._ensure_entities()
         return self.entity_cache.get_all_entities_by_layer(layer)
 
     def get_entities_by_type(self, object_name: str) -> List[EntityProperties]:
         """Получить все сущности по типу."""
+        self._ensure_entities()
         return self.entity_cache.get_all_entities_by_type(object_name)
 
+    def get_block_references(self, block_name: str) -> List[EntityProperties]:
+        """Вставки блока по имени или эффективному имени."""
+        self._ensure_entities()
+        return self.entity_cache.get_all_entities_by_block(block_name)
+
     def find_in_bbox(self, bbox: BoundingBox) -> List[EntityProperties]:
         """Найти сущности в bounding box."""
+        self._ensure_entities()
         return self.entity_cache.find_entities_in_bbox(bbox)
 
     # ========== АНАЛИЗ ГЕОМЕТРИИ ==========
 
+    def get_extents(self) -> Optional[BoundingBox]:
+        """Общий габарит чертежа по bounding box всех сущностей."""
+        self._ensure_entities()
+        return GeometryAnalyzer.calculate_combined_bbox(self.entity_cache)
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Статистика по всем сущностям: количество по типам и слоям, суммарные площадь и длина."""
+        self._ensure_entities()
+        return GeometryAnalyzer.calculate_statistics(self.entity_cache)
+
     def find_connected_lines(self, tolerance: float = 0.001) -> Dict[str, List[str]]:
         """Найти соединённые линии."""
+        self._ensure_entities()
         return GeometryAnalyzer.find_connected_lines(
             list(self.entity_cache.entities.values()),
             tolerance
@@ -187,29 +707,116 @@ class DrawingCache:
 
     def find_nearby_entities(self, point: tuple, distance: float) -> List[EntityProperties]:
         """Найти сущности вблизи точки."""
-        return GeometryAnalyzer.find_nearby_entities(
-            list(self.entity_cache.entities.values()),
-            point,
-            distance
-        )
+        self._ensure_entities()
+        return GeometryAnalyzer.find_nearby_entities(self.entity_cache, point, distance)
+
+    def find_intersecting_entities(self, handle: str) -> List[EntityProperties]:
+        """Найти сущности, чей bounding box пересекается с bounding box указанной."""
+        self._ensure_entities()
+        target = self.entity_cache.get_entity_by_handle(handle)
+        if target is None:
+            return []
+        return GeometryAnalyzer.find_intersecting_entities(self.entity_cache, target)
 
     # ========== ЗАГРУЗКА КЭША ==========
 
     @staticmethod
     def load_cache() -> Optional[Dict[str, Any]]:
-        """Загружает кэш из файла."""
-        if not os.path.exists(CACHE_FILE):
+        """
+        Загружает кэш из файла.
+        Разобранный кэш остаётся в памяти процесса и перечитывается, только если файл
+        изменился (mtime, размер) или был перезаписан этим процессом. Возвращаемую
+        структуру нельзя изменять: она общая для всех вызовов.
+        """
+        path = cache_file_path()
+        if not os.path.exists(path):
             logger.warning("Cache file not found.")
             return None
+        data = _loaded_cache.get(
+            path, DrawingCache._read_cache_file, depends_on=[CacheJournal(path).path, path + INDEX_SUFFIX]
+        )
+        DrawingCache._report_status(DrawingCache.cache_status(data))
+        return data
 
+    @staticmethod
+    def cache_status(data: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Актуальность кэша относительно исходного DWG: fresh, stale или unknown.
+        Сравнивается отпечаток из metadata с файлом — один stat без чтения кэша
+        (файл DWG читается, только если его mtime изменился при том же размере).
+        """
+        if data is None:
+            return UNKNOWN
+        fingerprint = (data.get("metadata") or {}).get("fingerprint")
+        return check_freshness(fingerprint, cache_file_path() + CONFIRMED_SUFFIX)
+
+    @staticmethod
+    def _report_status(status: str):
+        if status != DrawingCache.last_status and status == STALE:
+            logger.warning("⚠️ Drawing cache is outdated: the DWG file changed after extraction.")
+        DrawingCache.last_status = status
+
+    def ensure_fresh(self) -> str:
+        """
+        Проверка актуальности кэша активного чертежа перед запросом.
+        Устаревший кэш обновляется инкрементально (delta_cache_update сам переходит
+        к полному сканированию, если сравнивать не с чем), отсутствующий — полностью.
+        Возвращает статус кэша после проверки и обновления.
+        """
+        if not self.client.is_connected:
+            return DrawingCache.last_status
+        data = self.load_cache()
+        if data is None:
+            logger.info("🆕 Cache not found, creating full drawing cache...")
+            self.full_cache_update()
+        elif DrawingCache.last_status == STALE:
+            logger.info("🔄 DWG changed since extraction, refreshing cache...")
+            self.delta_cache_update()
+        else:
+            return DrawingCache.last_status
+        self.load_cache()
+        return DrawingCache.last_status
+
+    @staticmethod
+    def release_loaded_cache():
+        """Сброс резидентного кэша (закрывает mmap/соединение SQLite)."""
+        _loaded_cache.invalidate()
+
+    @staticmethod
+    def _read_cache_file(path: str) -> Optional[Dict[str, Any]]:
+        """
+        Разбор файла кэша.
+        Колоночный файл не читается целиком: возвращается ColumnarCache поверх mmap,
+        сущности собираются по мере обращения к ним. Для базы SQLite возвращается
+        SqliteCache, запросы к которому выполняются SQL-ом. Несжатый JSON с действительным
+        индексом открывается как IndexedJsonCache (записи декодируются по смещениям),
+        иначе разбирается целиком. К JSON-снимку применяется журнал.
+        """
         try:
-            with open(CACHE_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            if is_columnar_file(path):
+                return ColumnarCache(path)
+            if is_sqlite_file(path):
+                return SqliteCache(path)
+
+            index = load_cache_index(path)
+            if index is not None:
+                try:
+                    journal = CacheJournal(path)
+                    return IndexedJsonCache(path, index, journal.records(index.header.get("snapshot_id")))
+                except Exception as e:
+                    logger.warning(f"Cache index not usable, parsing the whole file: {e}")
+
+            # Сжатый файл распознаётся по сигнатуре и разбирается потоково
+            data = load_json_file(path)
 
             if 'metadata' not in data:
                 logger.warning("Invalid cache format.")
                 return None
 
+            # Изменения после снимка хранятся в журнале; категории строятся из сущностей
+            CacheJournal(path).replay(data)
+            derive_sections(data)
+
             return data
         except Exception as e:
             logger.error(f"Cache load error: {e}", exc_info=True)
@@ -0,0 +1,330 @@
+"""
+Планы извлечения свойств AutoCAD объектов.
+✅ Проверка наличия COM-свойств один раз на ObjectName
+✅ Повторное использование плана для всех объектов того же типа
+✅ Однократное чтение каждого COM-свойства на объект
+"""
+import logging
+import threading
+from array import array
+from dataclasses import dataclass, field
+from typing import Optional, Dict, List, Any, Tuple, Callable
+
+from .dataclasses import SIGNATURE_PROPERTIES
+
+logger = logging.getLogger(__name__)
+
+# Чтение значения по уже скомпилированному плану
+Reader = Callable[["EntityReader"], Any]
+# Компиляция чтения: получает предикат наличия свойства, возвращает Reader или None
+Compiler = Callable[[Callable[[str], bool]], Optional[Reader]]
+
+
+class EntityReader:
+    """
+    Обёртка над COM-объектом, запоминающая прочитанные свойства.
+    Каждое свойство читается через COM не более одного раза.
+    """
+    __slots__ = ("ent", "_values")
+
+    def __init__(self, ent):
+        self.ent = ent
+        self._values: Dict[str, Any] = {}
+
+    def get(self, attr: str) -> Any:
+        try:
+            return self._values[attr]
+        except KeyError:
+            value = getattr(self.ent, attr)
+            self._values[attr] = value
+            return value
+
+
+def to_point(value) -> List[float]:
+    """Конвертация COM-точки в список [x, y, z]."""
+    return [float(value[0]), float(value[1]), float(value[2])]
+
+
+def _attr(attr: str, convert: Callable[[Any], Any]) -> Compiler:
+    """Простое свойство: читается, если существует у типа."""
+    def compile_reader(has: Callable[[str], bool]) -> Optional[Reader]:
+        if not has(attr):
+            return None
+        return lambda r: convert(r.get(attr))
+    return compile_reader
+
+
+def _polyline_vertices(raw) -> array:
+    """LWPOLYLINE: плоский массив пар (x, y) → плоский array('d') вершин (x, y, 0)."""
+    pairs = array('d', raw)
+    count = len(pairs) // 2
+    vertices = array('d', bytes(count * 3 * pairs.itemsize))
+    vertices[0::3] = pairs[0:count * 2:2]
+    vertices[1::3] = pairs[1:count * 2:2]
+    return vertices
+
+
+def _point_vertices(raw) -> array:
+    """Плоский массив точек (x, y, z) — Coordinates 2D/3D полилиний, ControlPoints сплайна."""
+    points = array('d', raw)
+    del points[len(points) - len(points) % 3:]
+    return points
+
+
+def _effective_name(has: Callable[[str], bool]) -> Optional[Reader]:
+    if has("EffectiveName"):
+        return lambda r: str(r.get("EffectiveName"))
+    if has("Name"):
+        return lambda r: str(r.get("Name"))
+    return None
+
+
+def _scale_factors(has: Callable[[str], bool]) -> Optional[Reader]:
+    if not (has("XScaleFactor") and has("YScaleFactor") and has("ZScaleFactor")):
+        return None
+    return lambda r: {
+        "x": float(r.get("XScaleFactor")),
+        "y": float(r.get("YScaleFactor")),
+        "z": float(r.get("ZScaleFactor"))
+    }
+
+
+def _is_dynamic(has: Callable[[str], bool]) -> Optional[Reader]:
+    if has("IsDynamicBlock"):
+        return lambda r: bool(r.get("IsDynamicBlock"))
+    return lambda r: False
+
+
+def _read_attributes(r: EntityReader) -> List[Dict[str, str]]:
+    attrs = []
+    for attr in r.ent.GetAttributes():
+        try:
+            attrs.append({
+                "tag": str(attr.TagString),
+                "text": str(attr.TextString),
+            })
+        except Exception:
+            continue
+    return attrs
+
+
+def _block_attributes(has: Callable[[str], bool]) -> Optional[Reader]:
+    return _read_attributes if has("GetAttributes") else None
+
+
+def _dimension_text(has: Callable[[str], bool]) -> Optional[Reader]:
+    if has("TextString"):
+        return lambda r: str(r.get("TextString"))
+    if has("TextOverride"):
+        return lambda r: str(r.get("TextOverride"))
+    return lambda r: ""
+
+
+# Общие свойства EntityProperties: (поле, COM-свойство, конвертер)
+COMMON_PROPERTIES: List[Tuple[str, str, Callable[[Any], Any]]] = [
+    ("lineweight", "Lineweight", int),
+    ("transparency", "EntityTransparency", int),
+    ("visible", "Visible", bool),
+    ("area", "Area", float),
+    ("length", "Length", float),
+    ("volume", "Volume", float),
+]
+
+# Поля Coordinates по типам: (поле, COM-свойство, конвертер)
+COORDINATE_PROPERTIES: Dict[str, List[Tuple[str, str, Callable[[Any], Any]]]] = {
+    "AcDbLine": [("start", "StartPoint", to_point), ("end", "EndPoint", to_point)],
+    "AcDbCircle": [("center", "Center", to_point)],
+    "AcDbArc": [("center", "Center", to_point)],
+    "AcDbBlockReference": [("insertion", "InsertionPoint", to_point)],
+    "AcDbText": [("insertion", "InsertionPoint", to_point)],
+    "AcDbPolyline": [("vertices", "Coordinates", _polyline_vertices)],
+    "AcDb2dPolyline": [("vertices", "Coordinates", _point_vertices)],
+    "AcDb3dPolyline": [("vertices", "Coordinates", _point_vertices)],
+    "AcDbSpline": [("vertices", "ControlPoints", _point_vertices)],
+    "AcDbPoint": [("point", "Coordinates", to_point)],
+}
+
+# Тяжёлые поля Coordinates, не читаемые при скелетном проходе
+HEAVY_COORDINATE_FIELDS = ("vertices",)
+
+_DIMENSION_PROPERTIES: List[Tuple[str, Compiler]] = [
+    ("dimension_type", _attr("DimensionType", int)),
+    ("measurement", _attr("Measurement", float)),
+    ("style_name", _attr("StyleName", str)),
+    ("text_string", _dimension_text),
+]
+
+# Тип-специфичные свойства: (ключ type_properties, компилятор чтения)
+TYPE_PROPERTIES: Dict[str, List[Tuple[str, Compiler]]] = {
+    "AcDbLine": [
+        ("angle", _attr("Angle", float)),
+        ("delta", _attr("Delta", to_point)),
+    ],
+    "AcDbCircle": [
+        ("radius", _attr("Radius", float)),
+        ("diameter", _attr("Diameter", float)),
+        ("circumference", _attr("Circumference", float)),
+    ],
+    "AcDbArc": [
+        ("radius", _attr("Radius", float)),
+        ("start_angle", _attr("StartAngle", float)),
+        ("end_angle", _attr("EndAngle", float)),
+        ("total_angle", _attr("TotalAngle", float)),
+        ("arc_length", _attr("ArcLength", float)),
+    ],
+    "AcDbPolyline": [
+        ("closed", _attr("Closed", bool)),
+        ("constant_width", _attr("ConstantWidth", float)),
+        ("elevation", _attr("Elevation", float)),
+        ("num_vertices", _attr("Coordinates", lambda raw: len(raw) // 2)),
+    ],
+    "AcDbSpline": [
+        ("degree", _attr("Degree", int)),
+        ("closed", _attr("Closed", bool)),
+        ("periodic", _attr("Periodic", bool)),
+        ("num_control_points", _attr("NumberOfControlPoints", int)),
+        ("num_fit_points", _attr("NumberOfFitPoints", int)),
+    ],
+    "AcDbText": [
+        ("text_string", _attr("TextString", str)),
+        ("height", _attr("Height", float)),
+        ("oblique_angle", _attr("ObliqueAngle", float)),
+        ("style_name", _attr("StyleName", str)),
+        ("rotation", _attr("Rotation", float)),
+    ],
+    "AcDbMText": [
+        ("text_string", _attr("TextString", str)),
+        ("height", _attr("Height", float)),
+        ("width", _attr("Width", float)),
+        ("attachment_point", _attr("AttachmentPoint", int)),
+    ],
+    "AcDbBlockReference": [
+        ("block_name", _attr("Name", str)),
+        ("effective_name", _effective_name),
+        ("scale_factors", _scale_factors),
+        ("rotation", _attr("Rotation", float)),
+        ("is_dynamic", _is_dynamic),
+        ("attributes", _block_attributes),
+    ],
+    "AcDbHatch": [
+        ("pattern_name", _attr("PatternName", str)),
+        ("pattern_scale", _attr("PatternScale", float)),
+        ("pattern_angle", _attr("PatternAngle", float)),
+        ("num_loops", _attr("NumLoops", int)),
+    ],
+    "AcDbMLeader": [
+        ("text_string", _attr("TextString", str)),
+    ],
+}
+
+
+def type_property_specs(object_name: str) -> List[Tuple[str, Compiler]]:
+    """Спецификации тип-свойств для ObjectName (все виды размеров: AcDbRotatedDimension и т.п.)."""
+    if object_name in TYPE_PROPERTIES:
+        return TYPE_PROPERTIES[object_name]
+    if "Dimension" in object_name:
+        return _DIMENSION_PROPERTIES
+    return []
+
+
+def probe_attribute(ent, attr: str) -> bool:
+    """
+    Проверка наличия COM-свойства.
+    Ошибка чтения (не AttributeError) означает, что свойство есть,
+    но недоступно у конкретного объекта — такие чтения защищены при извлечении.
+    """
+    try:
+        getattr(ent, attr)
+        return True
+    except AttributeError:
+        return False
+    except Exception:
+        return True
+
+
+@dataclass
+class ExtractionPlan:
+    """Скомпилированный план извлечения для одного ObjectName."""
+    object_name: str
+    has_handle: bool = True
+    has_layer: bool = True
+    has_color: bool = True
+    has_linetype: bool = True
+    common: List[Tuple[str, str, Callable[[Any], Any]]] = field(default_factory=list)
+    has_bounding_box: bool = False
+    coordinates: List[Tuple[str, str, Callable[[Any], Any]]] = field(default_factory=list)
+    skeleton_coordinates: List[Tuple[str, str, Callable[[Any], Any]]] = field(default_factory=list)
+    type_properties: List[Tuple[str, Reader]] = field(default_factory=list)
+    signature_properties: List[Tuple[str, Reader]] = field(default_factory=list)
+    has_xdata: bool = False
+    has_extension_dict: bool = False
+
+    @classmethod
+    def compile(cls, ent, object_name: str) -> "ExtractionPlan":
+        """Построение плана по первому объекту данного типа."""
+        probed: Dict[str, bool] = {}
+
+        def has(attr: str) -> bool:
+            if attr not in probed:
+                probed[attr] = probe_attribute(ent, attr)
+            return probed[attr]
+
+        plan = cls(
+            object_name=object_name,
+            has_handle=has("Handle"),
+            has_layer=has("Layer"),
+            has_color=has("Color"),
+            has_linetype=has("Linetype"),
+            common=[spec for spec in COMMON_PROPERTIES if has(spec[1])],
+            has_bounding_box=has("GetBoundingBox"),
+            coordinates=[
+                spec for spec in COORDINATE_PROPERTIES.get(object_name, []) if has(spec[1])
+            ],
+            has_xdata=has("GetXData"),
+            has_extension_dict=has("HasExtensionDictionary"),
+        )
+        plan.skeleton_coordinates = [
+            spec for spec in plan.coordinates if spec[0] not in HEAVY_COORDINATE_FIELDS
+        ]
+        for key, compile_reader in type_property_specs(object_name):
+            reader = compile_reader(has)
+            if reader is not None:
+                plan.type_properties.append((key, reader))
+        plan.signature_properties = [
+            spec for spec in plan.type_properties if spec[0] in SIGNATURE_PROPERTIES
+        ]
+
+        logger.debug(
+            f"Extraction plan compiled for {object_name}: "
+            f"{len(probed)} probes, {len(plan.type_properties)} type properties"
+        )
+        return plan
+
+
+class ExtractionPlanRegistry:
+    """Реестр планов извлечения: один план на ObjectName."""
+
+    def __init__(self):
+        self._plans: Dict[str, ExtractionPlan] = {}
+        self._lock = threading.Lock()
+
+    def get(self, ent, object_name: str) -> ExtractionPlan:
+        """Получить план для типа, скомпилировав его при первом обращении."""
+        plan = self._plans.get(object_name)
+        if plan is None:
+            with self._lock:
+                plan = self._plans.get(object_name)
+                if plan is None:
+                    plan = ExtractionPlan.compile(ent, object_name)
+                    self._plans[object_name] = plan
+        return plan
+
+    def clear(self):
+        with self._lock:
+            self._plans.clear()
+
+    def __len__(self) -> int:
+        return len(self._plans)
+
+    def __contains__(self, object_name: str) -> bool:
+        return object_name in self._plans
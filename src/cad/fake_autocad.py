@@ -0,0 +1,582 @@
+"""
+In-process объектная модель AutoCAD для работы без COM.
+✅ Application / Document / ModelSpace / Layers в объёме, используемом AutoCADClient
+✅ Искусственная задержка и доля отказов на каждый вызов свойства (имитация COM round trip)
+✅ Генератор синтетических чертежей: линии, полилинии, круги, дуги, блоки, тексты, размеры
+✅ Blocks: определения блоков и вставки (AcDbBlockReference)
+✅ SelectionSets с фильтрами DXF-групп 0/8/67 и выбором рамкой
+✅ Запуск извлечения и замеры масштабирования на Linux
+"""
+import math
+import random
+import time
+from fnmatch import fnmatchcase
+from typing import Optional, Dict, List, Any, Iterator, Tuple
+
+Point = Tuple[float, float, float]
+
+
+class FakeComError(Exception):
+    """Отказ COM-вызова (аналог pywintypes.com_error, например RPC_E_CALL_REJECTED)."""
+
+
+class FakeComObject:
+    """
+    Базовый объект: свойства с заглавной буквы хранятся в _props,
+    каждое чтение свойства «стоит» latency секунд и с вероятностью failure_rate
+    завершается FakeComError.
+    """
+
+    def __init__(self, latency: float = 0.0, failure_rate: float = 0.0,
+                 rng: Optional[random.Random] = None, **props):
+        object.__setattr__(self, "_latency", latency)
+        object.__setattr__(self, "_failure_rate", failure_rate)
+        object.__setattr__(self, "_rng", rng or random)
+        object.__setattr__(self, "_props", dict(props))
+
+    def _call(self):
+        if self._latency:
+            time.sleep(self._latency)
+        if self._failure_rate and self._rng.random() < self._failure_rate:
+            raise FakeComError("Call was rejected by callee.")
+
+    def __getattr__(self, name: str) -> Any:
+        props = self.__dict__.get("_props", {})
+        if name.startswith("_") or name not in props:
+            raise AttributeError(name)
+        self._call()
+        return props[name]
+
+    def __setattr__(self, name: str, value: Any):
+        if name[:1].isupper():
+            self._props[name] = value
+        else:
+            object.__setattr__(self, name, value)
+
+
+class FakeEntity(FakeComObject):
+    """Графический объект ModelSpace."""
+    object_name = "AcDbEntity"
+    dxf_name = "ENTITY"
+
+    def __init__(self, handle: str, layer: str = "0", color: int = 256,
+                 linetype: str = "ByLayer", bbox: Tuple[Point, Point] = ((0, 0, 0), (0, 0, 0)),
+                 latency: float = 0.0, failure_rate: float = 0.0,
+                 rng: Optional[random.Random] = None, **props):
+        super().__init__(
+            latency=latency,
+            failure_rate=failure_rate,
+            rng=rng,
+            Handle=handle,
+            ObjectName=self.object_name,
+            Layer=layer,
+            Color=color,
+            Linetype=linetype,
+            Lineweight=-1,
+            EntityTransparency="ByLayer",
+            Visible=True,
+            HasExtensionDictionary=False,
+            **props
+        )
+        object.__setattr__(self, "_bbox", bbox)
+        object.__setattr__(self, "_xdata", {})
+        object.__setattr__(self, "owner", None)
+
+    def GetBoundingBox(self, min_pt: List[float], max_pt: List[float]):
+        self._call()
+        min_pt[:] = [float(v) for v in self._bbox[0]]
+        max_pt[:] = [float(v) for v in self._bbox[1]]
+
+    def GetXData(self, app_name: str):
+        self._call()
+        return self._xdata.get(app_name, ())
+
+    def SetXData(self, type_codes: List[int], values: List[Any]):
+        """Первая пара — (1001, имя приложения), как в AutoCAD."""
+        self._call()
+        self._xdata[values[0]] = (tuple(type_codes), tuple(values))
+
+    def Delete(self):
+        self._call()
+        if self.owner is not None:
+            self.owner.remove(self)
+
+
+class FakeLine(FakeEntity):
+    object_name = "AcDbLine"
+    dxf_name = "LINE"
+
+    def __init__(self, handle: str, start: Point, end: Point, **kwargs):
+        delta = tuple(float(e) - float(s) for s, e in zip(start, end))
+        length = sum(d * d for d in delta) ** 0.5
+        bbox = (tuple(map(min, start, end)), tuple(map(max, start, end)))
+        super().__init__(
+            handle, bbox=bbox,
+            StartPoint=tuple(start), EndPoint=tuple(end), Delta=delta,
+            Length=length, Angle=0.0, **kwargs
+        )
+
+
+class FakeCircle(FakeEntity):
+    object_name = "AcDbCircle"
+    dxf_name = "CIRCLE"
+
+    def __init__(self, handle: str, center: Point, radius: float, **kwargs):
+        cx, cy, cz = center
+        bbox = ((cx - radius, cy - radius, cz), (cx + radius, cy + radius, cz))
+        super().__init__(
+            handle, bbox=bbox,
+            Center=tuple(center), Radius=float(radius), Diameter=2.0 * radius,
+            Circumference=6.283185307179586 * radius, Area=3.141592653589793 * radius * radius,
+            **kwargs
+        )
+
+
+class FakeArc(FakeEntity):
+    object_name = "AcDbArc"
+    dxf_name = "ARC"
+
+    def __init__(self, handle: str, center: Point, radius: float,
+                 start_angle: float, end_angle: float, **kwargs):
+        cx, cy, cz = center
+        total = (end_angle - start_angle) % (2 * math.pi)
+        bbox = ((cx - radius, cy - radius, cz), (cx + radius, cy + radius, cz))
+        super().__init__(
+            handle, bbox=bbox,
+            Center=tuple(center), Radius=float(radius), StartAngle=float(start_angle),
+            EndAngle=float(end_angle), TotalAngle=total, ArcLength=radius * total,
+            Length=radius * total, **kwargs
+        )
+
+
+class FakePolyline(FakeEntity):
+    """LWPOLYLINE: Coordinates — плоский массив пар (x, y), как в AutoCAD."""
+    object_name = "AcDbPolyline"
+    dxf_name = "LWPOLYLINE"
+
+    def __init__(self, handle: str, points: List[Tuple[float, float]], closed: bool = False,
+                 elevation: float = 0.0, **kwargs):
+        xs, ys = [p[0] for p in points], [p[1] for p in points]
+        segments = list(zip(points, points[1:] + (points[:1] if closed else [])))
+        length = sum(math.hypot(b[0] - a[0], b[1] - a[1]) for a, b in segments)
+        bbox = ((min(xs), min(ys), elevation), (max(xs), max(ys), elevation))
+        super().__init__(
+            handle, bbox=bbox,
+            Coordinates=tuple(float(v) for p in points for v in p[:2]),
+            Closed=closed, ConstantWidth=0.0, Elevation=float(elevation), Length=length,
+            Area=abs(sum(a[0] * b[1] - b[0] * a[1] for a, b in segments)) / 2 if closed else 0.0,
+            **kwargs
+        )
+
+
+class FakeText(FakeEntity):
+    object_name = "AcDbText"
+    dxf_name = "TEXT"
+
+    def __init__(self, handle: str, text: str, insertion: Point, height: float = 2.5, **kwargs):
+        x, y, z = insertion
+        bbox = ((x, y, z), (x + 0.7 * height * len(text), y + height, z))
+        super().__init__(
+            handle, bbox=bbox,
+            TextString=text, InsertionPoint=tuple(insertion), Height=float(height),
+            ObliqueAngle=0.0, StyleName="Standard", Rotation=0.0, **kwargs
+        )
+
+
+class FakeDimension(FakeEntity):
+    """Линейный (повёрнутый) размер между двумя точками по X."""
+    object_name = "AcDbRotatedDimension"
+    dxf_name = "DIMENSION"
+
+    def __init__(self, handle: str, start: Point, end: Point, offset: float = 5.0, **kwargs):
+        y = max(start[1], end[1]) + offset
+        bbox = ((min(start[0], end[0]), min(start[1], end[1]), 0.0), (max(start[0], end[0]), y, 0.0))
+        super().__init__(
+            handle, bbox=bbox,
+            Measurement=abs(end[0] - start[0]), StyleName="Standard", TextOverride="",
+            TextPosition=((start[0] + end[0]) / 2, y, 0.0), Rotation=0.0, **kwargs
+        )
+
+
+class FakeBlockReference(FakeEntity):
+    object_name = "AcDbBlockReference"
+    dxf_name = "INSERT"
+
+    def __init__(self, handle: str, block: "FakeBlock", insertion: Point,
+                 scale: float = 1.0, rotation: float = 0.0, **kwargs):
+        # Bounding box — углы габарита определения после масштаба, поворота и переноса
+        ox, oy, _ = block._props["Origin"]
+        cos_r, sin_r = math.cos(rotation), math.sin(rotation)
+        corners = []
+        for ent in block._items:
+            (x1, y1, _), (x2, y2, _) = ent._bbox
+            for x in (x1, x2):
+                for y in (y1, y2):
+                    dx, dy = (x - ox) * scale, (y - oy) * scale
+                    corners.append((insertion[0] + cos_r * dx - sin_r * dy,
+                                    insertion[1] + sin_r * dx + cos_r * dy))
+        if corners:
+            bbox = ((min(c[0] for c in corners), min(c[1] for c in corners), insertion[2]),
+                    (max(c[0] for c in corners), max(c[1] for c in corners), insertion[2]))
+        else:
+            bbox = (tuple(insertion), tuple(insertion))
+        name = block._props["Name"]
+        super().__init__(
+            handle, bbox=bbox,
+            Name=name, EffectiveName=name, InsertionPoint=tuple(insertion),
+            XScaleFactor=float(scale), YScaleFactor=float(scale), ZScaleFactor=float(scale),
+            Rotation=float(rotation), IsDynamicBlock=False, **kwargs
+        )
+
+    def GetAttributes(self):
+        self._call()
+        return ()
+
+
+class FakeModelSpace(FakeComObject):
+    """Коллекция ModelSpace: Count, Item(i), итерация."""
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__(latency=latency)
+        object.__setattr__(self, "_items", [])
+        object.__setattr__(self, "_handles", {})
+
+    @property
+    def Count(self) -> int:
+        self._call()
+        return len(self._items)
+
+    def Item(self, index: int) -> FakeEntity:
+        self._call()
+        return self._items[index]
+
+    def __iter__(self) -> Iterator[FakeEntity]:
+        for index in range(len(self._items)):
+            self._call()
+            yield self._items[index]
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def add(self, entity: FakeEntity) -> FakeEntity:
+        entity.owner = self
+        self._items.append(entity)
+        self._handles[entity._props["Handle"]] = entity
+        return entity
+
+    def remove(self, entity: FakeEntity):
+        self._items.remove(entity)
+        self._handles.pop(entity._props["Handle"], None)
+        entity.owner = None
+
+    def by_handle(self, handle: str) -> FakeEntity:
+        return self._handles[handle]
+
+
+def _matches_pattern(value: str, pattern: str) -> bool:
+    """Шаблон фильтра выбора AutoCAD: список через запятую, * и ?, без учёта регистра."""
+    return any(fnmatchcase(value.upper(), p.strip().upper()) for p in str(pattern).split(","))
+
+
+class FakeBlock(FakeModelSpace):
+    """Определение блока: коллекция объектов с Name, Origin, IsLayout, IsXRef."""
+
+    def __init__(self, name: str, origin: Point = (0.0, 0.0, 0.0), is_layout: bool = False,
+                 latency: float = 0.0):
+        super().__init__(latency=latency)
+        self._props.update(Name=name, Origin=tuple(origin), IsLayout=is_layout, IsXRef=False)
+
+
+class FakeBlocks(FakeComObject):
+    def __init__(self, latency: float = 0.0):
+        super().__init__(latency=latency)
+        object.__setattr__(self, "_blocks", {})
+
+    @property
+    def Count(self) -> int:
+        self._call()
+        return len(self._blocks)
+
+    def Add(self, origin: Point, name: str) -> FakeBlock:
+        self._call()
+        if name not in self._blocks:
+            self._blocks[name] = FakeBlock(name, origin, latency=self._latency)
+        return self._blocks[name]
+
+    def Item(self, name: str) -> FakeBlock:
+        self._call()
+        return self._blocks[name]
+
+    def __iter__(self) -> Iterator[FakeBlock]:
+        for block in list(self._blocks.values()):
+            self._call()
+            yield block
+
+
+class FakeSelectionSet(FakeComObject):
+    """Набор выбора: Select с фильтром DXF-групп, Count, Item, итерация."""
+
+    def __init__(self, name: str, document: "FakeDocument", latency: float = 0.0):
+        super().__init__(latency=latency, Name=name)
+        object.__setattr__(self, "_document", document)
+        object.__setattr__(self, "_items", [])
+
+    @property
+    def Count(self) -> int:
+        self._call()
+        return len(self._items)
+
+    def Item(self, index: int) -> FakeEntity:
+        self._call()
+        return self._items[index]
+
+    def __iter__(self) -> Iterator[FakeEntity]:
+        for item in list(self._items):
+            self._call()
+            yield item
+
+    def Clear(self):
+        self._items.clear()
+
+    def Delete(self):
+        self._call()
+        self._document._selection_sets._sets.pop(self._props["Name"], None)
+
+    def Select(self, mode: int, point1=None, point2=None, filter_type=(), filter_data=()):
+        self._call()
+        conditions = dict(zip(filter_type or (), filter_data or ()))
+        spaces = [self._document._model_space]
+        if conditions.get(67) != 0:
+            spaces.append(self._document._paper_space)
+
+        if mode in (0, 1):
+            low = [min(a, b) for a, b in zip(point1, point2)]
+            high = [max(a, b) for a, b in zip(point1, point2)]
+
+        for space in spaces:
+            for ent in space._items:
+                if 0 in conditions and not _matches_pattern(ent.dxf_name, conditions[0]):
+                    continue
+                if 8 in conditions and not _matches_pattern(ent._props["Layer"], conditions[8]):
+                    continue
+                if mode in (0, 1):
+                    (x1, y1, _), (x2, y2, _) = ent._bbox
+                    if mode == 0:
+                        inside = low[0] <= x1 and x2 <= high[0] and low[1] <= y1 and y2 <= high[1]
+                    else:
+                        inside = x1 <= high[0] and low[0] <= x2 and y1 <= high[1] and low[1] <= y2
+                    if not inside:
+                        continue
+                self._items.append(ent)
+
+
+class FakeSelectionSets(FakeComObject):
+    def __init__(self, document: "FakeDocument", latency: float = 0.0):
+        super().__init__(latency=latency)
+        object.__setattr__(self, "_document", document)
+        object.__setattr__(self, "_sets", {})
+
+    @property
+    def Count(self) -> int:
+        return len(self._sets)
+
+    def Add(self, name: str) -> FakeSelectionSet:
+        self._call()
+        if name in self._sets:
+            raise RuntimeError(f"Selection set '{name}' already exists")
+        self._sets[name] = FakeSelectionSet(name, self._document, latency=self._latency)
+        return self._sets[name]
+
+    def Item(self, name: str) -> FakeSelectionSet:
+        self._call()
+        return self._sets[name]
+
+
+class FakeLayer(FakeComObject):
+    def __init__(self, name: str, color: int = 7, latency: float = 0.0):
+        super().__init__(
+            latency=latency, Name=name, Color=color, Linetype="Continuous",
+            Lineweight=-3, LayerOn=True, Freeze=False, Lock=False,
+            ViewportDefault=False, Plot=True, Description=""
+        )
+
+
+class FakeRegisteredApplications(FakeComObject):
+    """Таблица RegApp: в каждом чертеже есть ACAD."""
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__(latency=latency)
+        object.__setattr__(self, "_apps", {})
+        self.Add("ACAD")
+
+    @property
+    def Count(self) -> int:
+        return len(self._apps)
+
+    def Add(self, name: str) -> FakeComObject:
+        self._call()
+        return self._apps.setdefault(name, FakeComObject(latency=self._latency, Name=name))
+
+    def __iter__(self) -> Iterator[FakeComObject]:
+        for app in list(self._apps.values()):
+            self._call()
+            yield app
+
+
+class FakeLayers(FakeComObject):
+    def __init__(self, latency: float = 0.0):
+        super().__init__(latency=latency)
+        object.__setattr__(self, "_layers", {})
+
+    def Add(self, name: str) -> FakeLayer:
+        self._call()
+        if name not in self._layers:
+            self._layers[name] = FakeLayer(name, latency=self._latency)
+        return self._layers[name]
+
+    def Item(self, name: str) -> FakeLayer:
+        self._call()
+        return self._layers[name]
+
+    def __iter__(self) -> Iterator[FakeLayer]:
+        return iter(list(self._layers.values()))
+
+
+class FakeDocument(FakeComObject):
+    def __init__(self, name: str = "fake.dwg", path: str = "/tmp/fake.dwg", latency: float = 0.0):
+        super().__init__(latency=latency, Name=name, FullName=path)
+        object.__setattr__(self, "_model_space", FakeModelSpace(latency))
+        object.__setattr__(self, "_paper_space", FakeModelSpace(latency))
+        object.__setattr__(self, "_layers", FakeLayers(latency))
+        object.__setattr__(self, "_selection_sets", FakeSelectionSets(self, latency))
+        object.__setattr__(self, "_blocks", FakeBlocks(latency))
+        object.__setattr__(self, "_registered_applications", FakeRegisteredApplications(latency))
+        self._layers.Add("0")
+        for layout in ("*Model_Space", "*Paper_Space"):
+            self._blocks._blocks[layout] = FakeBlock(layout, is_layout=True, latency=latency)
+
+    @property
+    def ModelSpace(self) -> FakeModelSpace:
+        return self._model_space
+
+    @property
+    def PaperSpace(self) -> FakeModelSpace:
+        return self._paper_space
+
+    @property
+    def Layers(self) -> FakeLayers:
+        return self._layers
+
+    @property
+    def RegisteredApplications(self) -> FakeRegisteredApplications:
+        return self._registered_applications
+
+    @property
+    def Blocks(self) -> FakeBlocks:
+        return self._blocks
+
+    @property
+    def SelectionSets(self) -> FakeSelectionSets:
+        return self._selection_sets
+
+    def HandleToObject(self, handle: str) -> FakeEntity:
+        self._call()
+        return self._model_space.by_handle(handle)
+
+
+class FakeApplication(FakeComObject):
+    def __init__(self, document: Optional[FakeDocument] = None, latency: float = 0.0):
+        super().__init__(latency=latency, Version="fake")
+        object.__setattr__(self, "ActiveDocument", document or FakeDocument(latency=latency))
+
+
+def build_grid_drawing(count: int, latency: float = 0.0) -> FakeApplication:
+    """Простой тестовый чертёж: чередование линий и кругов по сетке."""
+    app = FakeApplication(latency=latency)
+    doc = app.ActiveDocument
+    doc.Layers.Add("LINES")
+    doc.Layers.Add("CIRCLES")
+    side = max(1, int(count ** 0.5))
+    for i in range(count):
+        x, y = float(i % side) * 10.0, float(i // side) * 10.0
+        handle = format(i + 0x100, "X")
+        if i % 2:
+            ent = FakeCircle(handle, (x, y, 0.0), 2.5, layer="CIRCLES", latency=latency)
+        else:
+            ent = FakeLine(handle, (x, y, 0.0), (x + 5.0, y, 0.0), layer="LINES", latency=latency)
+        doc.ModelSpace.add(ent)
+    return app
+
+
+# Доли типов объектов синтетического чертежа по умолчанию
+DEFAULT_MIX: Dict[str, float] = {
+    "line": 0.30,
+    "polyline": 0.15,
+    "circle": 0.15,
+    "arc": 0.05,
+    "block": 0.15,
+    "text": 0.12,
+    "dimension": 0.08,
+}
+
+
+def build_synthetic_drawing(count: int, latency: float = 0.0, failure_rate: float = 0.0,
+                            mix: Optional[Dict[str, float]] = None, seed: int = 0) -> FakeApplication:
+    """
+    Синтетический чертёж из count объектов ModelSpace со смесью типов mix.
+    ✅ Вставки блоков ссылаются на несколько общих определений (DOOR, WINDOW, COLUMN)
+    ✅ latency и failure_rate применяются к каждому вызову свойства объектов;
+       коллекции (ModelSpace, Layers, Blocks) не отказывают, только задерживаются
+    Одинаковый seed даёт одинаковый чертёж и одинаковую последовательность отказов.
+    """
+    rng = random.Random(seed)
+    failures = random.Random(seed + 1)
+    entity_options = dict(latency=latency, failure_rate=failure_rate, rng=failures)
+
+    app = FakeApplication(latency=latency)
+    doc = app.ActiveDocument
+    kinds = list((mix or DEFAULT_MIX).items())
+    for kind, _ in kinds:
+        doc.Layers.Add(kind.upper())
+
+    next_handle = [0x20]
+
+    def handle() -> str:
+        next_handle[0] += 1
+        return format(next_handle[0], "X")
+
+    blocks = []
+    for name, width in (("DOOR", 0.9), ("WINDOW", 1.5), ("COLUMN", 0.4)):
+        block = doc.Blocks.Add((0.0, 0.0, 0.0), name)
+        block.add(FakeLine(handle(), (0, 0, 0), (width, 0, 0), **entity_options))
+        block.add(FakeLine(handle(), (0, 0, 0), (0, width, 0), **entity_options))
+        block.add(FakeArc(handle(), (0, 0, 0), width, 0.0, math.pi / 2, **entity_options))
+        blocks.append(block)
+
+    next_handle[0] = 0xFF
+    side = max(1, int(count ** 0.5))
+    names, weights = [k for k, _ in kinds], [w for _, w in kinds]
+    for i in range(count):
+        x, y = float(i % side) * 10.0, float(i // side) * 10.0
+        kind = rng.choices(names, weights)[0]
+        options = dict(layer=kind.upper(), color=rng.choice([256, 1, 3, 5]), **entity_options)
+        if kind == "line":
+            ent = FakeLine(handle(), (x, y, 0.0), (x + rng.uniform(1, 8), y + rng.uniform(0, 8), 0.0), **options)
+        elif kind == "polyline":
+            points = [(x + rng.uniform(0, 8), y + rng.uniform(0, 8)) for _ in range(rng.randint(3, 12))]
+            ent = FakePolyline(handle(), points, closed=rng.random() < 0.5, **options)
+        elif kind == "circle":
+            ent = FakeCircle(handle(), (x, y, 0.0), rng.uniform(0.5, 4.5), **options)
+        elif kind == "arc":
+            ent = FakeArc(handle(), (x, y, 0.0), rng.uniform(0.5, 4.5), 0.0, rng.uniform(0.5, 6.0), **options)
+        elif kind == "block":
+            ent = FakeBlockReference(handle(), rng.choice(blocks), (x, y, 0.0),
+                                     rotation=rng.choice([0.0, math.pi / 2]), **options)
+        elif kind == "text":
+            ent = FakeText(handle(), f"TEXT-{i}", (x, y, 0.0), **options)
+        elif kind == "dimension":
+            ent = FakeDimension(handle(), (x, y, 0.0), (x + rng.uniform(1, 8), y, 0.0), **options)
+        else:
+            raise ValueError(f"Unknown entity kind: {kind}")
+        doc.ModelSpace.add(ent)
+    return app
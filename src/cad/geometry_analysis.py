@@ -1,10 +1,20 @@
 """
 Модуль анализа геометрии: поиск связей между объектами,
 расчёт bounding boxes, пространственные запросы.
+Вершины полилиний и сплайнов обрабатываются прямо в плоском буфере (x, y, z подряд),
+с NumPy — как представление N×3 без копирования.
 """
 import logging
-from typing import List, Dict, Any, Optional, Tuple, Set
-from .dataclasses import EntityProperties, BoundingBox
+import math
+from array import array
+from typing import List, Dict, Any, Optional, Tuple, Set, Union, Sequence
+from .dataclasses import EntityProperties, BoundingBox, EntityCache, VERTEX_STRIDE
+from .bbox_store import vectorized
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -19,8 +29,12 @@ class GeometryAnalyzer:
     """
 
     @staticmethod
-    def calculate_combined_bbox(entities: List[EntityProperties]) -> Optional[BoundingBox]:
-        """Вычислить объединённый bounding box для списка сущностей."""
+    def calculate_combined_bbox(entities: Union[List[EntityProperties], EntityCache]) -> Optional[BoundingBox]:
+        """Вычислить объединённый bounding box для списка сущностей (для EntityCache с NumPy — по массивам)."""
+        if isinstance(entities, EntityCache):
+            if vectorized():
+                return entities.combined_bbox()
+            entities = list(entities.entities.values())
         if not entities:
             return None
 
@@ -38,11 +52,109 @@ class GeometryAnalyzer:
         return BoundingBox(min_x, min_y, min_z, max_x, max_y, max_z)
 
     @staticmethod
-    def find_intersecting_entities(entities: List[EntityProperties],
+    def block_transform(insertion: List[float], scale: Dict[str, float], rotation: float,
+                        origin: Optional[List[float]] = None) -> List[List[float]]:
+        """
+        Матрица 4x4 вставки блока: перенос в точку вставки · поворот вокруг Z · масштаб ·
+        перенос базовой точки определения в начало координат.
+        """
+        ox, oy, oz = (origin or [0.0, 0.0, 0.0])[:3]
+        sx, sy, sz = float(scale.get("x", 1)), float(scale.get("y", 1)), float(scale.get("z", 1))
+        cos_r, sin_r = math.cos(rotation), math.sin(rotation)
+        ix, iy, iz = insertion[:3]
+        return [
+            [cos_r * sx, -sin_r * sy, 0.0, ix - cos_r * sx * ox + sin_r * sy * oy],
+            [sin_r * sx, cos_r * sy, 0.0, iy - sin_r * sx * ox - cos_r * sy * oy],
+            [0.0, 0.0, sz, iz - sz * oz],
+            [0.0, 0.0, 0.0, 1.0]
+        ]
+
+    @staticmethod
+    def transform_point(matrix: List[List[float]], point: List[float]) -> List[float]:
+        """Применение матрицы 4x4 к точке."""
+        x, y, z = (list(point) + [0.0, 0.0])[:3]
+        return [row[0] * x + row[1] * y + row[2] * z + row[3] for row in matrix[:3]]
+
+    @staticmethod
+    def transform_bbox(matrix: List[List[float]], bbox: BoundingBox) -> BoundingBox:
+        """Bounding box после преобразования (по восьми углам исходного)."""
+        corners = [
+            GeometryAnalyzer.transform_point(matrix, [x, y, z])
+            for x in (bbox.min_x, bbox.max_x)
+            for y in (bbox.min_y, bbox.max_y)
+            for z in (bbox.min_z, bbox.max_z)
+        ]
+        return BoundingBox(
+            min(c[0] for c in corners), min(c[1] for c in corners), min(c[2] for c in corners),
+            max(c[0] for c in corners), max(c[1] for c in corners), max(c[2] for c in corners)
+        )
+
+    @staticmethod
+    def _vertex_matrix(vertices: Sequence[float]):
+        """Представление буфера вершин матрицей N×3 (array('d') — без копирования)."""
+        count = len(vertices) // VERTEX_STRIDE * VERTEX_STRIDE
+        if isinstance(vertices, array):
+            flat = numpy.frombuffer(vertices, dtype=numpy.float64, count=count)
+        else:
+            flat = numpy.asarray(vertices[:count], dtype=numpy.float64)
+        return flat.reshape(-1, VERTEX_STRIDE)
+
+    @staticmethod
+    def vertices_bbox(vertices: Sequence[float]) -> Optional[BoundingBox]:
+        """Bounding box плоского буфера вершин (None — вершин нет)."""
+        if len(vertices) < VERTEX_STRIDE:
+            return None
+        if numpy is not None:
+            points = GeometryAnalyzer._vertex_matrix(vertices)
+            low, high = points.min(axis=0).tolist(), points.max(axis=0).tolist()
+            return BoundingBox(*low, *high)
+        xs, ys, zs = vertices[0::3], vertices[1::3], vertices[2::3]
+        return BoundingBox(min(xs), min(ys), min(zs), max(xs), max(ys), max(zs))
+
+    @staticmethod
+    def polyline_length(vertices: Sequence[float], closed: bool = False) -> float:
+        """Длина ломаной по вершинам буфера (closed — с замыкающим сегментом; дуги bulge не учитываются)."""
+        if len(vertices) < 2 * VERTEX_STRIDE:
+            return 0.0
+        if numpy is not None:
+            points = GeometryAnalyzer._vertex_matrix(vertices)
+            if closed:
+                points = numpy.concatenate((points, points[:1]))
+            return float(numpy.sqrt((numpy.diff(points, axis=0) ** 2).sum(axis=1)).sum())
+        xs, ys, zs = vertices[0::3], vertices[1::3], vertices[2::3]
+        if closed:
+            xs, ys, zs = xs + xs[:1], ys + ys[:1], zs + zs[:1]
+        return math.fsum(
+            math.sqrt((x1 - x0) ** 2 + (y1 - y0) ** 2 + (z1 - z0) ** 2)
+            for x0, x1, y0, y1, z0, z1 in zip(xs, xs[1:], ys, ys[1:], zs, zs[1:])
+        )
+
+    @staticmethod
+    def transform_vertices(matrix: List[List[float]], vertices: Sequence[float]) -> array:
+        """Вершины буфера после преобразования матрицей 4x4 — новый плоский array('d')."""
+        count = len(vertices) // VERTEX_STRIDE
+        if numpy is not None and count:
+            points = GeometryAnalyzer._vertex_matrix(vertices)
+            rows = numpy.asarray(matrix, dtype=numpy.float64)[:3]
+            result = points @ rows[:, :3].T + rows[:, 3]
+            return array('d', numpy.ascontiguousarray(result).tobytes())
+        result = array('d', bytes(count * VERTEX_STRIDE * 8))
+        xs, ys, zs = vertices[0:count * 3:3], vertices[1:count * 3:3], vertices[2:count * 3:3]
+        for axis, row in enumerate(matrix[:3]):
+            a, b, c, d = row
+            result[axis::3] = array('d', [a * x + b * y + c * z + d for x, y, z in zip(xs, ys, zs)])
+        return result
+
+    @staticmethod
+    def find_intersecting_entities(entities: Union[List[EntityProperties], EntityCache],
                                    target: EntityProperties) -> List[EntityProperties]:
-        """Найти сущности, пересекающиеся с целевой (по bounding box)."""
+        """Найти сущности, пересекающиеся с целевой (по bounding box; для EntityCache — по сетке)."""
         if not target.bounding_box:
             return []
+        if isinstance(entities, EntityCache):
+            result = entities.find_intersecting_entities(target)
+            logger.info(f"Found {len(result)} entities intersecting with {target.handle}")
+            return result
 
         result = []
         for entity in entities:
@@ -66,10 +178,15 @@ class GeometryAnalyzer:
         )
 
     @staticmethod
-    def find_nearby_entities(entities: List[EntityProperties],
+    def find_nearby_entities(entities: Union[List[EntityProperties], EntityCache],
                              point: Tuple[float, float, float],
                              distance: float) -> List[EntityProperties]:
-        """Найти сущности вблизи указанной точки."""
+        """Найти сущности вблизи указанной точки (для EntityCache — по сетке)."""
+        if isinstance(entities, EntityCache):
+            result = entities.find_entities_near(point, distance)
+            logger.info(f"Found {len(result)} entities within {distance} units of point {point}")
+            return result
+
         result = []
         x, y, z = point
 
@@ -86,18 +203,24 @@ class GeometryAnalyzer:
         return result
 
     @staticmethod
-    def find_entities_by_layer(entities: List[EntityProperties],
+    def find_entities_by_layer(entities: Union[List[EntityProperties], EntityCache],
                                layer: str) -> List[EntityProperties]:
-        """Найти все сущности на указанном слое."""
-        result = [e for e in entities if e.layer == layer]
+        """Найти все сущности на указанном слое (для EntityCache — по индексу слоёв)."""
+        if isinstance(entities, EntityCache):
+            result = entities.get_all_entities_by_layer(layer)
+        else:
+            result = [e for e in entities if e.layer == layer]
         logger.info(f"Found {len(result)} entities on layer '{layer}'")
         return result
 
     @staticmethod
-    def find_entities_by_type(entities: List[EntityProperties],
+    def find_entities_by_type(entities: Union[List[EntityProperties], EntityCache],
                               object_name: str) -> List[EntityProperties]:
-        """Найти все сущности указанного типа."""
-        result = [e for e in entities if e.object_name == object_name]
+        """Найти все сущности указанного типа (для EntityCache — по индексу типов)."""
+        if isinstance(entities, EntityCache):
+            result = entities.get_all_entities_by_type(object_name)
+        else:
+            result = [e for e in entities if e.object_name == object_name]
         logger.info(f"Found {len(result)} entities of type '{object_name}'")
         return result
 
@@ -202,8 +325,13 @@ class GeometryAnalyzer:
         return distance <= max_distance
 
     @staticmethod
-    def calculate_statistics(entities: List[EntityProperties]) -> Dict[str, Any]:
-        """Расчёт статистики по сущностям."""
+    def calculate_statistics(entities: Union[List[EntityProperties], EntityCache]) -> Dict[str, Any]:
+        """Расчёт статистики по сущностям (для EntityCache — по индексам и массивам)."""
+        if isinstance(entities, EntityCache):
+            stats = entities.statistics()
+            logger.info(f"Statistics calculated for {stats['total_count']} entities")
+            return stats
+
         stats = {
             "total_count": len(entities),
             "by_type": {},
@@ -6,7 +6,8 @@ from .drawing_cache import DrawingCache
 from .dataclasses import (
     EntityProperties, BoundingBox, Coordinates,
     LayerInfo, BlockReference, TextEntity,
-    DimensionEntity, DrawingMetadata, EntityCache
+    DimensionEntity, DrawingMetadata, EntityCache,
+    BlockDefinition
 )
 from .geometry_analysis import GeometryAnalyzer
 
@@ -22,5 +23,6 @@ __all__ = [
     'DimensionEntity',
     'DrawingMetadata',
     'EntityCache',
+    'BlockDefinition',
     'GeometryAnalyzer'
 ]
\ No newline at end of file
@@ -0,0 +1,167 @@
+"""
+Пространственный индекс bounding box сущностей — равномерная сетка на плоскости XY.
+✅ Размер ячейки подбирается при построении по плотности и типичному размеру объектов
+✅ Вставка и удаление — O(ячеек объекта); объекты крупнее MAX_CELLS_PER_ITEM ячеек хранятся списком
+✅ Запрос окна — O(ячеек окна + результата) и почти не зависит от размера чертежа
+"""
+import math
+import logging
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Прямоугольник на плоскости: min_x, min_y, max_x, max_y
+Box = Tuple[float, float, float, float]
+
+MAX_CELLS_PER_ITEM = 64
+# Целевое число объектов на ячейку при равномерной плотности
+TARGET_PER_CELL = 2
+# Объём выборки для оценки типичного размера объекта
+SIZE_SAMPLE = 1024
+# Сетка перестраивается, когда объектов стало во столько раз больше, чем при построении
+REBUILD_GROWTH = 4
+
+
+def choose_cell_size(boxes: List[Box]) -> float:
+    """
+    Размер ячейки: не меньше типичного (медианного) объекта и ~TARGET_PER_CELL объектов на ячейку.
+    Область чертежа оценивается по центрам без крайних 2% — одиночные далёкие объекты её не раздувают.
+    """
+    boxes = [b for b in boxes if all(map(math.isfinite, b))]
+    if not boxes:
+        return 1.0
+    sample = boxes[::max(1, len(boxes) // SIZE_SAMPLE)]
+    trim = len(sample) // 50
+    xs = sorted((b[0] + b[2]) / 2 for b in sample)
+    ys = sorted((b[1] + b[3]) / 2 for b in sample)
+    width = xs[len(xs) - 1 - trim] - xs[trim]
+    height = ys[len(ys) - 1 - trim] - ys[trim]
+    if width > 0 and height > 0:
+        density = math.sqrt(width * height * TARGET_PER_CELL / len(boxes))
+    else:
+        density = max(width, height) * TARGET_PER_CELL / len(boxes)
+    sizes = sorted(max(b[2] - b[0], b[3] - b[1]) for b in sample)
+    cell = max(density, sizes[len(sizes) // 2])
+    return cell if cell > 0 else 1.0
+
+
+class SpatialGrid:
+    """
+    Сетка ячеек cell_size × cell_size: ячейка → ключи объектов, пересекающих её.
+    query() возвращает ключи объектов, пересекающих окно (границы включительно), в порядке вставки.
+    """
+
+    def __init__(self, cell_size: float = 1.0):
+        self.cell_size = cell_size if cell_size > 0 and math.isfinite(cell_size) else 1.0
+        self._scale = 1.0 / self.cell_size
+        self._cells: Dict[Tuple[int, int], List[Hashable]] = {}
+        # ключ → (порядковый номер вставки, min_x, min_y, max_x, max_y)
+        self._boxes: Dict[Hashable, Tuple[int, float, float, float, float]] = {}
+        self._large: Dict[Hashable, None] = {}
+        self._sequence = 0
+        self.built_count = 0
+
+    @classmethod
+    def build(cls, items: Iterable[Tuple[Hashable, Box]]) -> "SpatialGrid":
+        """Построение по всем объектам сразу (размер ячейки — по их распределению)."""
+        items = list(items)
+        grid = cls(choose_cell_size([box for _, box in items]))
+        for key, box in items:
+            grid.insert(key, box)
+        grid.built_count = len(items)
+        return grid
+
+    def __len__(self) -> int:
+        return len(self._boxes)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._boxes
+
+    def needs_rebuild(self) -> bool:
+        """Сетка построена для заметно меньшего числа объектов — размер ячейки устарел."""
+        return len(self._boxes) > REBUILD_GROWTH * max(self.built_count, 64)
+
+    def _cell_range(self, box: Box) -> Optional[Tuple[int, int, int, int]]:
+        """Диапазон ячеек прямоугольника (None — бесконечные координаты)."""
+        if not all(map(math.isfinite, box)):
+            return None
+        scale = self._scale
+        return (math.floor(box[0] * scale), math.floor(box[1] * scale),
+                math.floor(box[2] * scale), math.floor(box[3] * scale))
+
+    def insert(self, key: Hashable, box: Box):
+        """Добавление объекта; прежняя запись того же ключа заменяется с сохранением её места в порядке."""
+        previous = self._boxes.get(key)
+        if previous is not None:
+            self.remove(key)
+            sequence = previous[0]
+        else:
+            self._sequence += 1
+            sequence = self._sequence
+        self._boxes[key] = (sequence, box[0], box[1], box[2], box[3])
+        cells = self._cell_range(box)
+        if cells is None or (cells[2] - cells[0] + 1) * (cells[3] - cells[1] + 1) > MAX_CELLS_PER_ITEM:
+            self._large[key] = None
+            return
+        grid = self._cells
+        for ix in range(cells[0], cells[2] + 1):
+            for iy in range(cells[1], cells[3] + 1):
+                cell = grid.get((ix, iy))
+                if cell is None:
+                    grid[(ix, iy)] = [key]
+                else:
+                    cell.append(key)
+
+    def remove(self, key: Hashable):
+        entry = self._boxes.pop(key, None)
+        if entry is None:
+            return
+        if key in self._large:
+            del self._large[key]
+            return
+        x0, y0, x1, y1 = self._cell_range(entry[1:])
+        grid = self._cells
+        for ix in range(x0, x1 + 1):
+            for iy in range(y0, y1 + 1):
+                cell = grid.get((ix, iy))
+                if cell is not None:
+                    cell.remove(key)
+                    if not cell:
+                        del grid[(ix, iy)]
+
+    def coverage(self, min_x: float, min_y: float, max_x: float, max_y: float) -> float:
+        """Число ячеек окна относительно числа занятых ячеек сетки (inf — бесконечное окно)."""
+        cells = self._cell_range((min_x, min_y, max_x, max_y))
+        if cells is None:
+            return math.inf
+        return (cells[2] - cells[0] + 1) * (cells[3] - cells[1] + 1) / max(1, len(self._cells))
+
+    def query(self, min_x: float, min_y: float, max_x: float, max_y: float) -> List[Hashable]:
+        """Ключи объектов, пересекающих окно, в порядке вставки."""
+        boxes = self._boxes
+        if not boxes:
+            return []
+
+        def hit(key: Hashable) -> bool:
+            b = boxes[key]
+            return b[3] >= min_x and b[1] <= max_x and b[4] >= min_y and b[2] <= max_y
+
+        cells = self._cell_range((min_x, min_y, max_x, max_y))
+        if self.coverage(min_x, min_y, max_x, max_y) > 1:
+            # Окно больше занятой части сетки — проверка всех объектов дешевле обхода ячеек
+            found = [key for key in boxes if hit(key)]
+            found.sort(key=lambda key: boxes[key][0])
+        else:
+            seen = set()
+            found = []
+            grid = self._cells
+            for ix in range(cells[0], cells[2] + 1):
+                for iy in range(cells[1], cells[3] + 1):
+                    for key in grid.get((ix, iy), ()):
+                        if key not in seen:
+                            seen.add(key)
+                            if hit(key):
+                                found.append(key)
+            found.extend(key for key in self._large if hit(key))
+            found.sort(key=lambda key: boxes[key][0])
+        return found
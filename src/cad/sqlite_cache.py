@@ -0,0 +1,357 @@
+"""
+Хранилище кэша чертежа в SQLite (stdlib sqlite3).
+✅ Сущности в таблице с индексами по handle, layer, object_name и имени блока
+✅ Bounding boxes в виртуальной таблице R*Tree для пространственных запросов
+✅ type_properties — JSON-колонка (json_extract в фильтрах и агрегатах)
+✅ Запросы get_drawing_info выполняются SQL-ом без загрузки чертежа в память
+"""
+import json
+import os
+import sqlite3
+import logging
+from collections.abc import Mapping, Sequence
+from typing import Optional, Dict, List, Any, Iterable, Iterator, Tuple
+
+from .cache_layout import CATEGORY_SECTIONS, DerivedSection
+
+logger = logging.getLogger(__name__)
+
+SQLITE_MAGIC = b"SQLite format 3\x00"
+_BATCH_SIZE = 1000
+
+# Поля сущности, хранящиеся в отдельных индексируемых колонках
+COLUMN_FIELDS = ("handle", "object_name", "layer", "color", "linetype", "block_name",
+                 "effective_name", "area", "length", "volume", "details_loaded")
+NUMERIC_FIELDS = ("area", "length", "volume")
+AGGREGATE_FUNCTIONS = {"sum": "SUM", "avg": "AVG", "min": "MIN", "max": "MAX", "count": "COUNT"}
+
+_SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE layers (name TEXT PRIMARY KEY, data TEXT);
+CREATE TABLE block_definitions (name TEXT PRIMARY KEY, data TEXT);
+CREATE TABLE entities (
+    id INTEGER PRIMARY KEY,
+    handle TEXT NOT NULL,
+    object_name TEXT,
+    layer TEXT,
+    color INTEGER,
+    linetype TEXT,
+    block_name TEXT,
+    effective_name TEXT,
+    area REAL,
+    length REAL,
+    volume REAL,
+    details_loaded INTEGER,
+    type_properties TEXT,
+    data TEXT
+);
+"""
+
+# Индексы создаются после заполнения таблиц — так вставка быстрее
+_INDEXES = """
+CREATE INDEX idx_entities_handle ON entities (handle);
+CREATE INDEX idx_entities_layer ON entities (layer);
+CREATE INDEX idx_entities_object_name ON entities (object_name);
+CREATE INDEX idx_entities_block_name ON entities (block_name);
+CREATE INDEX idx_entities_effective_name ON entities (effective_name);
+CREATE INDEX idx_entities_details_loaded ON entities (details_loaded);
+"""
+
+
+def is_sqlite_file(path: str) -> bool:
+    """Проверка сигнатуры файла базы SQLite."""
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(SQLITE_MAGIC)) == SQLITE_MAGIC
+    except OSError:
+        return False
+
+
+def _create_bbox_table(conn: sqlite3.Connection):
+    """R*Tree для bounding boxes; без модуля RTREE — обычная таблица с индексом."""
+    try:
+        conn.execute(
+            "CREATE VIRTUAL TABLE entity_bbox USING rtree(id, min_x, max_x, min_y, max_y, min_z, max_z)"
+        )
+    except sqlite3.OperationalError:
+        logger.warning("SQLite RTREE module is not available, using a plain bbox table.")
+        conn.execute(
+            "CREATE TABLE entity_bbox (id INTEGER PRIMARY KEY, min_x REAL, max_x REAL, "
+            "min_y REAL, max_y REAL, min_z REAL, max_z REAL)"
+        )
+        conn.execute("CREATE INDEX idx_entity_bbox_x ON entity_bbox (min_x, max_x)")
+
+
+class SqliteCacheBuilder:
+    """
+    Потоковая запись кэша в базу SQLite.
+    Строки вставляются пачками во временный файл, который при write() атомарно заменяет кэш.
+    """
+
+    def __init__(self, path: str):
+        self._tmp_path = path + ".tmp"
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+        self._conn = sqlite3.connect(self._tmp_path)
+        self._conn.execute("PRAGMA journal_mode = OFF")
+        self._conn.execute("PRAGMA synchronous = OFF")
+        self._conn.executescript(_SCHEMA)
+        _create_bbox_table(self._conn)
+        self.count = 0
+        self._entities: List[Tuple] = []
+        self._boxes: List[Tuple] = []
+
+    def add_entity(self, entity: Dict[str, Any]):
+        """Добавление сущности в формате EntityProperties.to_dict()."""
+        self.count += 1
+        tp = entity.get("type_properties") or {}
+        self._entities.append((
+            self.count, str(entity.get("handle", "UNKNOWN")), entity.get("object_name"), entity.get("layer"),
+            entity.get("color"), entity.get("linetype"), tp.get("block_name"), tp.get("effective_name"),
+            entity.get("area"), entity.get("length"), entity.get("volume"),
+            1 if entity.get("details_loaded", True) else 0,
+            json.dumps(tp, ensure_ascii=False, default=str),
+            json.dumps(entity, ensure_ascii=False, default=str)
+        ))
+        bbox = entity.get("bounding_box")
+        if bbox:
+            (x1, y1, z1), (x2, y2, z2) = bbox["min"][:3], bbox["max"][:3]
+            self._boxes.append((self.count, x1, x2, y1, y2, z1, z2))
+        if len(self._entities) >= _BATCH_SIZE:
+            self._flush()
+
+    def _flush(self):
+        self._conn.executemany(f"INSERT INTO entities VALUES ({', '.join('?' * 14)})", self._entities)
+        self._conn.executemany("INSERT INTO entity_bbox VALUES (?, ?, ?, ?, ?, ?, ?)", self._boxes)
+        self._entities.clear()
+        self._boxes.clear()
+
+    def write(self, path: str, header: Dict[str, Any]):
+        """
+        Завершение записи: метаданные, слои, определения блоков, индексы.
+        header — metadata, last_updated, layers, block_definitions.
+        """
+        try:
+            self._flush()
+            self._conn.executemany("INSERT INTO meta VALUES (?, ?)", [
+                ("metadata", json.dumps(header.get("metadata", {}), ensure_ascii=False, default=str)),
+                ("last_updated", json.dumps(header.get("last_updated"), default=str)),
+            ])
+            self._conn.executemany("INSERT OR REPLACE INTO layers VALUES (?, ?)", [
+                (layer.get("name"), json.dumps(layer, ensure_ascii=False, default=str))
+                for layer in header.get("layers", [])
+            ])
+            self._conn.executemany("INSERT OR REPLACE INTO block_definitions VALUES (?, ?)", [
+                (definition.get("name"), json.dumps(definition, ensure_ascii=False, default=str))
+                for definition in header.get("block_definitions", [])
+            ])
+            self._conn.executescript(_INDEXES)
+            self._conn.commit()
+        finally:
+            self._conn.close()
+        os.replace(self._tmp_path, path)
+        logger.info(f"💾 SQLite cache written: {self.count} entities")
+
+
+def write_sqlite_cache(path: str, data: Dict[str, Any]):
+    """Запись словаря формата EntityCache.to_dict() в базу SQLite."""
+    builder = SqliteCacheBuilder(path)
+    for entity in data.get("entities", []):
+        builder.add_entity(entity)
+    builder.write(path, {
+        "metadata": data.get("metadata", {}),
+        "last_updated": data.get("last_updated"),
+        "layers": data.get("layers", []),
+        "block_definitions": data.get("block_definitions", [])
+    })
+
+
+def _json_path(field: str, prefix: str = "$") -> str:
+    """JSON-путь к ключу; передаётся параметром запроса и в текст SQL не попадает."""
+    return f'{prefix}."{field.replace(chr(34), "")}"'
+
+
+def _field_expression(field: str) -> Tuple[str, Tuple[Any, ...]]:
+    """SQL-выражение поля и его параметры: колонка сущности или значение из type_properties."""
+    if field in COLUMN_FIELDS:
+        return field, ()
+    return "json_extract(type_properties, ?)", (_json_path(field),)
+
+
+class SqliteEntities(Sequence):
+    """
+    Выборка сущностей как ленивая последовательность словарей.
+    Фильтры накапливаются в WHERE; длина, срезы, группировки и агрегаты выполняет SQLite.
+    """
+    numeric_fields = NUMERIC_FIELDS
+
+    def __init__(self, conn: sqlite3.Connection, conditions: Tuple[str, ...] = (),
+                 params: Tuple[Any, ...] = ()):
+        self._conn = conn
+        self._conditions = conditions
+        self._params = params
+        self._length: Optional[int] = None
+
+    def _where_sql(self) -> str:
+        return f" WHERE {' AND '.join(self._conditions)}" if self._conditions else ""
+
+    def _narrow(self, condition: str, *params: Any) -> "SqliteEntities":
+        return SqliteEntities(self._conn, self._conditions + (condition,), self._params + params)
+
+    def __len__(self) -> int:
+        if self._length is None:
+            self._length = self._conn.execute(
+                f"SELECT COUNT(*) FROM entities{self._where_sql()}", self._params
+            ).fetchone()[0]
+        return self._length
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            start, stop, step = position.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            rows = self._conn.execute(
+                f"SELECT data FROM entities{self._where_sql()} ORDER BY id LIMIT ? OFFSET ?",
+                self._params + (max(0, stop - start), start)
+            )
+            return [json.loads(row[0]) for row in rows]
+        if position < 0:
+            position += len(self)
+        rows = self[position:position + 1] if position >= 0 else []
+        if not rows:
+            raise IndexError(position)
+        return rows[0]
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        rows = self._conn.execute(f"SELECT data FROM entities{self._where_sql()} ORDER BY id", self._params)
+        for row in rows:
+            yield json.loads(row[0])
+
+    def where(self, field: str, value: Any) -> "SqliteEntities":
+        """Подвыборка по равенству поля."""
+        if field == "details_loaded":
+            value = 1 if value else 0
+        expression, params = _field_expression(field)
+        return self._narrow(f"{expression} = ?", *params, value)
+
+    def where_in(self, field: str, values: Iterable[Any]) -> "SqliteEntities":
+        """Подвыборка по вхождению значения поля в values."""
+        values = tuple(values)
+        if not values:
+            return self._narrow("0")
+        expression, params = _field_expression(field)
+        return self._narrow(f"{expression} IN ({', '.join('?' * len(values))})", *params, *values)
+
+    def with_block(self, name: str) -> "SqliteEntities":
+        """Вставки блока по имени или эффективному имени."""
+        return self._narrow("(block_name = ? OR effective_name = ?)", name, name)
+
+    def compare(self, field: str, operator: str, value: Any) -> "SqliteEntities":
+        """Фильтр property_filter: ==, >, <, >=, <=, contains."""
+        if field in COLUMN_FIELDS:
+            expression, params = field, ()
+        else:
+            expression = "COALESCE(json_extract(type_properties, ?), json_extract(data, ?))"
+            params = (_json_path(field), _json_path(field, "$.coordinates"))
+        if operator == "==":
+            return self._narrow(f"CAST({expression} AS TEXT) = ?", *params, str(value))
+        if operator == "contains":
+            return self._narrow(f"INSTR(LOWER(CAST({expression} AS TEXT)), ?) > 0", *params, str(value).lower())
+        if operator in (">", "<", ">=", "<="):
+            return self._narrow(
+                f"{expression} IS NOT NULL AND CAST({expression} AS REAL) {operator} ?",
+                *params, *params, float(value)
+            )
+        raise ValueError(f"Unsupported operator: {operator}")
+
+    def in_bbox(self, min_x: float, min_y: float, max_x: float, max_y: float) -> "SqliteEntities":
+        """Сущности, чей bounding box пересекает прямоугольник (поиск по R*Tree)."""
+        return self._narrow(
+            "id IN (SELECT id FROM entity_bbox WHERE max_x >= ? AND min_x <= ? AND max_y >= ? AND min_y <= ?)",
+            min_x, max_x, min_y, max_y
+        )
+
+    def value_counts(self, field: str) -> Dict[str, int]:
+        """Количество сущностей по значениям поля (в порядке первого появления)."""
+        expression, params = _field_expression(field)
+        rows = self._conn.execute(
+            f"SELECT {expression}, COUNT(*) FROM entities{self._where_sql()} "
+            f"GROUP BY 1 ORDER BY MIN(id)", params + self._params
+        )
+        return {value: count for value, count in rows}
+
+    def numeric(self, field: str) -> List[float]:
+        """Непустые значения числовой колонки."""
+        if field not in COLUMN_FIELDS:
+            raise ValueError(f"Not a numeric column: {field}")
+        rows = self._conn.execute(
+            f"SELECT {field} FROM entities{self._where_sql()}"
+            f"{' AND' if self._conditions else ' WHERE'} {field} IS NOT NULL ORDER BY id",
+            self._params
+        )
+        return [row[0] for row in rows]
+
+    def aggregate(self, field: str, function: str) -> Tuple[Optional[float], int]:
+        """
+        Агрегат по полю: (значение, число учтённых сущностей).
+        Нулевые значения колонок area/length/volume не учитываются, как и при переборе словарей.
+        """
+        sql_function = AGGREGATE_FUNCTIONS.get(function)
+        if sql_function is None:
+            raise ValueError(f"Unsupported aggregate: {function}")
+        expression, params = _field_expression(field)
+        if field in COLUMN_FIELDS:
+            narrowed = self._narrow(f"{expression} IS NOT NULL AND {expression} != 0")
+        else:
+            narrowed = self._narrow("json_type(type_properties, ?) IN ('integer', 'real')", *params)
+        result, count = self._conn.execute(
+            f"SELECT {sql_function}({expression}), COUNT(*) FROM entities{narrowed._where_sql()}",
+            params + narrowed._params
+        ).fetchone()
+        return result, count
+
+    def find(self, handle: str) -> Optional[Dict[str, Any]]:
+        """Поиск сущности по handle через индекс."""
+        row = self._conn.execute(
+            f"SELECT data FROM entities{self._narrow('handle = ?', handle)._where_sql()} LIMIT 1",
+            self._params + (handle,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+
+class SqliteCache(Mapping):
+    """
+    База SQLite в интерфейсе словаря load_cache():
+    metadata/last_updated/layers/block_definitions читаются сразу (они малы),
+    entities и производные секции категорий — ленивые SQL-выборки.
+    """
+
+    def __init__(self, path: str):
+        # Соединение только для чтения; объект живёт в резидентном кэше и доступен из разных потоков
+        self._conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        meta = {key: json.loads(value) for key, value in self._conn.execute("SELECT key, value FROM meta")}
+        self._values: Dict[str, Any] = {
+            "metadata": meta.get("metadata", {}),
+            "last_updated": meta.get("last_updated"),
+            "layers": [json.loads(row[0]) for row in self._conn.execute("SELECT data FROM layers ORDER BY rowid")],
+            "block_definitions": [
+                json.loads(row[0]) for row in self._conn.execute("SELECT data FROM block_definitions ORDER BY rowid")
+            ],
+            "entities": SqliteEntities(self._conn),
+        }
+        for name in CATEGORY_SECTIONS:
+            self._values[name] = DerivedSection(
+                self._values["entities"], name, self._values["block_definitions"]
+            )
+
+    def __getitem__(self, key: str) -> Any:
+        return self._values[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._values)
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def close(self):
+        self._conn.close()
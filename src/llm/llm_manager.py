@@ -10,7 +10,7 @@ import os
 import ollama
 import logging
 from dotenv import load_dotenv
-from typing import List, Dict, Any, Tuple, Optional
+from typing import List, Dict, Any, Tuple, Optional, Callable
 from ..cad.drawing_cache import DrawingCache
 from ..cad.dataclasses import EntityCache
 
@@ -35,6 +35,13 @@ class LLMManager:
     ✅ Поддержка filtered запросов + авто-подсказки
     """
 
+    # Догрузка деталей скелетных записей (DrawingCache.ensure_details), если есть подключение к AutoCAD
+    detail_loader: Optional[Callable[[List[str]], Dict[str, Any]]] = None
+
+    # Поля, заполненные уже в скелетной записи
+    SKELETON_FIELDS = {"handle", "object_name", "layer", "color", "linetype", "lineweight",
+                       "transparency", "visible", "bounding_box", "area", "length", "volume"}
+
     def __init__(self):
         self.model = os.getenv("OLLAMA_MODEL", "qwen2.5-coder:7b")
         self.api_url = os.getenv("LLM_API_URL", 'http://localhost:11434/')
@@ -240,17 +247,19 @@ class LLMManager:
                     - filtered: Фильтрованные объекты (layer/entity_type/property_filter)
                     - aggregate: Статистика (sum/avg/min/max/count)
                     - by_handle: Поиск по handle
+                    - block_definitions: Определения блоков (геометрия внутри блоков; block_name — состав одного определения)
                     
                     Пример filtered:
                     - query_type="filtered", layer="ОБЩ_Д_разметка"
                     - query_type="filtered", entity_type="AcDbBlockReference", property_filter={"field":"area","operator":">","value":100}
+                    - query_type="filtered", bbox=[0, 0, 100, 50] — объекты, пересекающие область
                     ''',
                     'parameters': {
                         'type': 'object',
                         'properties': {
                             'query_type': {
                                 'type': 'string',
-                                'enum': ["summary", "entities", "blocks", "texts", "dimensions", "layers", "filtered", "aggregate", "by_handle"],
+                                'enum': ["summary", "entities", "blocks", "texts", "dimensions", "layers", "filtered", "aggregate", "by_handle", "block_definitions"],
                                 'description': 'Тип запроса'
                             },
                             'entity_type': {'type': 'string', 'description': 'Фильтр по ObjectName'},
@@ -266,6 +275,13 @@ class LLMManager:
                                 },
                                 'required': ['field', 'operator', 'value']
                             },
+                            'bbox': {
+                                'type': 'array',
+                                'items': {'type': 'number'},
+                                'minItems': 4,
+                                'maxItems': 4,
+                                'description': 'Область [min_x, min_y, max_x, max_y] для filtered'
+                            },
                             'include_details': {'type': 'boolean', 'default': False},
                             'aggregate': {
                                 'type': 'object',
@@ -294,7 +310,8 @@ class LLMManager:
         property_filter: Optional[dict] = None,
         include_details: bool = False,
         aggregate: Optional[dict] = None,
-        limit: int = 100
+        limit: int = 100,
+        bbox: Optional[List[float]] = None
     ) -> str:
         """Получить информацию из кэша чертежа с полной поддержкой filtered."""
         try:
@@ -302,16 +319,15 @@ class LLMManager:
             if cache is None:
                 return json.dumps({"error": True, "message": "Кэш не найден. Выполните 'full_cache'."}, indent=2, ensure_ascii=False)
 
+            if LLMManager._load_details_for_query(cache, query_type, entity_type, layer, handle, block_name,
+                                                  property_filter, include_details, aggregate, limit):
+                cache = DrawingCache.load_cache() or cache
+
             # ===== SUMMARY =====
             if query_type == "summary":
                 entities = cache.get("entities", [])
-                type_counts = {}
-                layer_counts = {}
-                for e in entities:
-                    t = e.get("object_name", "Unknown")
-                    type_counts[t] = type_counts.get(t, 0) + 1
-                    l = e.get("layer", "Unknown")
-                    layer_counts[l] = layer_counts.get(l, 0) + 1
+                type_counts = LLMManager._value_counts(entities, "object_name")
+                layer_counts = LLMManager._value_counts(entities, "layer")
 
                 return json.dumps({
                     "total_entities": len(entities),
@@ -322,7 +338,8 @@ class LLMManager:
                     "by_type": type_counts,
                     "by_layer": layer_counts,
                     "metadata": cache.get("metadata", {}),
-                    "last_updated": cache.get("last_updated")
+                    "last_updated": cache.get("last_updated"),
+                    "cache_status": DrawingCache.last_status
                 }, indent=2, ensure_ascii=False, default=str)
 
             # ===== LAYERS =====
@@ -335,9 +352,9 @@ class LLMManager:
             if query_type == "entities":
                 data = cache.get("entities", [])
                 if entity_type:
-                    data = [e for e in data if e.get("object_name") == entity_type]
+                    data = LLMManager._where(data, "object_name", entity_type)
                 if layer:
-                    data = [e for e in data if e.get("layer") == layer]
+                    data = LLMManager._where(data, "layer", layer)
 
                 simplified = [{"handle": e.get("handle"), "type": e.get("object_name"), "layer": e.get("layer"), "center": e.get("bounding_box", {}).get("center") if e.get("bounding_box") else None} for e in data[:limit]]
                 return json.dumps({"count": len(data), "showing": len(simplified), "entities": simplified}, indent=2, ensure_ascii=False)
@@ -347,17 +364,28 @@ class LLMManager:
                 data = cache.get("entities", [])
 
                 if entity_type:
-                    data = [e for e in data if e.get("object_name") == entity_type]
+                    data = LLMManager._where(data, "object_name", entity_type)
                 if layer:
-                    data = [e for e in data if e.get("layer") == layer]
+                    data = LLMManager._where(data, "layer", layer)
                 if block_name:
-                    data = [e for e in data if e.get("type_properties", {}).get("block_name") == block_name or e.get("type_properties", {}).get("effective_name") == block_name]
+                    if hasattr(data, "with_block"):
+                        data = data.with_block(block_name)
+                    else:
+                        data = [e for e in data if e.get("type_properties", {}).get("block_name") == block_name or e.get("type_properties", {}).get("effective_name") == block_name]
+                if bbox and len(bbox) == 4:
+                    data = LLMManager._in_bbox(data, bbox)
 
                 if property_filter:
                     field = property_filter.get("field")
                     operator = property_filter.get("operator")
                     value = property_filter.get("value")
-                    if field and operator:
+                    if field and operator and hasattr(data, "compare"):
+                        # SQLite: условие добавляется в WHERE запроса
+                        try:
+                            data = data.compare(field, operator, value)
+                        except (ValueError, TypeError):
+                            data = []
+                    elif field and operator:
                         filtered = []
                         for e in data:
                             prop_value = e.get(field) or e.get("type_properties", {}).get(field) or e.get("coordinates", {}).get(field)
@@ -379,14 +407,14 @@ class LLMManager:
 
                 # Авто-подсказки при 0 результатах
                 if not data:
-                    available_layers = list(set(e.get("layer") for e in cache.get("entities", []) if e.get("layer")))[:10]
-                    available_types = list(set(e.get("object_name") for e in cache.get("entities", []) if e.get("object_name")))[:10]
+                    available_layers = [l for l in LLMManager._value_counts(cache.get("entities", []), "layer") if l][:10]
+                    available_types = [t for t in LLMManager._value_counts(cache.get("entities", []), "object_name") if t][:10]
                     return json.dumps({
                         "count": 0,
                         "message": "Объекты не найдены. Доступные варианты:",
                         "suggested_layers": available_layers,
                         "suggested_types": available_types,
-                        "filters_applied": {"layer": layer, "entity_type": entity_type, "block_name": block_name}
+                        "filters_applied": {"layer": layer, "entity_type": entity_type, "block_name": block_name, "bbox": bbox}
                     }, indent=2, ensure_ascii=False)
 
                 if include_details:
@@ -412,17 +440,50 @@ class LLMManager:
                 if layer: data = [d for d in data if d.get("layer") == layer]
                 return json.dumps({"count": len(data), "dimensions": data[:limit]}, indent=2, ensure_ascii=False, default=str)
 
+            # ===== BLOCK DEFINITIONS =====
+            if query_type == "block_definitions":
+                data = cache.get("block_definitions", [])
+                references: Dict[str, int] = {}
+                for b in cache.get("blocks", []):
+                    if b.get("definition"):
+                        references[b["definition"]] = references.get(b["definition"], 0) + 1
+                if block_name:
+                    for d in data:
+                        if d.get("name") == block_name:
+                            entities = d.get("entities", [])
+                            if not include_details:
+                                entities = [{"handle": e.get("handle"), "type": e.get("object_name"), "layer": e.get("layer")} for e in entities]
+                            return json.dumps({"found": True, "name": block_name, "origin": d.get("origin"), "references": references.get(block_name, 0), "bounding_box": d.get("bounding_box"), "count": len(entities), "showing": min(len(entities), limit), "entities": entities[:limit]}, indent=2, ensure_ascii=False, default=str)
+                    return json.dumps({"found": False, "block_name": block_name}, indent=2, ensure_ascii=False)
+                simplified = []
+                for d in data[:limit]:
+                    by_type: Dict[str, int] = {}
+                    for e in d.get("entities", []):
+                        by_type[e.get("object_name")] = by_type.get(e.get("object_name"), 0) + 1
+                    simplified.append({"name": d.get("name"), "references": references.get(d.get("name"), 0), "entity_count": len(d.get("entities", [])), "by_type": by_type, "is_xref": d.get("is_xref", False)})
+                return json.dumps({"count": len(data), "showing": len(simplified), "block_definitions": simplified}, indent=2, ensure_ascii=False)
+
             # ===== AGGREGATE =====
             if query_type == "aggregate" and aggregate:
                 data = cache.get("entities", [])
-                if entity_type: data = [e for e in data if e.get("object_name") == entity_type]
-                if layer: data = [e for e in data if e.get("layer") == layer]
+                if entity_type: data = LLMManager._where(data, "object_name", entity_type)
+                if layer: data = LLMManager._where(data, "layer", layer)
 
                 values = []
-                for e in data:
-                    val = e.get(aggregate["field"]) or e.get("type_properties", {}).get(aggregate["field"])
-                    if isinstance(val, (int, float)):
-                        values.append(float(val))
+                if hasattr(data, "aggregate") and aggregate["function"] in ("sum", "avg", "min", "max", "count"):
+                    # SQLite: агрегат считается запросом
+                    result, count = data.aggregate(aggregate["field"], aggregate["function"])
+                    if not count:
+                        return json.dumps({"field": aggregate["field"], "result": None, "count": 0}, indent=2, ensure_ascii=False)
+                    return json.dumps({"field": aggregate["field"], "function": aggregate["function"], "result": result, "count": count}, indent=2, ensure_ascii=False)
+                if aggregate["field"] in getattr(data, "numeric_fields", ()):
+                    # Колоночный кэш: значения читаются прямо из колонки
+                    values = [v for v in data.numeric(aggregate["field"]) if v]
+                else:
+                    for e in data:
+                        val = e.get(aggregate["field"]) or e.get("type_properties", {}).get(aggregate["field"])
+                        if isinstance(val, (int, float)):
+                            values.append(float(val))
 
                 if not values:
                     return json.dumps({"field": aggregate["field"], "result": None, "count": 0}, indent=2, ensure_ascii=False)
@@ -433,19 +494,111 @@ class LLMManager:
 
             # ===== BY_HANDLE =====
             if query_type == "by_handle" and handle:
+                entities = cache.get("entities", [])
+                if hasattr(entities, "find"):
+                    item = entities.find(handle)
+                    if item is not None:
+                        return json.dumps({"found": True, "category": "entities", "data": item}, indent=2, ensure_ascii=False, default=str)
                 for cat in ["entities", "blocks", "texts", "dimensions"]:
+                    if hasattr(cache.get(cat), "find"):
+                        continue
                     for item in cache.get(cat, []):
                         if item.get("handle") == handle:
                             return json.dumps({"found": True, "category": cat, "data": item}, indent=2, ensure_ascii=False, default=str)
                 return json.dumps({"found": False, "handle": handle}, indent=2, ensure_ascii=False)
 
             # ===== DEFAULT =====
-            return json.dumps({"warning": True, "message": f"Запрос '{query_type}' требует реализации", "available": ["summary", "entities", "blocks", "texts", "dimensions", "layers", "filtered", "aggregate", "by_handle"]}, indent=2, ensure_ascii=False)
+            return json.dumps({"warning": True, "message": f"Запрос '{query_type}' требует реализации", "available": ["summary", "entities", "blocks", "texts", "dimensions", "layers", "filtered", "aggregate", "by_handle", "block_definitions"]}, indent=2, ensure_ascii=False)
 
         except Exception as e:
             logger.error(f"Error in get_drawing_info: {e}", exc_info=True)
             return json.dumps({"error": True, "message": f"Ошибка: {str(e)}"}, indent=2, ensure_ascii=False)
 
+    @staticmethod
+    def _load_details_for_query(cache: Dict[str, Any], query_type: str, entity_type: Optional[str],
+                                layer: Optional[str], handle: Optional[str], block_name: Optional[str],
+                                property_filter: Optional[dict], include_details: bool,
+                                aggregate: Optional[dict], limit: int) -> bool:
+        """
+        Догрузка деталей скелетных записей, которые понадобятся запросу.
+        Возвращает True, если кэш обновлён и его нужно перечитать.
+        """
+        if LLMManager.detail_loader is None:
+            return False
+        # Полностью извлечённый кэш: скелетных записей нет, сущности не перебираются
+        if (cache.get("metadata") or {}).get("skeleton_pending") == 0:
+            return False
+
+        skeletons = LLMManager._where(cache.get("entities", []), "details_loaded", False)
+        if not skeletons:
+            return False
+
+        if query_type == "by_handle":
+            if hasattr(skeletons, "find"):
+                needed = [e for e in [skeletons.find(handle)] if e is not None]
+            else:
+                needed = [e for e in skeletons if e.get("handle") == handle]
+        elif query_type == "blocks":
+            needed = list(LLMManager._where(skeletons, "object_name", "AcDbBlockReference"))
+        elif query_type == "texts":
+            needed = [e for e in skeletons if e.get("object_name") in ["AcDbText", "AcDbMText"]]
+        elif query_type == "dimensions":
+            needed = [e for e in skeletons if "AcDbDimension" in str(e.get("object_name"))]
+        elif query_type == "filtered" and (block_name or include_details or (
+                property_filter and property_filter.get("field") not in LLMManager.SKELETON_FIELDS)):
+            needed = skeletons
+        elif query_type == "aggregate" and aggregate and aggregate.get("field") not in LLMManager.SKELETON_FIELDS:
+            needed = skeletons
+        else:
+            return False
+
+        if query_type in ["blocks", "texts", "dimensions", "filtered", "aggregate"]:
+            if layer:
+                needed = LLMManager._where(needed, "layer", layer)
+            if entity_type and query_type in ["filtered", "aggregate"]:
+                needed = LLMManager._where(needed, "object_name", entity_type)
+            if query_type == "filtered" and not block_name and not property_filter:
+                # Нужны только детали показываемых объектов
+                needed = needed[:limit]
+
+        handles = [e.get("handle") for e in needed]
+        if not handles:
+            return False
+        # Резидентный кэш сбрасывается при записи, load_cache() вернёт новую версию
+        return bool(LLMManager.detail_loader(handles))
+
+    @staticmethod
+    def _where(data, field: str, value: Any):
+        """Фильтр по равенству поля; колоночный кэш фильтрует по колонке без сборки строк."""
+        if hasattr(data, "where"):
+            return data.where(field, value)
+        return [e for e in data if e.get(field) == value]
+
+    @staticmethod
+    def _in_bbox(data, bbox: List[float]):
+        """Объекты, чей bounding box пересекает область; SQLite ищет по R*Tree."""
+        min_x, min_y, max_x, max_y = (float(v) for v in bbox)
+        if hasattr(data, "in_bbox"):
+            return data.in_bbox(min_x, min_y, max_x, max_y)
+        result = []
+        for e in data:
+            box = e.get("bounding_box")
+            if box and box["max"][0] >= min_x and box["min"][0] <= max_x \
+                    and box["max"][1] >= min_y and box["min"][1] <= max_y:
+                result.append(e)
+        return result
+
+    @staticmethod
+    def _value_counts(data, field: str) -> Dict[str, int]:
+        """Количество сущностей по значениям поля."""
+        if hasattr(data, "value_counts"):
+            return data.value_counts(field)
+        counts: Dict[str, int] = {}
+        for e in data:
+            key = e.get(field, "Unknown")
+            counts[key] = counts.get(key, 0) + 1
+        return counts
+
     def process_prompt(self, prompt: str) -> Tuple[List[Dict], str]:
         """Отправляет запрос в LLM и возвращает tool_calls и текст."""
         try:
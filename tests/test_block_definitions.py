@@ -0,0 +1,75 @@
+import math
+
+from src.cad.autocad_client import AutoCADClient
+from src.cad.drawing_cache import DrawingCache
+from src.cad.fake_autocad import FakeApplication, FakeBlockReference, FakeCircle, FakeLine, FakePolyline
+
+
+def _door_drawing(references=3):
+    app = FakeApplication()
+    doc = app.ActiveDocument
+    door = doc.Blocks.Add((1.0, 0.0, 0.0), "DOOR")
+    door.add(FakeLine("A0", (1, 0, 0), (2, 0, 0)))
+    door.add(FakeCircle("A1", (1, 1, 0), 0.5))
+    for i in range(references):
+        doc.ModelSpace.add(FakeBlockReference(format(0x200 + i, "X"), door, (10.0 * i, 0.0, 0.0)))
+    return app
+
+
+def test_block_definitions_extracted_once_and_shared(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    cad = AutoCADClient()
+    cad.attach(_door_drawing())
+    cache = DrawingCache(cad)
+    cache.full_cache_update()
+
+    data = DrawingCache.load_cache()
+    assert [d["name"] for d in data["block_definitions"]] == ["DOOR"]
+    assert len(data["block_definitions"][0]["entities"]) == 2
+    assert {b["definition"] for b in data["blocks"]} == {"DOOR"}
+
+    geometry = {e.handle: e for e in cache.get_block_geometry("202")}
+    line_box = geometry["A0"].bounding_box
+    assert (line_box.min_x, line_box.max_x) == (20.0, 21.0)
+
+    extract_full = cad._extract_entity_full
+    calls = []
+    monkeypatch.setattr(cad, "_extract_entity_full",
+                        lambda ent, *args: calls.append(ent.Handle) or extract_full(ent, *args))
+    assert DrawingCache(cad).delta_cache_update()["modified"] == 0
+    assert calls == []
+
+
+def test_block_geometry_transforms_points_and_vertices(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    app = _door_drawing(references=0)
+    doc = app.ActiveDocument
+    door = doc.Blocks.Item("DOOR")
+    door.add(FakePolyline("A2", [(1.0, 0.0), (2.0, 0.0), (2.0, 1.0)]))
+    doc.ModelSpace.add(FakeBlockReference("300", door, (10.0, 0.0, 0.0), scale=2.0, rotation=math.pi / 2))
+    cad = AutoCADClient()
+    cad.attach(app)
+    cache = DrawingCache(cad)
+    cache.full_cache_update()
+
+    geometry = {e.handle: e for e in cache.get_block_geometry("300")}
+
+    def rounded(values):
+        return [round(v, 9) + 0.0 for v in values]
+
+    assert rounded(geometry["A0"].coordinates.start) == [10.0, 0.0, 0.0]
+    assert rounded(geometry["A0"].coordinates.end) == [10.0, 2.0, 0.0]
+    assert rounded(geometry["A1"].coordinates.center) == [8.0, 0.0, 0.0]
+    assert rounded(geometry["A2"].coordinates.vertices) == [10.0, 0.0, 0.0, 10.0, 2.0, 0.0, 8.0, 2.0, 0.0]
+    # Определение блока не меняется
+    definition = cache.entity_cache.block_definitions["DOOR"]
+    assert {e.handle: e for e in definition.entities}["A2"].coordinates.vertices.tolist()[:3] == [1.0, 0.0, 0.0]
+
+
+def test_block_transform_applies_rotation_and_scale():
+    from src.cad.geometry_analysis import GeometryAnalyzer
+
+    matrix = GeometryAnalyzer.block_transform([5, 5, 0], {"x": 2, "y": 2, "z": 1}, math.pi / 2, [1, 0, 0])
+    point = GeometryAnalyzer.transform_point(matrix, [2, 0, 0])
+
+    assert [round(v, 9) for v in point] == [5.0, 7.0, 0.0]
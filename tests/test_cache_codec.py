@@ -0,0 +1,40 @@
+import io
+import json
+
+import pytest
+
+from src.cad import cache_codec
+from src.cad.autocad_client import AutoCADClient
+from src.cad.cache_layout import CATEGORY_SECTIONS
+from src.cad.drawing_cache import DrawingCache
+from src.cad.fake_autocad import build_synthetic_drawing
+
+SECTIONS = ("entities",) + CATEGORY_SECTIONS
+
+
+@pytest.mark.parametrize("codec", ["gzip", "lzma"])
+def test_compressed_cache_round_trip(tmp_path, monkeypatch, codec):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("CACHE_FORMAT", "json")
+    cad = AutoCADClient()
+    cad.attach(build_synthetic_drawing(100, seed=2))
+    cache = DrawingCache(cad)
+    cache.full_cache_update()
+    plain = {key: list(value) if key in SECTIONS else value for key, value in DrawingCache.load_cache().items()}
+
+    monkeypatch.setenv("CACHE_COMPRESSION", codec)
+    cache.full_cache_update()
+
+    assert cache_codec.detect_codec("drawing_cache.json") == codec
+    loaded = dict(DrawingCache.load_cache())
+    for key in ("snapshot_id", "last_updated"):
+        plain.pop(key), loaded.pop(key)
+    assert loaded == plain
+
+
+def test_stream_parser_handles_values_split_across_reads(monkeypatch):
+    monkeypatch.setattr(cache_codec, "_CHUNK_SIZE", 3)
+    data = {"metadata": {"name": "план", "size": 12345}, "entities": [{"handle": "1A", "area": 1.5e-3},
+            {"handle": "1B", "text": "a \"quoted\" [value]"}], "empty": [], "last_updated": None}
+
+    assert cache_codec.load_json_stream(io.StringIO(json.dumps(data, indent=2))) == data
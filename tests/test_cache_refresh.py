@@ -0,0 +1,112 @@
+import sqlite3
+import threading
+
+import pytest
+
+from src.cad.autocad_client import AutoCADClient
+from src.cad.cache_refresh import BackgroundCacheRefresher, background_refresh_enabled
+from src.cad.drawing_cache import DrawingCache
+from src.cad.fake_autocad import build_grid_drawing
+
+
+def _cached_drawing(tmp_path, monkeypatch, count=20):
+    monkeypatch.chdir(tmp_path)
+    app = build_grid_drawing(count)
+    cad = AutoCADClient()
+    cad.attach(app)
+    cache = DrawingCache(cad)
+    cache.full_cache_update()
+    return app, cad, cache
+
+
+def _layer(data, handle):
+    return next(e["layer"] for e in data["entities"] if e["handle"] == handle)
+
+
+def test_rebuild_swaps_snapshot_after_running_queries(tmp_path, monkeypatch):
+    app, cad, cache = _cached_drawing(tmp_path, monkeypatch)
+    app.ActiveDocument.ModelSpace.Item(0).Layer = "MOVED"
+    old = DrawingCache.load_cache()
+    swapped = []
+
+    with DrawingCache.reading():
+        worker = threading.Thread(target=lambda: swapped.append(DrawingCache(cad).rebuild_snapshot()))
+        worker.start()
+        worker.join(0.5)
+        # Запрос ещё читает прежний снимок — подмена ждёт
+        assert worker.is_alive()
+        assert _layer(old, "100") == "LINES"
+    worker.join()
+
+    assert swapped == [True]
+    assert not (tmp_path / "drawing_cache.json.next").exists()
+    assert _layer(DrawingCache.load_cache(), "100") == "MOVED"
+    # Сущности в памяти относились к прежнему снимку и перечитываются
+    assert cache.get_entity_by_handle("100").layer == "MOVED"
+
+
+def test_refresher_rebuilds_on_request(tmp_path, monkeypatch):
+    app, cad, _ = _cached_drawing(tmp_path, monkeypatch)
+    app.ActiveDocument.ModelSpace.Item(1).Delete()
+    refresher = BackgroundCacheRefresher(cad, poll=0)
+    refresher.start()
+    try:
+        refresher.request()
+        assert refresher.wait_idle(10)
+    finally:
+        refresher.stop(5)
+
+    assert refresher.refreshes == 1
+    assert len(DrawingCache.load_cache()["entities"]) == 19
+
+
+def test_refresher_rebuilds_when_dwg_changes(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    dwg = tmp_path / "plan.dwg"
+    dwg.write_bytes(b"AC1032" + bytes(1000))
+    app = build_grid_drawing(20)
+    app.ActiveDocument.FullName = str(dwg)
+    cad = AutoCADClient()
+    cad.attach(app)
+    DrawingCache(cad).full_cache_update()
+
+    app.ActiveDocument.ModelSpace.Item(0).Layer = "SAVED"
+    dwg.write_bytes(b"AC1032" + bytes(1001))
+    refresher = BackgroundCacheRefresher(cad, poll=0.05)
+    refresher.start()
+    try:
+        assert refresher.check() == "stale"
+        assert refresher.wait_idle(10)
+    finally:
+        refresher.stop(5)
+
+    assert DrawingCache.cache_status(DrawingCache.load_cache()) == "fresh"
+    assert _layer(DrawingCache.load_cache(), "100") == "SAVED"
+
+
+def test_snapshot_replaced_during_query_is_closed_after_it(tmp_path, monkeypatch):
+    monkeypatch.setenv("CACHE_FORMAT", "sqlite")
+    _, cad, cache = _cached_drawing(tmp_path, monkeypatch)
+    loaded = []
+
+    with DrawingCache.reading():
+        old = DrawingCache.load_cache()
+        DrawingCache.release_loaded_cache()
+        # Поток обновления перечитывает кэш, пока запрос ещё читает прежний снимок
+        worker = threading.Thread(target=lambda: loaded.append(DrawingCache.load_cache()))
+        worker.start()
+        worker.join(10)
+        assert loaded and loaded[0] is not old
+        assert len(list(old["entities"].where("layer", "LINES"))) == 10
+
+    with pytest.raises(sqlite3.ProgrammingError):
+        list(old["entities"].where("layer", "LINES"))
+    assert len(list(DrawingCache.load_cache()["entities"].where("layer", "LINES"))) == 10
+    DrawingCache.release_loaded_cache()
+
+
+def test_background_refresh_is_opt_in(monkeypatch):
+    monkeypatch.delenv("CACHE_BACKGROUND_REFRESH", raising=False)
+    assert not background_refresh_enabled()
+    monkeypatch.setenv("CACHE_BACKGROUND_REFRESH", "1")
+    assert background_refresh_enabled()
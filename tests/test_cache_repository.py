@@ -0,0 +1,50 @@
+from src.cad.autocad_client import AutoCADClient
+from src.cad.cache_repository import cache_repository, drawing_key
+from src.cad.drawing_cache import DrawingCache
+from src.cad.fake_autocad import build_grid_drawing
+
+
+def _drawing(tmp_path, name, count):
+    app = build_grid_drawing(count)
+    path = tmp_path / name
+    path.write_bytes(b"dwg" * count)
+    app.ActiveDocument.Name = name
+    app.ActiveDocument.FullName = str(path)
+    return app
+
+
+def test_switching_drawings_serves_each_drawing_cache(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("CACHE_DIR", "caches")
+    app_a, app_b = _drawing(tmp_path, "a.dwg", 4), _drawing(tmp_path, "b.dwg", 9)
+    cad = AutoCADClient()
+    cad.attach(app_a)
+    cache = DrawingCache(cad)
+    cache.full_cache_update()
+
+    object.__setattr__(app_a, "ActiveDocument", app_b.ActiveDocument)
+    cache.full_cache_update()
+    assert len(DrawingCache.load_cache()["entities"]) == 9
+
+    object.__setattr__(app_a, "ActiveDocument", _drawing(tmp_path, "a.dwg", 4).ActiveDocument)
+    cache.select_drawing()
+    data = DrawingCache.load_cache()
+    assert data["metadata"]["drawing_name"] == "a.dwg"
+    assert len(data["entities"]) == 4
+    entry = cache_repository().entry(drawing_key(str(tmp_path / "a.dwg")))
+    assert entry["fingerprint"] and entry["size"] > 0
+
+
+def test_least_recently_used_drawing_is_evicted(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("CACHE_DIR", "caches")
+    monkeypatch.setenv("CACHE_MAX_SIZE_MB", "0.001")
+    for name in ("a.dwg", "b.dwg"):
+        cad = AutoCADClient()
+        cad.attach(_drawing(tmp_path, name, 10))
+        DrawingCache(cad).full_cache_update()
+
+    repository = cache_repository()
+    assert [e["drawing_name"] for e in repository.entries()] == ["b.dwg"]
+    assert not (tmp_path / "caches" / drawing_key(str(tmp_path / "a.dwg"))).exists()
+    assert DrawingCache.load_cache()["metadata"]["drawing_name"] == "b.dwg"
@@ -0,0 +1,52 @@
+import json
+
+from src.cad.autocad_client import AutoCADClient
+from src.cad.cache_layout import CATEGORY_SECTIONS
+from src.cad.columnar_cache import ColumnarCache
+from src.cad.drawing_cache import DrawingCache
+from src.cad.fake_autocad import build_synthetic_drawing
+
+SECTIONS = ("entities",) + CATEGORY_SECTIONS
+
+
+def _build_cache(tmp_path, monkeypatch, fmt, skeleton=False):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("CACHE_FORMAT", fmt)
+    cad = AutoCADClient()
+    cad.attach(build_synthetic_drawing(200, seed=5))
+    cache = DrawingCache(cad)
+    cache.full_cache_update(skeleton=skeleton)
+    return cache
+
+
+def test_columnar_cache_matches_json(tmp_path, monkeypatch):
+    (tmp_path / "json").mkdir()
+    (tmp_path / "columnar").mkdir()
+    _build_cache(tmp_path / "json", monkeypatch, "json")
+    expected = {key: list(value) if key in SECTIONS else value for key, value in DrawingCache.load_cache().items()}
+    _build_cache(tmp_path / "columnar", monkeypatch, "columnar")
+    loaded = DrawingCache.load_cache()
+
+    assert isinstance(loaded, ColumnarCache)
+    entities = loaded["entities"]
+    assert len(entities) == len(expected["entities"])
+    assert json.loads(json.dumps(list(entities), default=str)) == json.loads(json.dumps(expected["entities"], default=str))
+    assert list(loaded["blocks"]) == expected["blocks"]
+    assert entities.value_counts("layer") == {
+        name: sum(1 for e in expected["entities"] if e["layer"] == name)
+        for name in {e["layer"] for e in expected["entities"]}
+    }
+    circles = entities.where("object_name", "AcDbCircle")
+    assert [e["handle"] for e in circles] == [e["handle"] for e in expected["entities"] if e["object_name"] == "AcDbCircle"]
+    DrawingCache.release_loaded_cache()
+
+
+def test_columnar_skeleton_cache_loads_details(tmp_path, monkeypatch):
+    cache = _build_cache(tmp_path, monkeypatch, "columnar", skeleton=True)
+    handle = DrawingCache.load_cache()["entities"].where("object_name", "AcDbCircle")[0]["handle"]
+
+    loaded = cache.ensure_details([handle])
+
+    assert "radius" in loaded[handle].type_properties
+    reloaded = DrawingCache.load_cache()["entities"].find(handle)
+    assert reloaded["details_loaded"] is True
@@ -0,0 +1,39 @@
+import json
+import logging
+
+from src.cad.autocad_client import AutoCADClient
+from src.cad.drawing_cache import DrawingCache
+from src.cad.fake_autocad import build_grid_drawing
+
+
+def test_full_cache_update_writes_com_profile(tmp_path, monkeypatch, capsys, caplog):
+    monkeypatch.chdir(tmp_path)
+    cad = AutoCADClient()
+    cad.attach(build_grid_drawing(10))
+
+    with caplog.at_level(logging.INFO, logger="src.cad.drawing_cache"):
+        DrawingCache(cad, profile=True).full_cache_update()
+
+    # Отчёт идёт в лог, а не в stdout (обновление может выполняться в фоновом потоке)
+    assert "COM profile" not in capsys.readouterr().out
+    assert any("COM profile:" in record.getMessage() for record in caplog.records)
+
+    profile = json.loads((tmp_path / "com_profile.json").read_text(encoding="utf-8"))
+    assert profile["by_object_name"]["AcDbCircle"]["calls"] > 0
+    radius = [c for c in profile["calls"] if c["object_name"] == "AcDbCircle" and c["property"] == "Radius"]
+    # Одна проверка при компиляции плана + одно чтение на каждый из 5 кругов
+    assert radius[0]["calls"] == 6
+    assert sum(radius[0]["histogram"].values()) == 6
+    assert any(c["property"] == "GetBoundingBox" for c in profile["calls"])
+
+
+def test_profiler_is_off_by_default(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("COM_PROFILE", raising=False)
+    cad = AutoCADClient()
+    cad.attach(build_grid_drawing(4))
+
+    DrawingCache(cad).full_cache_update()
+
+    assert cad.profiler is None
+    assert not (tmp_path / "com_profile.json").exists()
@@ -0,0 +1,90 @@
+import json
+import sys
+from array import array
+
+import pytest
+
+from src.cad import geometry_analysis
+from src.cad.autocad_client import AutoCADClient
+from src.cad.dataclasses import EMPTY_PROPERTIES, EntityProperties
+from src.cad.fake_autocad import build_synthetic_drawing
+from src.cad.geometry_analysis import GeometryAnalyzer
+
+
+def test_compact_entities_round_trip_and_share_strings():
+    cad = AutoCADClient()
+    cad.attach(build_synthetic_drawing(200, seed=4))
+    extracted = cad.get_all_entities_detailed()
+    loaded = [EntityProperties.from_dict(json.loads(json.dumps(e.to_dict(), default=str))) for e in extracted]
+
+    assert [e.to_dict() for e in loaded] == [e.to_dict() for e in extracted]
+    for entities in (extracted, loaded):
+        layers = {}
+        for entity in entities:
+            assert layers.setdefault(entity.layer, entity.layer) is entity.layer
+            assert entity.object_name is sys.intern(entity.object_name)
+    bare = [e for e in loaded if not e.type_properties]
+    bare.append(EntityProperties.from_dict({"handle": "1", "object_name": "AcDbPoint", "type_properties": {}}))
+    assert all(e.type_properties is EMPTY_PROPERTIES for e in bare)
+    assert all(e.to_dict()["type_properties"] == {} for e in bare)
+
+
+@pytest.mark.skipif(sys.version_info < (3, 10), reason="dataclass slots need Python 3.10")
+def test_entity_classes_have_no_instance_dict():
+    entity = EntityProperties.from_dict({"handle": "1", "object_name": "AcDbLine",
+                                         "bounding_box": {"min": [0, 0, 0], "max": [1, 1, 0]}})
+    for obj in (entity, entity.coordinates, entity.bounding_box):
+        assert not hasattr(obj, "__dict__")
+
+
+@pytest.mark.parametrize("use_numpy", [False, True])
+def test_polyline_vertices_are_flat_buffers(monkeypatch, use_numpy):
+    if not use_numpy:
+        monkeypatch.setattr(geometry_analysis, "numpy", None)
+    elif geometry_analysis.numpy is None:
+        pytest.skip("NumPy is not installed")
+    app = build_synthetic_drawing(200, seed=6)
+    cad = AutoCADClient()
+    cad.attach(app)
+    polylines = [e for e in cad.get_all_entities_detailed() if e.object_name == "AcDbPolyline"]
+    sources = {ent.Handle: ent for ent in app.ActiveDocument.ModelSpace if ent.ObjectName == "AcDbPolyline"}
+
+    assert polylines
+    for entity in polylines:
+        vertices = entity.coordinates.vertices
+        raw = sources[entity.handle].Coordinates
+        assert isinstance(vertices, array) and vertices.typecode == 'd'
+        assert entity.coordinates.vertex_count == entity.type_properties["num_vertices"] == len(raw) // 2
+        assert list(vertices[0::3]) == list(raw[0::2]) and list(vertices[1::3]) == list(raw[1::2])
+        closed = entity.type_properties["closed"]
+        assert GeometryAnalyzer.polyline_length(vertices, closed) == pytest.approx(entity.length)
+        assert GeometryAnalyzer.vertices_bbox(vertices).xy == pytest.approx(entity.bounding_box.xy)
+        moved = GeometryAnalyzer.transform_vertices(GeometryAnalyzer.block_transform([5, 6, 0], {}, 0.0), vertices)
+        assert list(moved[0::3]) == pytest.approx([x + 5 for x in vertices[0::3]])
+
+        data = json.loads(json.dumps(entity.to_dict()))
+        assert data["coordinates"]["vertices"] == vertices.tolist()
+        assert EntityProperties.from_dict(data).coordinates.vertices == vertices
+        legacy = dict(data, coordinates={"vertices": [vertices[i:i + 3].tolist() for i in range(0, len(vertices), 3)]})
+        assert EntityProperties.from_dict(legacy).coordinates.vertices == vertices
+
+
+def test_vertex_geometry_numpy_matches_python(monkeypatch):
+    if geometry_analysis.numpy is None:
+        pytest.skip("NumPy is not installed")
+    matrix = GeometryAnalyzer.block_transform([5.0, -2.0, 1.0], {"x": 2.0, "y": 0.5, "z": 1.0}, 0.7)
+    buffers = [(), array('d', [1.0, 2.0, 3.0]), [0.0, 0.0, 0.0, 3.0, 4.0, 0.0, 3.0, 4.0, 12.0],
+               array('d', (v * 0.37 for v in range(300)))]
+
+    def run():
+        return [(GeometryAnalyzer.vertices_bbox(v), GeometryAnalyzer.polyline_length(v),
+                 GeometryAnalyzer.polyline_length(v, closed=True),
+                 list(GeometryAnalyzer.transform_vertices(matrix, v))) for v in buffers]
+
+    vectorized = run()
+    monkeypatch.setattr(geometry_analysis, "numpy", None)
+    for fast, plain in zip(vectorized, run()):
+        assert fast[0] == plain[0]
+        assert fast[1] == pytest.approx(plain[1]) and fast[2] == pytest.approx(plain[2])
+        assert fast[3] == pytest.approx(plain[3])
+    assert vectorized[2][1] == pytest.approx(5.0 + 12.0)
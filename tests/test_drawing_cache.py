@@ -0,0 +1,437 @@
+import json
+import os
+
+import pytest
+
+from src.cad import cache_freshness
+from src.cad.autocad_client import AutoCADClient
+from src.cad.cache_index import IndexedJsonCache
+from src.cad.drawing_cache import DrawingCache
+from src.cad.fake_autocad import (
+    build_grid_drawing, build_synthetic_drawing, FakeBlockReference, FakeComObject, FakeDimension, FakeEntity,
+    FakeLine, FakePolyline, FakeText
+)
+
+
+def _cached_drawing(tmp_path, monkeypatch, count=20):
+    monkeypatch.chdir(tmp_path)
+    app = build_grid_drawing(count)
+    cad = AutoCADClient()
+    cad.attach(app)
+    cache = DrawingCache(cad)
+    cache.full_cache_update()
+    return app, cad, cache
+
+
+def test_delta_cache_update_detects_changes(tmp_path, monkeypatch):
+    app, cad, _ = _cached_drawing(tmp_path, monkeypatch)
+    model_space = app.ActiveDocument.ModelSpace
+    model_space.Item(0).Layer = "MOVED"
+    model_space.Item(1).Delete()
+    model_space.add(FakeLine("FFFF", (0, 0, 0), (1, 1, 0)))
+
+    cache = DrawingCache(cad)
+    stats = cache.delta_cache_update()
+
+    assert stats == {"added": 1, "modified": 1, "erased": 1, "total": 20}
+    assert cache.get_entity_by_handle("100").layer == "MOVED"
+    assert cache.get_entity_by_handle("101") is None
+    assert cache.get_entity_by_handle("FFFF").object_name == "AcDbLine"
+
+
+def test_delta_changes_are_journaled_and_replayed(tmp_path, monkeypatch):
+    monkeypatch.setenv("CACHE_JOURNAL_COMPACT_RATIO", "10")
+    app, cad, _ = _cached_drawing(tmp_path, monkeypatch)
+    base = (tmp_path / "drawing_cache.json").read_bytes()
+    model_space = app.ActiveDocument.ModelSpace
+    model_space.Item(0).Layer = "MOVED"
+    model_space.Item(1).Delete()
+    model_space.add(FakeLine("FFFF", (0, 0, 0), (1, 1, 0)))
+
+    cache = DrawingCache(cad)
+    cache.delta_cache_update()
+
+    assert (tmp_path / "drawing_cache.json").read_bytes() == base
+    assert (tmp_path / "drawing_cache.json.journal").exists()
+    expected = json.loads(json.dumps(cache.entity_cache.to_dict()["entities"], default=str))
+    assert list(DrawingCache.load_cache()["entities"]) == expected
+
+    monkeypatch.setenv("CACHE_JOURNAL_COMPACT_RATIO", "0")
+    model_space.Item(1).Layer = "COMPACTED"
+    DrawingCache(cad).delta_cache_update()
+
+    assert not (tmp_path / "drawing_cache.json.journal").exists()
+    layers = {e["handle"]: e["layer"] for e in DrawingCache.load_cache()["entities"]}
+    assert layers["100"] == "MOVED" and layers["102"] == "COMPACTED" and "101" not in layers
+
+
+def test_delta_cache_update_without_changes(tmp_path, monkeypatch):
+    _, cad, _ = _cached_drawing(tmp_path, monkeypatch)
+
+    stats = DrawingCache(cad).delta_cache_update()
+
+    assert stats == {"added": 0, "modified": 0, "erased": 0, "total": 20}
+
+
+class FakeMText(FakeEntity):
+    object_name = "AcDbMText"
+
+
+class FakeHatch(FakeEntity):
+    object_name = "AcDbHatch"
+
+
+class FakeAttributedBlockReference(FakeBlockReference):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        object.__setattr__(self, "attributes", [FakeComObject(TagString="MARK", TextString="D1")])
+
+    def GetAttributes(self):
+        self._call()
+        return self.attributes
+
+
+def _same_bbox_drawing():
+    app = build_grid_drawing(0)
+    doc = app.ActiveDocument
+    block = doc.Blocks.Add((0.0, 0.0, 0.0), "TAG")
+    block.add(FakeLine("10", (0, 0, 0), (1, 1, 0)))
+    for ent in (
+        FakeText("A1", "OLD", (0.0, 0.0, 0.0)),
+        FakeMText("A2", bbox=((0, 0, 0), (10, 5, 0)), TextString="OLD", Height=2.5, Width=10.0, AttachmentPoint=1),
+        FakePolyline("A3", [(0.0, 0.0), (5.0, 5.0), (10.0, 0.0)]),
+        FakeDimension("A4", (0.0, 0.0, 0.0), (10.0, 0.0, 0.0)),
+        FakeAttributedBlockReference("A5", block, (20.0, 0.0, 0.0)),
+        FakeHatch("A6", bbox=((0, 0, 0), (10, 10, 0)), PatternName="ANSI31", PatternScale=1.0,
+                  PatternAngle=0.0, NumLoops=1),
+    ):
+        doc.ModelSpace.add(ent)
+    return app
+
+
+@pytest.mark.parametrize("handle, edit, key, expected", [
+    ("A1", lambda e: setattr(e, "TextString", "NEW"), "text_string", "NEW"),
+    ("A2", lambda e: setattr(e, "TextString", "NEW"), "text_string", "NEW"),
+    ("A3", lambda e: setattr(e, "Coordinates", (0.0, 0.0, 5.0, 2.0, 10.0, 0.0)), "num_vertices", 3),
+    ("A4", lambda e: setattr(e, "TextOverride", "<> max"), "text_string", "<> max"),
+    ("A5", lambda e: setattr(e.attributes[0], "TextString", "D2"), "attributes", [{"tag": "MARK", "text": "D2"}]),
+    ("A6", lambda e: setattr(e, "PatternName", "ANSI37"), "pattern_name", "ANSI37"),
+])
+def test_delta_cache_update_detects_edits_inside_same_bbox(tmp_path, monkeypatch, handle, edit, key, expected):
+    monkeypatch.chdir(tmp_path)
+    app = _same_bbox_drawing()
+    cad = AutoCADClient()
+    cad.attach(app)
+    DrawingCache(cad).full_cache_update()
+    ent = app.ActiveDocument.ModelSpace.by_handle(handle)
+    edit(ent)
+
+    cache = DrawingCache(cad)
+    stats = cache.delta_cache_update()
+
+    assert stats == {"added": 0, "modified": 1, "erased": 0, "total": 6}
+    cached = cache.get_entity_by_handle(handle)
+    assert cached.type_properties[key] == expected
+    if handle == "A3":
+        assert cached.coordinates.vertices.tolist() == [0.0, 0.0, 0.0, 5.0, 2.0, 0.0, 10.0, 0.0, 0.0]
+
+
+@pytest.mark.parametrize("cache_format", ["json", "columnar", "sqlite"])
+def test_delta_cache_update_keeps_unchanged_entities_of_every_type(tmp_path, monkeypatch, cache_format):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("CACHE_FORMAT", cache_format)
+    cad = AutoCADClient()
+    cad.attach(build_synthetic_drawing(300, seed=3))
+    DrawingCache(cad).full_cache_update()
+
+    stats = DrawingCache(cad).delta_cache_update()
+
+    assert stats == {"added": 0, "modified": 0, "erased": 0, "total": 300}
+
+
+def test_delta_cache_update_without_cache_reports_full_rescan(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    cad = AutoCADClient()
+    cad.attach(build_grid_drawing(20))
+
+    stats = DrawingCache(cad).delta_cache_update()
+
+    assert stats == {"added": 20, "modified": 0, "erased": 0, "total": 20, "full_rescan": True}
+    assert len(DrawingCache.load_cache()["entities"]) == 20
+
+
+def test_full_cache_update_resumes_from_checkpoint(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    cad = AutoCADClient()
+    cad.attach(build_grid_drawing(25))
+    cache = DrawingCache(cad)
+    cache.chunk_size = 10
+
+    iter_chunks = cad.iter_entity_chunks
+    starts = []
+
+    def crash_after_two_chunks(chunk_size, start, **kwargs):
+        starts.append(start)
+        for number, chunk in enumerate(iter_chunks(chunk_size, start, **kwargs)):
+            if number == 2:
+                raise RuntimeError("AutoCAD stopped responding")
+            yield chunk
+
+    monkeypatch.setattr(cad, "iter_entity_chunks", crash_after_two_chunks)
+    cache.full_cache_update()
+    assert (tmp_path / "drawing_cache.json.checkpoint").exists()
+    assert DrawingCache.load_cache() is None
+
+    def record_start(chunk_size, start, **kwargs):
+        starts.append(start)
+        yield from iter_chunks(chunk_size, start, **kwargs)
+
+    monkeypatch.setattr(cad, "iter_entity_chunks", record_start)
+    cache.full_cache_update()
+
+    assert starts == [0, 20]
+    assert not (tmp_path / "drawing_cache.json.checkpoint").exists()
+    data = DrawingCache.load_cache()
+    assert [e["handle"] for e in data["entities"]] == [format(i + 0x100, "X") for i in range(25)]
+    assert cache.get_entity_by_handle("118").object_name == "AcDbLine"
+
+
+def test_skeleton_cache_loads_details_on_demand(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    cad = AutoCADClient()
+    cad.attach(build_grid_drawing(10))
+    cache = DrawingCache(cad)
+    cache.full_cache_update(skeleton=True)
+
+    assert DrawingCache.load_cache()["metadata"]["skeleton_pending"] == 10
+    circle = DrawingCache.load_cache()["entities"][1]
+    assert circle["details_loaded"] is False
+    assert circle["type_properties"] == {}
+    assert circle["bounding_box"] is not None
+
+    loaded = cache.ensure_details(["101"])
+
+    assert loaded["101"].type_properties["radius"] == 2.5
+    reloaded = {e["handle"]: e for e in DrawingCache.load_cache()["entities"]}
+    assert reloaded["101"]["details_loaded"] is True
+    assert reloaded["100"]["details_loaded"] is False
+    assert DrawingCache.load_cache()["metadata"]["skeleton_pending"] == 9
+
+    cache.full_cache_update()
+    assert DrawingCache.load_cache()["metadata"]["skeleton_pending"] == 0
+
+
+def test_partial_cache_update_refreshes_selected_layer(tmp_path, monkeypatch):
+    app, cad, _ = _cached_drawing(tmp_path, monkeypatch)
+    model_space = app.ActiveDocument.ModelSpace
+    model_space.Item(1).Radius = 4.0
+    model_space.Item(3).Delete()
+    model_space.add(FakeLine("FFFF", (0, 0, 0), (1, 1, 0), layer="CIRCLES"))
+    model_space.Item(0).Layer = "UNTOUCHED"
+
+    cache = DrawingCache(cad)
+    stats = cache.partial_cache_update(layer="circles")
+
+    assert stats == {"refreshed": 9, "added": 1, "erased": 1, "total": 20}
+    assert cache.get_entity_by_handle("101").type_properties["radius"] == 4.0
+    assert cache.get_entity_by_handle("103") is None
+    assert cache.get_entity_by_handle("100").layer == "LINES"
+
+
+def test_select_entities_pushes_filter_to_selection_set(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    cad = AutoCADClient()
+    cad.attach(build_grid_drawing(16))
+
+    circles = cad.select_entities(entity_type="AcDbCircle", window=((-5, -5), (16, 16)))
+
+    assert sorted(e.handle for e in circles) == ["101", "105"]
+    assert cad.doc.SelectionSets.Count == 0
+
+
+def test_load_cache_stays_resident_until_file_changes(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("CACHE_FORMAT", "json")
+    cad = AutoCADClient()
+    cad.attach(build_grid_drawing(5))
+    cache = DrawingCache(cad)
+    cache.full_cache_update(skeleton=True)
+
+    first = DrawingCache.load_cache()
+    assert DrawingCache.load_cache() is first
+
+    cache.ensure_details([first["entities"][0]["handle"]])
+    assert DrawingCache.load_cache() is not first
+
+    current = DrawingCache.load_cache()
+    data = json.loads((tmp_path / "drawing_cache.json").read_text(encoding="utf-8"))
+    data["metadata"]["drawing_name"] = "changed-elsewhere.dwg"
+    (tmp_path / "drawing_cache.json").write_text(json.dumps(data), encoding="utf-8")
+    reloaded = DrawingCache.load_cache()
+    assert reloaded is not current
+    assert reloaded["metadata"]["drawing_name"] == "changed-elsewhere.dwg"
+
+
+def test_category_sections_are_derived_from_entities(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("CACHE_JOURNAL_COMPACT_RATIO", "10")
+    app = build_synthetic_drawing(60, seed=2)
+    cad = AutoCADClient()
+    cad.attach(app)
+    DrawingCache(cad).full_cache_update()
+
+    stored = json.loads((tmp_path / "drawing_cache.json").read_text(encoding="utf-8"))
+    assert not {"blocks", "texts", "dimensions"} & stored.keys()
+    data = DrawingCache.load_cache()
+    inserts = [e["handle"] for e in data["entities"] if e["object_name"] == "AcDbBlockReference"]
+    assert [b["handle"] for b in data["blocks"]] == inserts
+    assert {b["definition"] for b in data["blocks"]} <= {"DOOR", "WINDOW", "COLUMN"}
+
+    app.ActiveDocument.HandleToObject(inserts[0]).Delete()
+    DrawingCache(cad).delta_cache_update()
+
+    assert (tmp_path / "drawing_cache.json.journal").exists()
+    assert [b["handle"] for b in DrawingCache.load_cache()["blocks"]] == inserts[1:]
+
+
+def test_json_cache_is_read_through_offset_index(tmp_path, monkeypatch):
+    monkeypatch.setenv("CACHE_JOURNAL_COMPACT_RATIO", "10")
+    app, cad, _ = _cached_drawing(tmp_path, monkeypatch)
+    assert (tmp_path / "drawing_cache.json.idx").exists()
+
+    data = DrawingCache.load_cache()
+    assert isinstance(data, IndexedJsonCache)
+    assert data["entities"].find("105")["object_name"] == "AcDbCircle"
+    assert DrawingCache(cad).get_entity_by_handle("105").type_properties["radius"] == 2.5
+
+    model_space = app.ActiveDocument.ModelSpace
+    model_space.Item(0).Layer = "MOVED"
+    model_space.Item(1).Delete()
+    DrawingCache(cad).delta_cache_update()
+
+    entities = DrawingCache.load_cache()["entities"]
+    assert isinstance(DrawingCache.load_cache(), IndexedJsonCache)
+    assert entities.find("101") is None
+    assert [e["handle"] for e in entities.where("layer", "MOVED")] == ["100"]
+    assert len(entities) == 19
+
+    monkeypatch.setenv("CACHE_COMPRESSION", "gzip")
+    DrawingCache(cad).full_cache_update()
+    assert not (tmp_path / "drawing_cache.json.idx").exists()
+
+
+def test_stale_cache_is_detected_and_refreshed(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    dwg = tmp_path / "plan.dwg"
+    dwg.write_bytes(b"AC1032" + bytes(200000))
+    app = build_grid_drawing(20)
+    app.ActiveDocument.FullName = str(dwg)
+    cad = AutoCADClient()
+    cad.attach(app)
+    cache = DrawingCache(cad)
+    cache.full_cache_update()
+
+    assert DrawingCache.cache_status(DrawingCache.load_cache()) == "fresh"
+
+    app.ActiveDocument.ModelSpace.Item(0).Layer = "MOVED"
+    dwg.write_bytes(b"AC1032" + bytes(200001))
+    DrawingCache.load_cache()
+    assert DrawingCache.last_status == "stale"
+
+    assert cache.ensure_fresh() == "fresh"
+    assert cache.get_entity_by_handle("100").layer == "MOVED"
+
+    dwg.unlink()
+    DrawingCache.load_cache()
+    assert DrawingCache.last_status == "unknown"
+
+
+def test_same_size_dwg_edit_outside_sampled_blocks_is_stale(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("CACHE_FINGERPRINT_FULL_HASH", "1")
+    dwg = tmp_path / "plan.dwg"
+    content = bytearray(b"AC1032" + bytes(1000000))
+    dwg.write_bytes(content)
+    app = build_grid_drawing(4)
+    app.ActiveDocument.FullName = str(dwg)
+    cad = AutoCADClient()
+    cad.attach(app)
+    DrawingCache(cad).full_cache_update()
+    data = DrawingCache.load_cache()
+    mtime = os.stat(dwg).st_mtime_ns
+
+    # Пересохранение без изменений: содержимое подтверждено, новый mtime запомнен
+    os.utime(dwg, ns=(mtime + 10 ** 9, mtime + 10 ** 9))
+    assert DrawingCache.cache_status(data) == "fresh"
+    assert json.loads((tmp_path / "drawing_cache.json.dwgcheck").read_text())["mtime_ns"] == mtime + 10 ** 9
+    assert DrawingCache.cache_status(data) == "fresh"
+
+    # Правка того же размера вне выборочных блоков
+    content[200000] = 1
+    dwg.write_bytes(content)
+    os.utime(dwg, ns=(mtime + 2 * 10 ** 9, mtime + 2 * 10 ** 9))
+    assert DrawingCache.cache_status(data) == "stale"
+
+
+def test_fingerprint_does_not_read_whole_dwg_by_default(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    dwg = tmp_path / "plan.dwg"
+    content = bytearray(b"AC1032" + bytes(1000000))
+    dwg.write_bytes(content)
+    app = build_grid_drawing(4)
+    app.ActiveDocument.FullName = str(dwg)
+    cad = AutoCADClient()
+    cad.attach(app)
+    reads = []
+    monkeypatch.setattr(cache_freshness, "content_hash", lambda path: reads.append(path))
+    DrawingCache(cad).full_cache_update()
+    data = DrawingCache.load_cache()
+    mtime = os.stat(dwg).st_mtime_ns
+
+    assert data["metadata"]["fingerprint"]["content_hash"] is None
+    os.utime(dwg, ns=(mtime + 10 ** 9, mtime + 10 ** 9))
+    assert DrawingCache.cache_status(data) == "fresh"
+    content[0] = 1
+    dwg.write_bytes(content)
+    os.utime(dwg, ns=(mtime + 2 * 10 ** 9, mtime + 2 * 10 ** 9))
+    assert DrawingCache.cache_status(data) == "stale"
+    assert reads == []
+
+
+def test_entity_cache_indexes_follow_updates(tmp_path, monkeypatch):
+    app, cad, _ = _cached_drawing(tmp_path, monkeypatch)
+    cache = DrawingCache(cad)
+    lines = cache.get_entities_by_layer("LINES")
+    assert [e.handle for e in lines] == [e.handle for e in cache.entity_cache.entities.values() if e.layer == "LINES"]
+
+    model_space = app.ActiveDocument.ModelSpace
+    model_space.Item(0).Layer = "MOVED"
+    model_space.Item(2).Delete()
+    cache.delta_cache_update()
+
+    assert [e.handle for e in cache.get_entities_by_layer("MOVED")] == ["100"]
+    assert "100" not in {e.handle for e in cache.get_entities_by_layer("LINES")}
+    assert "102" not in {e.handle for e in cache.get_entities_by_type("AcDbLine")}
+    assert len(cache.get_entities_by_layer("LINES")) == len(lines) - 2
+
+
+def test_parsed_json_entities_answer_filters_by_hash(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("CACHE_COMPRESSION", "gzip")
+    cad = AutoCADClient()
+    cad.attach(build_synthetic_drawing(300, seed=3))
+    DrawingCache(cad).full_cache_update()
+
+    entities = DrawingCache.load_cache()["entities"]
+    plain = list(entities)
+
+    assert list(entities.where("layer", plain[5]["layer"])) == [e for e in plain if e["layer"] == plain[5]["layer"]]
+    counts = {}
+    for e in plain:
+        counts[e["object_name"]] = counts.get(e["object_name"], 0) + 1
+    assert entities.value_counts("object_name") == counts
+    assert entities.find(plain[42]["handle"]) == plain[42]
+    block = next(e for e in plain if e["object_name"] == "AcDbBlockReference")["type_properties"]["block_name"]
+    assert list(entities.with_block(block)) == [
+        e for e in plain if block in (e["type_properties"].get("block_name"), e["type_properties"].get("effective_name"))
+    ]
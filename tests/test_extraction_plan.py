@@ -0,0 +1,123 @@
+from collections import defaultdict
+
+from src.cad import extraction_plan
+from src.cad.autocad_client import AutoCADClient
+from src.cad.extraction_plan import ExtractionPlan
+from src.cad.fake_autocad import build_grid_drawing, build_synthetic_drawing, FakeCircle, FakeComError, FakeEntity
+
+
+class FakeLWPolyline(FakeEntity):
+    object_name = "AcDbPolyline"
+
+
+def test_lwpolyline_coordinates_are_read_as_pairs():
+    app = build_grid_drawing(0)
+    app.ActiveDocument.ModelSpace.add(FakeLWPolyline("A1", Coordinates=(0.0, 0.0, 3.0, 0.0, 3.0, 4.0)))
+    cad = AutoCADClient()
+    cad.attach(app)
+
+    entity, = cad.get_all_entities_detailed()
+
+    assert entity.coordinates.vertices.tolist() == [0.0, 0.0, 0.0, 3.0, 0.0, 0.0, 3.0, 4.0, 0.0]
+    assert entity.type_properties["num_vertices"] == 3
+
+
+class FlakyCircle(FakeCircle):
+    """Круг, у которого Radius есть, но чтение отказывает."""
+
+    @property
+    def Radius(self):
+        raise FakeComError("Call was rejected by callee.")
+
+
+class PerEntityPlans:
+    """Базовое поведение без реестра: проверка свойств заново на каждом объекте."""
+
+    def get(self, ent, object_name):
+        return ExtractionPlan.compile(ent, object_name)
+
+    def clear(self):
+        pass
+
+
+def _by_type(entities):
+    grouped = defaultdict(list)
+    for entity in entities:
+        grouped[entity.object_name].append(entity.to_dict())
+    return grouped
+
+
+def _count_probes(monkeypatch):
+    probes = []
+    probe = extraction_plan.probe_attribute
+    monkeypatch.setattr(extraction_plan, "probe_attribute", lambda ent, attr: probes.append(attr) or probe(ent, attr))
+    return probes
+
+
+def test_plan_is_compiled_once_per_object_name(monkeypatch):
+    probes = _count_probes(monkeypatch)
+    counts = []
+    for count in (50, 500):
+        cad = AutoCADClient()
+        cad.attach(build_synthetic_drawing(count, seed=1))
+        entities = cad.get_all_entities_detailed()
+        counts.append(len(probes))
+        del probes[:]
+        assert len(cad._plans) == len({e.object_name for e in entities})
+
+    # Число проверок зависит от набора типов, а не от числа объектов
+    assert counts[0] == counts[1] > 0
+
+
+def test_plan_output_matches_per_entity_probing():
+    cad = AutoCADClient()
+    cad.attach(build_synthetic_drawing(400, seed=2))
+    baseline = AutoCADClient()
+    baseline.attach(build_synthetic_drawing(400, seed=2))
+    baseline._plans = PerEntityPlans()
+
+    planned, expected = _by_type(cad.get_all_entities_detailed()), _by_type(baseline.get_all_entities_detailed())
+
+    assert len(planned) > 4
+    assert planned.keys() == expected.keys()
+    for object_name in expected:
+        assert planned[object_name] == expected[object_name], object_name
+
+
+def test_failed_read_during_probe_keeps_property_in_plan():
+    app = build_grid_drawing(0)
+    model = app.ActiveDocument.ModelSpace
+    model.add(FlakyCircle("A1", (0.0, 0.0, 0.0), 1.0))
+    model.add(FakeCircle("A2", (5.0, 0.0, 0.0), 2.0))
+    cad = AutoCADClient()
+    cad.attach(app)
+
+    flaky, circle = cad.get_all_entities_detailed()
+
+    assert "radius" in [key for key, _ in cad._plans.get(None, "AcDbCircle").type_properties]
+    assert flaky.error is None and "radius" not in flaky.type_properties
+    assert flaky.type_properties["diameter"] == 2.0
+    assert circle.type_properties["radius"] == 2.0
+
+
+class Fake3dPolyline(FakeEntity):
+    """3D-полилиния без Length, у которой GetBoundingBox отказывает."""
+    object_name = "AcDb3dPolyline"
+
+    def GetBoundingBox(self, min_pt, max_pt):
+        raise FakeComError("Call was rejected by callee.")
+
+
+def test_missing_bbox_and_length_are_computed_from_vertices():
+    app = build_grid_drawing(0)
+    app.ActiveDocument.ModelSpace.add(Fake3dPolyline("A1", Coordinates=(0.0, 0.0, 0.0, 3.0, 4.0, 0.0, 3.0, 4.0, 12.0)))
+    cad = AutoCADClient()
+    cad.attach(app)
+
+    entity, = cad.get_all_entities_detailed()
+
+    box = entity.bounding_box
+    assert (box.min_x, box.min_y, box.min_z, box.max_x, box.max_y, box.max_z) == (0.0, 0.0, 0.0, 3.0, 4.0, 12.0)
+    assert entity.length == 17.0
+    # Дельта-проверка считает те же значения и не видит изменений
+    assert cad.extract_changed_entities({entity.handle: entity}) == ([], [], [])
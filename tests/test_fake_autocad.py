@@ -0,0 +1,29 @@
+from collections import Counter
+
+from src.cad.autocad_client import AutoCADClient
+from src.cad.fake_autocad import build_synthetic_drawing
+
+
+def test_synthetic_drawing_contains_all_entity_kinds():
+    cad = AutoCADClient()
+    cad.attach(build_synthetic_drawing(300, seed=7))
+
+    entities = cad.get_all_entities_detailed()
+    by_type = Counter(e.object_name for e in entities)
+
+    assert len(entities) == 300
+    assert set(by_type) == {
+        "AcDbLine", "AcDbPolyline", "AcDbCircle", "AcDbArc",
+        "AcDbBlockReference", "AcDbText", "AcDbRotatedDimension"
+    }
+    assert set(cad.get_block_definitions()) == {"DOOR", "WINDOW", "COLUMN"}
+
+
+def test_injected_failures_do_not_abort_extraction():
+    cad = AutoCADClient()
+    cad.attach(build_synthetic_drawing(300, failure_rate=0.05, seed=3))
+
+    entities = cad.get_all_entities_detailed(workers=3)
+
+    assert 0 < sum(1 for e in entities if e.error) < len(entities)
+    assert len(entities) <= 300
@@ -0,0 +1,41 @@
+from src.cad.autocad_client import AutoCADClient
+from src.cad.fake_autocad import build_grid_drawing, FakeEntity
+
+
+def test_parallel_extraction_matches_sequential():
+    cad = AutoCADClient()
+    cad.attach(build_grid_drawing(101))
+
+    sequential = cad.get_all_entities_detailed()
+    parallel = cad.get_all_entities_detailed(workers=4)
+
+    assert [e.handle for e in parallel] == [e.handle for e in sequential]
+    assert [e.to_dict() for e in parallel] == [e.to_dict() for e in sequential]
+
+
+def test_parallel_extraction_more_workers_than_entities():
+    cad = AutoCADClient()
+    cad.attach(build_grid_drawing(3))
+
+    entities = cad.get_all_entities_detailed(workers=8)
+
+    assert [e.object_name for e in entities] == ["AcDbLine", "AcDbCircle", "AcDbLine"]
+
+
+def test_xdata_read_only_for_registered_applications(monkeypatch):
+    app = build_grid_drawing(4)
+    doc = app.ActiveDocument
+    doc.RegisteredApplications.Add("MY_PLUGIN")
+    doc.ModelSpace.Item(0).SetXData([1001, 1000], ["MY_PLUGIN", "pipe"])
+    cad = AutoCADClient()
+    cad.attach(app)
+
+    requested = []
+    get_xdata = FakeEntity.GetXData
+    monkeypatch.setattr(FakeEntity, "GetXData", lambda ent, name: requested.append(name) or get_xdata(ent, name))
+
+    entities = cad.get_all_entities_detailed()
+
+    assert entities[0].xdata == {"MY_PLUGIN": {"type_codes": [1001, 1000], "values": ["MY_PLUGIN", "pipe"]}}
+    assert sorted(set(requested)) == ["ACAD", "MY_PLUGIN"]
+    assert len(requested) == 8
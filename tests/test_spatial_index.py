@@ -0,0 +1,157 @@
+import random
+
+import pytest
+
+from src.cad import bbox_store
+from src.cad.autocad_client import AutoCADClient
+from src.cad.dataclasses import BoundingBox, EntityCache, EntityProperties
+from src.cad.drawing_cache import DrawingCache
+from src.cad.fake_autocad import build_synthetic_drawing, FakeLine
+from src.cad.geometry_analysis import GeometryAnalyzer
+from src.cad.spatial_index import SpatialGrid
+
+
+def _hits(boxes, window):
+    min_x, min_y, max_x, max_y = window
+    return [key for key, b in boxes.items() if b[2] >= min_x and b[0] <= max_x and b[3] >= min_y and b[1] <= max_y]
+
+
+def test_grid_query_matches_full_scan():
+    rng = random.Random(7)
+    boxes = {}
+    for i in range(2000):
+        x, y = rng.uniform(0, 1000), rng.uniform(0, 1000)
+        boxes[i] = (x, y, x + rng.uniform(0, 20), y + rng.uniform(0, 20))
+    boxes["huge"] = (-1e6, -1e6, 1e6, 1e6)
+    boxes["point"] = (500.0, 500.0, 500.0, 500.0)
+    grid = SpatialGrid.build(boxes.items())
+
+    for key in range(0, 2000, 3):
+        grid.remove(key)
+        del boxes[key]
+    for key in range(1, 200, 3):
+        x, y = rng.uniform(0, 1000), rng.uniform(0, 1000)
+        boxes[key] = (x, y, x + 5, y + 5)
+        grid.insert(key, boxes[key])
+
+    assert len(grid) == len(boxes)
+    for _ in range(200):
+        x0, x1 = sorted(rng.uniform(-50, 1050) for _ in range(2))
+        y0, y1 = sorted(rng.uniform(-50, 1050) for _ in range(2))
+        assert sorted(grid.query(x0, y0, x1, y1), key=str) == sorted(_hits(boxes, (x0, y0, x1, y1)), key=str)
+    assert {"huge", "point"} <= set(grid.query(500, 500, 500, 500))
+
+
+@pytest.mark.parametrize("fmt", ["json", "columnar", "sqlite"])
+def test_spatial_queries_match_full_scan_after_delta(tmp_path, monkeypatch, fmt):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("CACHE_FORMAT", fmt)
+    monkeypatch.setenv("CACHE_JOURNAL_COMPACT_RATIO", "10")
+    app = build_synthetic_drawing(400, seed=3)
+    cad = AutoCADClient()
+    cad.attach(app)
+    cache = DrawingCache(cad)
+    cache.full_cache_update()
+    model_space = app.ActiveDocument.ModelSpace
+    model_space.Item(0).Layer = "MOVED"
+    model_space.Item(5).Delete()
+    model_space.add(FakeLine("FFFF", (10, 10, 0), (20, 20, 0)))
+    cache.delta_cache_update()
+
+    entities = list(cache.entity_cache.entities.values())
+    records = DrawingCache.load_cache()["entities"]
+    rng = random.Random(1)
+    for _ in range(50):
+        x0, x1 = sorted(rng.uniform(-10, 210) for _ in range(2))
+        y0, y1 = sorted(rng.uniform(-10, 210) for _ in range(2))
+        window = BoundingBox(x0, y0, -1e9, x1, y1, 1e9)
+        assert cache.find_in_bbox(window) == [
+            e for e in entities if e.bounding_box and GeometryAnalyzer._bbox_intersects(e.bounding_box, window)
+        ]
+        assert [e["handle"] for e in records.in_bbox(x0, y0, x1, y1)] == [
+            e["handle"] for e in records if e["bounding_box"] and e["bounding_box"]["max"][0] >= x0
+            and e["bounding_box"]["min"][0] <= x1 and e["bounding_box"]["max"][1] >= y0
+            and e["bounding_box"]["min"][1] <= y1
+        ]
+        target = rng.choice(entities)
+        assert cache.find_intersecting_entities(target.handle) == \
+            GeometryAnalyzer.find_intersecting_entities(entities, target)
+        assert cache.find_nearby_entities((x0, y0, 0.0), 25.0) == \
+            GeometryAnalyzer.find_nearby_entities(entities, (x0, y0, 0.0), 25.0)
+    DrawingCache.release_loaded_cache()
+
+
+def _entity(number, rng):
+    box = None
+    if rng.random() < 0.9:
+        x, y = rng.uniform(0, 1000), rng.uniform(0, 1000)
+        box = BoundingBox(x, y, 0.0, x + rng.uniform(0, 30), y + rng.uniform(0, 30), rng.uniform(0, 3))
+    return EntityProperties(
+        handle=format(number, "X"), object_name=rng.choice(["AcDbLine", "AcDbCircle"]), layer=rng.choice("AB"),
+        color=256, linetype="ByLayer", bounding_box=box,
+        area=rng.choice([None, rng.uniform(0, 10)]), length=rng.choice([None, rng.uniform(0, 10)])
+    )
+
+
+@pytest.mark.parametrize("use_numpy", [False, True])
+def test_bounding_box_arrays_match_object_scan(monkeypatch, use_numpy):
+    if not use_numpy:
+        monkeypatch.setattr(bbox_store, "numpy", None)
+    elif bbox_store.numpy is None:
+        pytest.skip("NumPy is not installed")
+    rng = random.Random(2)
+    cache = EntityCache()
+    cache.add_entities(_entity(i, rng) for i in range(3000))
+    cache.combined_bbox()
+    for i in range(0, 3000, 2):
+        cache.remove_entity(format(i, "X"))
+    for i in range(1, 2000, 4):
+        cache.add_entity(_entity(i, rng))
+    entities = list(cache.entities.values())
+
+    assert GeometryAnalyzer.calculate_combined_bbox(cache) == GeometryAnalyzer.calculate_combined_bbox(entities)
+    stats, expected = GeometryAnalyzer.calculate_statistics(cache), GeometryAnalyzer.calculate_statistics(entities)
+    assert stats["total_area"] == pytest.approx(expected["total_area"])
+    assert stats["total_length"] == pytest.approx(expected["total_length"])
+    sums = ("total_area", "total_length")
+    assert {k: v for k, v in stats.items() if k not in sums} == {k: v for k, v in expected.items() if k not in sums}
+    for _ in range(30):
+        x0, x1 = sorted(rng.uniform(-50, 1050) for _ in range(2))
+        y0, y1 = sorted(rng.uniform(-50, 1050) for _ in range(2))
+        window = BoundingBox(x0, y0, 0.0, x1, y1, 1.0)
+        assert cache.find_entities_in_bbox(window) == [
+            e for e in entities if e.bounding_box and GeometryAnalyzer._bbox_intersects(e.bounding_box, window)
+        ]
+
+
+def _store_results(store, windows):
+    return store.extent(), store.totals(), [store.in_box(low, high) for low, high in windows]
+
+
+def test_bounding_box_store_numpy_matches_python(monkeypatch):
+    if bbox_store.numpy is None:
+        pytest.skip("NumPy is not installed")
+    rng = random.Random(4)
+    windows = [((x, y, -1.0), (x + 200, y + 200, 1.0)) for x, y in ((0, 0), (400, 400), (-500, -500))]
+    empty = bbox_store.BoundingBoxStore()
+    no_boxes = bbox_store.BoundingBoxStore()
+    for i in range(50):
+        no_boxes.set(format(i, "X"), None, area=rng.choice([None, 1.5]), length=2.0)
+    compacted = bbox_store.BoundingBoxStore()
+    for i in range(3000):
+        x, y = rng.uniform(0, 1000), rng.uniform(0, 1000)
+        compacted.set(format(i, "X"), (x, y, 0.0, x + 5, y + 5, 0.0), area=rng.uniform(0, 3), length=None)
+    for i in range(0, 3000, 3):
+        compacted.remove(format(i, "X"))
+    for i in range(1, 3000, 3):
+        compacted.remove(format(i, "X"))
+    assert compacted._dead < 1024 and len(compacted) == 1000
+
+    stores = (empty, no_boxes, compacted)
+    vectorized = [_store_results(store, windows) for store in stores]
+    monkeypatch.setattr(bbox_store, "numpy", None)
+    for fast, plain in zip(vectorized, [_store_results(store, windows) for store in stores]):
+        assert fast[0] == plain[0] and fast[2] == plain[2]
+        assert fast[1] == pytest.approx(plain[1])
+    assert vectorized[0] == (None, {"total_area": 0.0, "total_length": 0.0, "entities_with_bbox": 0}, [[], [], []])
+    assert vectorized[1][0] is None and vectorized[1][1]["entities_with_bbox"] == 0
@@ -0,0 +1,87 @@
+import json
+
+from src.cad.autocad_client import AutoCADClient
+from src.cad.cache_layout import CATEGORY_SECTIONS
+from src.cad.drawing_cache import DrawingCache
+from src.cad.fake_autocad import build_synthetic_drawing
+from src.cad.sqlite_cache import SqliteCache
+
+SECTIONS = ("entities",) + CATEGORY_SECTIONS
+
+
+def _build_cache(tmp_path, monkeypatch, fmt, skeleton=False):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("CACHE_FORMAT", fmt)
+    cad = AutoCADClient()
+    cad.attach(build_synthetic_drawing(200, seed=5))
+    cache = DrawingCache(cad)
+    cache.full_cache_update(skeleton=skeleton)
+    return cache
+
+
+def test_sqlite_cache_queries_match_json(tmp_path, monkeypatch):
+    (tmp_path / "json").mkdir()
+    (tmp_path / "sqlite").mkdir()
+    _build_cache(tmp_path / "json", monkeypatch, "json")
+    expected = {key: list(value) if key in SECTIONS else value for key, value in DrawingCache.load_cache().items()}
+    _build_cache(tmp_path / "sqlite", monkeypatch, "sqlite")
+    loaded = DrawingCache.load_cache()
+
+    assert isinstance(loaded, SqliteCache)
+    entities = loaded["entities"]
+    rows = expected["entities"]
+    assert len(entities) == len(rows)
+    assert json.loads(json.dumps(list(entities), default=str)) == json.loads(json.dumps(rows, default=str))
+    assert list(loaded["blocks"]) == expected["blocks"]
+    assert loaded["layers"] == expected["layers"]
+
+    layer = rows[0]["layer"]
+    assert entities.value_counts("object_name") == {
+        name: sum(1 for e in rows if e["object_name"] == name) for name in {e["object_name"] for e in rows}
+    }
+    on_layer = entities.where("layer", layer)
+    assert [e["handle"] for e in on_layer] == [e["handle"] for e in rows if e["layer"] == layer]
+    assert [e["handle"] for e in entities.with_block("DOOR")] == [
+        e["handle"] for e in rows if e["type_properties"].get("block_name") == "DOOR"
+    ]
+    assert [e["handle"] for e in entities.compare("radius", ">", 2)] == [
+        e["handle"] for e in rows if e["type_properties"].get("radius", 0) > 2
+    ]
+
+    lengths = [e["length"] for e in rows if e["length"]]
+    total, count = entities.aggregate("length", "sum")
+    assert count == len(lengths) and abs(total - sum(lengths)) < 1e-6
+
+    inside = [e["handle"] for e in rows if e["bounding_box"]
+              and e["bounding_box"]["max"][0] >= 0 and e["bounding_box"]["min"][0] <= 50
+              and e["bounding_box"]["max"][1] >= 0 and e["bounding_box"]["min"][1] <= 50]
+    assert [e["handle"] for e in entities.in_bbox(0, 0, 50, 50)] == inside
+
+    assert entities.find(rows[3]["handle"]) == json.loads(json.dumps(rows[3], default=str))
+    DrawingCache.release_loaded_cache()
+
+
+def test_sqlite_skeleton_cache_loads_details(tmp_path, monkeypatch):
+    cache = _build_cache(tmp_path, monkeypatch, "sqlite", skeleton=True)
+    handle = DrawingCache.load_cache()["entities"].where("object_name", "AcDbCircle")[0]["handle"]
+
+    loaded = cache.ensure_details([handle])
+
+    assert "radius" in loaded[handle].type_properties
+    assert DrawingCache.load_cache()["entities"].find(handle)["details_loaded"] is True
+
+
+def test_sqlite_field_names_are_bound_as_parameters(tmp_path, monkeypatch):
+    _build_cache(tmp_path, monkeypatch, "sqlite")
+    entities = DrawingCache.load_cache()["entities"]
+    hostile = "radius') OR 1=1 OR json_extract(data, '$"
+
+    assert list(entities.compare(hostile, ">", 0)) == []
+    assert list(entities.compare("it's", "==", "x")) == []
+    assert list(entities.where(hostile, 1)) == []
+    assert entities.value_counts(hostile) == {None: len(entities)}
+    assert entities.aggregate(hostile, "sum") == (None, 0)
+    radius, count = entities.aggregate("radius", "max")
+    radii = [e["type_properties"]["radius"] for e in entities if "radius" in e["type_properties"]]
+    assert count == len(radii) and radius == max(radii)
+    DrawingCache.release_loaded_cache()